@@ -0,0 +1,339 @@
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+
+from app import metrics
+from app.model_backends import BackendUnavailableError
+from app.qwen_batching import QueueFullError
+
+log = logging.getLogger("neurons.router")
+
+# Router in front of the model backends (see model_backends.py): timeouts, retries, circuit breaking, fallbacks, hedging
+# - Every model call of the evaluate endpoints goes through BackendRouter.infer(backend, ...), streamed ones through
+#   BackendRouter.stream (timeouts and circuit breaking only).
+# - Timeout per attempt (ROUTER_TIMEOUT seconds, per backend with BACKEND_TIMEOUTS="Gwen-3b=180,..."). Timeouts and
+#   errors are retried ROUTER_RETRIES times with exponential backoff and full jitter (ROUTER_RETRY_BASE_MS), so
+#   retries of many requests don't hit a struggling backend in lockstep. A full local queue (QueueFullError) and a
+#   backend that can't load are not retried.
+# - Circuit breaker per backend: after CIRCUIT_FAILURE_THRESHOLD failed attempts in a row the backend is skipped for
+#   CIRCUIT_RESET_SECONDS, then a single trial call decides whether it is closed again.
+# - MODEL_FALLBACKS="ChatGPT-4o=Gwen-3b" lists the backends tried (in order) when a backend fails or its circuit is open.
+# - HEDGE=true: if the backend hasn't answered after its p95 latency (HEDGE_DEFAULT_DELAY_MS until HEDGE_MIN_SAMPLES
+#   calls were seen), the request is also sent to the first fallback and the first answer wins; the other is cancelled.
+# - The fallbacks get the same prompt and (preprocessed) image as the requested backend. infer returns the name of the
+#   backend that answered, so the caller can tell a fallback answer apart (e.g. to not cache it under the wrong model).
+# - Per-backend latency (p50/p95/p99) and counters at GET /backends/stats, call latency as a Prometheus histogram.
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+CALL_SECONDS = metrics.registry.register(metrics.Histogram(
+    "neurons_backend_call_seconds", "Latency of single model backend attempts.", ("backend", "outcome"),
+))
+
+class CircuitOpenError(BackendUnavailableError):
+    pass
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30.0, clock=time.monotonic):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        self.state = CLOSED
+        self.failures = 0  # in a row
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    # Whether a call may go ahead. Once reset_seconds have passed, one trial call is let through (half open).
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == OPEN and self.clock() - self.opened_at >= self.reset_seconds:
+                self.state, self._trial_running = HALF_OPEN, False
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    # The trial call ended without a verdict on the backend (cancelled, or the local queue was full): the next call
+    # may try again, the state doesn't change
+    def release(self):
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._trial_running = False
+
+    def record_success(self):
+        with self._lock:
+            self.state, self.failures, self._trial_running = CLOSED, 0, False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    log.warning("Circuit opened after %d failures", self.failures)
+                self.state, self.opened_at, self._trial_running = OPEN, self.clock(), False
+
+# Latency of the successful attempts (seconds, most recent ones) and counters of one backend
+class BackendStats:
+    COUNTERS = ("calls", "successes", "failures", "timeouts", "retries", "short_circuited", "hedged", "hedge_wins", "fallback_answers")
+
+    def __init__(self, max_samples: int = 1000):
+        self.latencies = deque(maxlen=max_samples)
+        self.counts = dict.fromkeys(self.COUNTERS, 0)
+        self._lock = threading.Lock()
+
+    def inc(self, counter: str):
+        with self._lock:
+            self.counts[counter] += 1
+
+    def observe(self, seconds: float):
+        with self._lock:
+            self.latencies.append(seconds)
+
+    def percentile(self, q: float) -> float | None:
+        with self._lock:
+            samples = sorted(self.latencies)
+        return samples[int(q / 100 * (len(samples) - 1))] if samples else None
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            samples = sorted(self.latencies)
+            counts = dict(self.counts)
+        def ms(q):
+            return round(1000 * samples[int(q / 100 * (len(samples) - 1))], 1) if samples else None
+        return {**counts, "samples": len(samples), "latency_ms": {"p50": ms(50), "p95": ms(95), "p99": ms(99)}}
+
+def _name_map(value: str) -> dict:
+    pairs = (item.split("=", 1) for item in value.split(",") if "=" in item)
+    return {name.strip(): setting.strip() for name, setting in pairs}
+
+class BackendRouter:
+    # get_backend(name) -> ModelBackend or None (looked up on every call, so the registry can be swapped)
+    def __init__(
+        self,
+        get_backend,
+        timeout: float = 60.0,
+        timeouts: dict | None = None,
+        retries: int = 1,
+        retry_base: float = 0.25,
+        failure_threshold: int = 5,
+        reset_seconds: float = 30.0,
+        fallbacks: dict | None = None,
+        hedge: bool = False,
+        hedge_default_delay: float = 5.0,
+        hedge_min_samples: int = 20,
+    ):
+        self.get_backend = get_backend
+        self.timeout = timeout
+        self.timeouts = timeouts or {}
+        self.retries = max(0, retries)
+        self.retry_base = retry_base
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.fallbacks = fallbacks or {}  # backend name -> list of fallback names
+        self.hedge = hedge
+        self.hedge_default_delay = hedge_default_delay
+        self.hedge_min_samples = hedge_min_samples
+        self._breakers = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    # Settings are read from the environment (see .env.example)
+    @classmethod
+    def from_env(cls, get_backend):
+        return cls(
+            get_backend,
+            timeout=float(os.getenv("ROUTER_TIMEOUT", "60")),
+            timeouts={name: float(v) for name, v in _name_map(os.getenv("BACKEND_TIMEOUTS", "")).items()},
+            retries=int(os.getenv("ROUTER_RETRIES", "1")),
+            retry_base=float(os.getenv("ROUTER_RETRY_BASE_MS", "250")) / 1000,
+            failure_threshold=int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5")),
+            reset_seconds=float(os.getenv("CIRCUIT_RESET_SECONDS", "30")),
+            fallbacks={name: [f.strip() for f in v.split("|") if f.strip()]
+                       for name, v in _name_map(os.getenv("MODEL_FALLBACKS", "")).items()},
+            hedge=os.getenv("HEDGE", "false").lower() in ("1", "true", "yes"),
+            hedge_default_delay=float(os.getenv("HEDGE_DEFAULT_DELAY_MS", "5000")) / 1000,
+            hedge_min_samples=int(os.getenv("HEDGE_MIN_SAMPLES", "20")),
+        )
+
+    def breaker(self, name: str) -> CircuitBreaker:
+        with self._lock:
+            if name not in self._breakers:
+                self._breakers[name] = CircuitBreaker(self.failure_threshold, self.reset_seconds)
+            return self._breakers[name]
+
+    def stats_for(self, name: str) -> BackendStats:
+        with self._lock:
+            return self._stats.setdefault(name, BackendStats())
+
+    # How long to wait for a backend before hedging: its p95 once there are enough samples
+    def hedge_delay(self, name: str) -> float:
+        stats = self.stats_for(name)
+        if len(stats.latencies) < self.hedge_min_samples:
+            return self.hedge_default_delay
+        return stats.percentile(95)
+
+    # Full jitter: anywhere between 0 and base * 2^attempt
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, self.retry_base * 2 ** attempt)
+
+    # One backend with timeout, retries and its circuit breaker
+    async def _call(self, backend, image_bytes, prompt, mime_type, structured):
+        stats, breaker = self.stats_for(backend.name), self.breaker(backend.name)
+        timeout = self.timeouts.get(backend.name, self.timeout)
+        for attempt in range(self.retries + 1):
+            if not breaker.allow():
+                stats.inc("short_circuited")
+                raise CircuitOpenError(f"Model backend {backend.name} is unavailable (circuit open)")
+            if attempt:
+                stats.inc("retries")
+            stats.inc("calls")
+            started = time.perf_counter()
+            recorded = False
+            try:
+                output = await asyncio.wait_for(
+                    backend.infer(image_bytes, prompt, mime_type, structured=structured), timeout,
+                )
+            except QueueFullError:
+                # Busy, not broken: no retry and no strike against the circuit, but a fallback may take it
+                raise
+            except BackendUnavailableError:
+                stats.inc("failures")
+                breaker.record_failure()
+                recorded = True
+                raise
+            except asyncio.TimeoutError:
+                stats.inc("timeouts")
+                breaker.record_failure()
+                recorded = True
+                CALL_SECONDS.observe(time.perf_counter() - started, backend=backend.name, outcome="timeout")
+                error = BackendUnavailableError(f"Model backend {backend.name} timed out after {timeout:g}s")
+            except Exception as e:
+                stats.inc("failures")
+                breaker.record_failure()
+                recorded = True
+                CALL_SECONDS.observe(time.perf_counter() - started, backend=backend.name, outcome="error")
+                log.warning("Model backend %s failed: %s", backend.name, e)
+                error = e
+            else:
+                seconds = time.perf_counter() - started
+                stats.inc("successes")
+                stats.observe(seconds)
+                breaker.record_success()
+                recorded = True
+                CALL_SECONDS.observe(seconds, backend=backend.name, outcome="ok")
+                return output
+            finally:
+                # A full queue or a cancelled call (the loser of a hedged pair, a client that went away) says nothing
+                # about the backend, but must not keep a half open circuit's trial slot taken
+                if not recorded:
+                    breaker.release()
+            if attempt < self.retries:
+                await asyncio.sleep(self._backoff(attempt))
+        raise error
+
+    # Returns (model output, name of the backend that answered)
+    async def infer(self, backend, image_bytes: bytes, prompt: str, mime_type: str = "image/png", structured: bool = False):
+        chain = [backend] + [b for b in map(self.get_backend, self.fallbacks.get(backend.name, [])) if b is not None]
+        pending, running = list(chain), {}
+        hedged, last_error = False, None
+
+        def start():
+            candidate = pending.pop(0)
+            running[asyncio.ensure_future(self._call(candidate, image_bytes, prompt, mime_type, structured))] = candidate
+
+        start()
+        try:
+            while running:
+                # Only the first backend gets hedged, and only once
+                delay = self.hedge_delay(backend.name) if self.hedge and pending and not hedged and len(running) == 1 else None
+                done, _ = await asyncio.wait(running, timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    self.stats_for(backend.name).inc("hedged")
+                    start()
+                    continue
+                for task in done:
+                    answered_by = running.pop(task)
+                    if task.exception() is None:
+                        if answered_by is not backend:
+                            self.stats_for(answered_by.name).inc("hedge_wins" if hedged else "fallback_answers")
+                        return task.result(), answered_by.name
+                    last_error = task.exception()
+                if not running and pending:
+                    start()
+        finally:
+            for task in running:
+                task.cancel()  # the slower of a hedged pair
+
+        if isinstance(last_error, (QueueFullError, BackendUnavailableError)):
+            raise last_error
+        # Failed after retries (and fallbacks): the backend is unavailable for this request (HTTP 503, not 500)
+        raise BackendUnavailableError(str(last_error)) from last_error
+
+    # Streams the chunks of one backend (no retries or fallbacks: chunks may already have gone to the client). The
+    # backend's timeout applies to every chunk and to the whole stream, the outcome counts for its circuit breaker.
+    async def stream(self, backend, image_bytes: bytes, prompt: str, mime_type: str = "image/png"):
+        stats, breaker = self.stats_for(backend.name), self.breaker(backend.name)
+        timeout = self.timeouts.get(backend.name, self.timeout)
+        if not breaker.allow():
+            stats.inc("short_circuited")
+            raise CircuitOpenError(f"Model backend {backend.name} is unavailable (circuit open)")
+        stats.inc("calls")
+        started = time.perf_counter()
+        deadline = time.monotonic() + timeout
+        chunks = backend.infer_stream(image_bytes, prompt, mime_type)
+        recorded = False
+        try:
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), min(timeout, deadline - time.monotonic()))
+                except StopAsyncIteration:
+                    break
+                yield chunk
+        except QueueFullError:
+            raise
+        except BackendUnavailableError:
+            stats.inc("failures")
+            breaker.record_failure()
+            recorded = True
+            raise
+        except asyncio.TimeoutError:
+            stats.inc("timeouts")
+            breaker.record_failure()
+            recorded = True
+            CALL_SECONDS.observe(time.perf_counter() - started, backend=backend.name, outcome="timeout")
+            raise BackendUnavailableError(f"Model backend {backend.name} timed out after {timeout:g}s") from None
+        except Exception as e:
+            stats.inc("failures")
+            breaker.record_failure()
+            recorded = True
+            CALL_SECONDS.observe(time.perf_counter() - started, backend=backend.name, outcome="error")
+            log.warning("Model backend %s failed: %s", backend.name, e)
+            raise
+        else:
+            seconds = time.perf_counter() - started
+            stats.inc("successes")
+            stats.observe(seconds)
+            breaker.record_success()
+            recorded = True
+            CALL_SECONDS.observe(seconds, backend=backend.name, outcome="ok")
+        finally:
+            # A full queue or a client that went away mid-stream says nothing about the backend
+            if not recorded:
+                breaker.release()
+            await chunks.aclose()
+
+    def stats(self) -> dict:
+        with self._lock:
+            names = sorted(set(self._stats) | set(self._breakers))
+        return {
+            name: {**self.stats_for(name).snapshot(), "circuit": self.breaker(name).state}
+            for name in names
+        }
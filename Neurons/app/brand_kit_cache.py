@@ -0,0 +1,270 @@
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+
+from app import metrics
+from app.executors import run_pdf
+from app.extract_pdf import INDEX_VERSION, extract_brand_compliance_indexed
+
+# Content-addressed cache for brand kits
+# - The same handful of brand kits get uploaded over and over again (together with different images), so the results
+#   of extract_brand_compliance (and the prompts built from them) are cached by a hash of the PDF bytes.
+# - Two tiers: an in-memory LRU (bounded by number of entries and a TTL) and an optional on-disk tier
+#   (one JSON file per entry) which survives restarts.
+# - Bump CACHE_VERSION when the extractors/prompt builders change, so old entries are not served anymore.
+# - The section index of each PDF (which pages hold which section, see extract_pdf.py) is cached next to the
+#   requirements. It is versioned separately (INDEX_VERSION), so after a CACHE_VERSION bump a known PDF is
+#   re-extracted from its relevant pages only. Index lookups are not counted in the hit/miss stats.
+# - `pdf` is the PDF's bytes or a file path (see uploads.py). A path keeps big PDFs out of memory, and only the path is
+#   sent to the process pool. It must exist until the call returns.
+
+CACHE_VERSION = "1"
+
+# A second name for the file at path, next to it (a hard link, a copy where links aren't supported). The file's
+# content stays until both names are removed.
+def _own_link(path) -> str:
+    link = f"{path}.{uuid.uuid4().hex}.extract"
+    try:
+        os.link(path, link)
+    except OSError:
+        shutil.copyfile(path, link)
+    return link
+
+# SHA-256 of the PDF, given as bytes or as a file path (read in chunks)
+def pdf_hash(pdf) -> str:
+    if isinstance(pdf, (str, os.PathLike)):
+        with open(pdf, "rb") as f:
+            return hashlib.file_digest(f, "sha256").hexdigest()
+    return hashlib.sha256(pdf).hexdigest()
+
+# Small in-memory LRU with a max number of entries and a time-to-live per entry
+class LRUCache:
+    def __init__(self, max_entries: int = 128, ttl_seconds: float | None = 3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._data = OrderedDict()  # key -> (stored_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            stored_at, value = item
+            if self.ttl_seconds is not None and time.monotonic() - stored_at > self.ttl_seconds:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            item = self._data.pop(key, None)
+            return None if item is None else item[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+class BrandKitCache:
+    def __init__(self, max_entries: int = 128, ttl_seconds: float | None = 3600, disk_dir: str | None = None):
+        self.memory = LRUCache(max_entries, ttl_seconds)
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        if self.disk_dir is not None:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._inflight = {}  # key -> task extracting that brand kit right now (async API only)
+
+    # Settings are read from the environment (see .env.example)
+    @classmethod
+    def from_env(cls):
+        ttl = float(os.getenv("BRAND_KIT_CACHE_TTL", "3600"))
+        return cls(
+            max_entries=int(os.getenv("BRAND_KIT_CACHE_SIZE", "128")),
+            ttl_seconds=ttl if ttl > 0 else None,
+            disk_dir=os.getenv("BRAND_KIT_CACHE_DIR") or None,
+        )
+
+    @staticmethod
+    def requirements_key(digest: str) -> str:
+        return f"v{CACHE_VERSION}-{digest}-requirements"
+
+    @staticmethod
+    def prompt_key(digest: str, prompt_name: str) -> str:
+        return f"v{CACHE_VERSION}-{digest}-prompt-{prompt_name}"
+
+    @staticmethod
+    def index_key(digest: str) -> str:
+        return f"index{INDEX_VERSION}-{digest}"
+
+    def _disk_path(self, key: str) -> Path:
+        return self.disk_dir / f"{key}.json"
+
+    # Returns (value, tier) with tier "memory", "disk" or None on a miss. Disk hits are promoted to memory.
+    def _lookup(self, key: str):
+        value = self.memory.get(key)
+        if value is not None:
+            return value, "memory"
+
+        if self.disk_dir is not None:
+            path = self._disk_path(key)
+            try:
+                value = json.loads(path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                value = None
+            if value is not None:
+                self.memory.put(key, value)
+                return value, "disk"
+        return None, None
+
+    # Looks in memory first, then on disk. Returns None on a miss.
+    def get(self, key: str):
+        value, tier = self._lookup(key)
+        with self._lock:
+            if tier == "memory":
+                self.hits += 1
+            elif tier == "disk":
+                self.disk_hits += 1
+            else:
+                self.misses += 1
+        return value
+
+    # The cached section index of a PDF (or None)
+    def section_index(self, digest: str) -> dict | None:
+        return self._lookup(self.index_key(digest))[0]
+
+    def put(self, key: str, value):
+        self.memory.put(key, value)
+        if self.disk_dir is not None:
+            # Write to a temp file first, so a crash never leaves a half-written entry behind
+            # (unique per write: threads of one process may write the same key at the same time)
+            path = self._disk_path(key)
+            tmp = path.with_suffix(f".{os.getpid()}.{uuid.uuid4().hex}.tmp")
+            tmp.write_text(json.dumps(value), encoding="utf-8")
+            os.replace(tmp, path)
+
+    # Returns the extracted requirements for the PDF, only running PyMuPDF on a miss
+    def get_or_extract(self, pdf, digest: str | None = None) -> dict:
+        digest = digest or pdf_hash(pdf)
+        key = self.requirements_key(digest)
+        brand_data = self.get(key)
+        if brand_data is None:
+            with metrics.span("extract"):
+                brand_data, index = extract_brand_compliance_indexed(pdf, self.section_index(digest))
+            self._record_timings(index)
+            self.put(key, brand_data)
+            self.put(self.index_key(digest), index)
+        return brand_data
+
+    # Returns the prompt built by prompt_builder for the PDF. prompt_name separates prompts of different builders.
+    def get_or_build_prompt(self, pdf, prompt_builder, prompt_name: str, digest: str | None = None) -> str:
+        digest = digest or pdf_hash(pdf)
+        key = self.prompt_key(digest, prompt_name)
+        prompt = self.get(key)
+        if prompt is None:
+            brand_data = self.get_or_extract(pdf, digest)
+            with metrics.span("prompt_build", prompt=prompt_name):
+                prompt = prompt_builder(brand_data)
+            self.put(key, prompt)
+        return prompt
+
+    # Async variants used by the API
+    # - The extraction runs in the PDF process pool (see executors.py), so the event loop is never blocked by PyMuPDF.
+    # - Concurrent requests for the same (not yet cached) brand kit share a single extraction.
+    # - The shared extraction outlives the request that started it, so it gets its own link to a PDF given as a path
+    #   (the request's temp file is removed as soon as that request ends, e.g. when its client disconnects).
+    async def aget_or_extract(self, pdf, digest: str | None = None) -> dict:
+        digest = digest or pdf_hash(pdf)
+        key = self.requirements_key(digest)
+        brand_data = self.get(key)
+        if brand_data is not None:
+            return brand_data
+
+        task = self._inflight.get(key)
+        if task is None:
+            owned = _own_link(pdf) if isinstance(pdf, (str, os.PathLike)) else None
+            task = asyncio.ensure_future(self._extract_and_store(key, owned or pdf, digest, owned))
+            self._inflight[key] = task
+        # shield: one cancelled request must not cancel the extraction the other requests are waiting for
+        return await asyncio.shield(task)
+
+    async def _extract_and_store(self, key: str, pdf, digest: str, owned: str | None = None) -> dict:
+        try:
+            # Includes the hand-off to the process pool, the stages inside are recorded separately
+            with metrics.span("extract"):
+                brand_data, index = await run_pdf(extract_brand_compliance_indexed, pdf, self.section_index(digest))
+            self._record_timings(index)
+            self.put(key, brand_data)
+            self.put(self.index_key(digest), index)
+            return brand_data
+        finally:
+            self._inflight.pop(key, None)
+            if owned is not None:
+                os.unlink(owned)
+
+    # Extracts a brand kit being registered (previous_index None) or a new version of one, reusing the per-page results
+    # in the previous version's section index for the pages that didn't change (see extract_pdf.py). The section index
+    # keeps the page hashes and results for the next version. Returns (requirements, section index), cached like the
+    # above. An index cached by the evaluate endpoints has no page results, so the PDF is extracted once more.
+    async def aextract_version(self, pdf, previous_index: dict | None, digest: str | None = None):
+        digest = digest or pdf_hash(pdf)
+        key = self.requirements_key(digest)
+        brand_data, index = self.get(key), self.section_index(digest)
+        if brand_data is not None and index is not None and "page_results" in index:
+            return brand_data, index
+
+        with metrics.span("extract"):
+            brand_data, index = await run_pdf(extract_brand_compliance_indexed, pdf, None, None, previous_index, True)
+        self._record_timings(index)
+        self.put(key, brand_data)
+        self.put(self.index_key(digest), index)
+        return brand_data, index
+
+    async def aget_or_build_prompt(self, pdf, prompt_builder, prompt_name: str, digest: str | None = None) -> str:
+        digest = digest or pdf_hash(pdf)
+        key = self.prompt_key(digest, prompt_name)
+        prompt = self.get(key)
+        if prompt is None:
+            brand_data = await self.aget_or_extract(pdf, digest)
+            with metrics.span("prompt_build", prompt=prompt_name):
+                prompt = prompt_builder(brand_data)
+            self.put(key, prompt)
+        return prompt
+
+    # Extraction timings measured inside extract_brand_compliance_indexed (possibly in a worker process)
+    @staticmethod
+    def _record_timings(index: dict):
+        for stage, ms in (index.get("timings_ms") or {}).items():
+            metrics.observe_stage(stage, ms / 1000)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "memory_entries": len(self.memory),
+                "disk_enabled": self.disk_dir is not None,
+            }
@@ -0,0 +1,163 @@
+import json
+import os
+import sqlite3
+import time
+from contextlib import closing
+from pathlib import Path
+
+from app.brand_kit_cache import pdf_hash
+from app import compliance_prompt_gpt, compliance_prompt_Qwen
+from app.compliance_prompt_gpt import build_compliance_prompt
+from app.compliance_prompt_Qwen import build_compliance_prompt_qwen
+
+# Registry of uploaded brand kits, stored in a local SQLite file (no external services needed)
+# - A brand kit PDF is uploaded once, and gets a stable id (the SHA-256 hash of the PDF bytes, so uploading the
+#   same PDF twice gives the same id).
+# - The extracted requirements and the pre-rendered prompts are stored, so evaluations only need the id + the image.
+# - Versions: a revised PDF can be registered as a new version of a kit (parent_id). It gets its own id, and the
+#   section index of the extraction (page hashes + per-page results, see extract_pdf.py) is stored with every kit, so
+#   the next version only re-extracts the pages that changed. "changes" lists the sections whose requirements differ
+#   from the parent's and the pages that had to be read again.
+# - The template version each prompt was rendered with is stored next to it (prompt_versions), so a stored prompt whose
+#   template has changed since is rebuilt from the requirements instead of being used.
+
+DEFAULT_DB_PATH = Path(__file__).resolve().parent.parent / "data" / "brand_kits.sqlite3"
+
+# The prompts rendered for each brand kit (name -> prompt builder)
+PROMPT_BUILDERS = {
+    "gpt": build_compliance_prompt,
+    "qwen": build_compliance_prompt_qwen,
+}
+PROMPT_VERSIONS = {
+    "gpt": compliance_prompt_gpt.PROMPT_VERSION,
+    "qwen": compliance_prompt_Qwen.PROMPT_VERSION,
+}
+
+VERSION_COLUMNS = {
+    "parent_id": "TEXT",
+    "version": "INTEGER NOT NULL DEFAULT 1",
+    "changes": "TEXT",
+    "section_index": "TEXT",
+    "prompt_versions": "TEXT",
+}
+
+_COLUMNS = "id, filename, created_at, requirements, prompts, parent_id, version, changes, prompt_versions"
+
+# Sections whose requirements differ between two versions
+def changed_sections(old: dict, new: dict) -> list[str]:
+    return [name for name in {**old, **new} if old.get(name) != new.get(name)]
+
+class BrandKitStore:
+    def __init__(self, db_path: str | Path = DEFAULT_DB_PATH):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS brand_kits (
+                    id TEXT PRIMARY KEY,
+                    filename TEXT,
+                    created_at REAL NOT NULL,
+                    requirements TEXT NOT NULL,
+                    prompts TEXT NOT NULL
+                )
+                """
+            )
+            # Columns added later (stores created before have none of them)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(brand_kits)")}
+            for column, definition in VERSION_COLUMNS.items():
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE brand_kits ADD COLUMN {column} {definition}")
+
+    @classmethod
+    def from_env(cls):
+        return cls(os.getenv("BRAND_KIT_DB") or DEFAULT_DB_PATH)
+
+    # A new connection per call keeps the store safe to use from the threadpool
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    @staticmethod
+    def _row_to_dict(row):
+        brand_kit_id, filename, created_at, requirements, prompts, parent_id, version, changes, prompt_versions = row
+        return {
+            "brand_kit_id": brand_kit_id,
+            "filename": filename,
+            "created_at": created_at,
+            "requirements": json.loads(requirements),
+            "prompts": json.loads(prompts),
+            "parent_id": parent_id,
+            "version": version,
+            "changes": json.loads(changes) if changes else None,
+            "prompt_versions": json.loads(prompt_versions) if prompt_versions else {},
+        }
+
+    # Stores the brand kit (extract_fn is used to extract the requirements, e.g. the cached extraction)
+    # and returns the stored record. Re-uploading a known PDF just returns the existing record.
+    # pdf is the PDF's bytes or a file path; brand_kit_id can be passed if the hash is already known.
+    # section_index: the index of the extraction (kept for the next version), parent_id: the kit this is a version of.
+    def add(
+        self,
+        pdf,
+        filename: str | None,
+        extract_fn,
+        brand_kit_id: str | None = None,
+        section_index: dict | None = None,
+        parent_id: str | None = None,
+    ) -> dict:
+        brand_kit_id = brand_kit_id or pdf_hash(pdf)
+        existing = self.get(brand_kit_id)
+        if existing is not None:
+            return existing
+
+        requirements = extract_fn(pdf)
+        prompts = {name: builder(requirements) for name, builder in PROMPT_BUILDERS.items()}
+        parent = self.get(parent_id) if parent_id is not None else None
+        version, changes = 1, None
+        if parent is not None:
+            version = parent["version"] + 1
+            changes = {
+                "sections": changed_sections(parent["requirements"], requirements),
+                "pages_read": (section_index or {}).get("pages_read"),  # pages whose text was read again
+                "pages_reused": len((section_index or {}).get("pages_reused", [])),
+            }
+
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO brand_kits (id, filename, created_at, requirements, prompts, parent_id, version, "
+                "changes, section_index, prompt_versions) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    brand_kit_id, filename, time.time(), json.dumps(requirements), json.dumps(prompts),
+                    parent["brand_kit_id"] if parent else None, version,
+                    json.dumps(changes) if changes is not None else None,
+                    json.dumps(section_index) if section_index is not None else None,
+                    json.dumps({name: PROMPT_VERSIONS[name] for name in prompts}),
+                ),
+            )
+        return self.get(brand_kit_id)
+
+    def get(self, brand_kit_id: str) -> dict | None:
+        with closing(self._connect()) as conn:
+            row = conn.execute(f"SELECT {_COLUMNS} FROM brand_kits WHERE id = ?", (brand_kit_id,)).fetchone()
+        return None if row is None else self._row_to_dict(row)
+
+    # The section index stored with the kit (None for kits registered before versions existed)
+    def section_index(self, brand_kit_id: str) -> dict | None:
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT section_index FROM brand_kits WHERE id = ?", (brand_kit_id,)).fetchone()
+        return json.loads(row[0]) if row and row[0] else None
+
+    def list(self) -> list[dict]:
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT id, filename, created_at, parent_id, version FROM brand_kits ORDER BY created_at"
+            ).fetchall()
+        return [
+            {"brand_kit_id": r[0], "filename": r[1], "created_at": r[2], "parent_id": r[3], "version": r[4]}
+            for r in rows
+        ]
+
+    def delete(self, brand_kit_id: str) -> bool:
+        with closing(self._connect()) as conn, conn:
+            cur = conn.execute("DELETE FROM brand_kits WHERE id = ?", (brand_kit_id,))
+        return cur.rowcount > 0
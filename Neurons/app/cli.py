@@ -0,0 +1,351 @@
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+
+from app import creatives, executors, verdicts
+from app.backend_router import BackendRouter
+from app.brand_kit_cache import BrandKitCache, pdf_hash
+from app.image_preprocessing import preprocess_image
+from app.model_backends import registry as model_registry
+from app.result_cache import EvaluationResultCache, prompt_hash, result_key
+
+log = logging.getLogger("neurons.cli")
+
+# Offline brand compliance audits of whole directory trees, without the web stack
+#   python -m app.cli audit Neurons_brand_kit.pdf creatives/ --out audit.jsonl
+#   python -m app.cli audit Neurons_brand_kit.pdf creatives/ --out audit.csv --resume
+# - The brand kit is extracted once (brand_kit_cache.py, so BRAND_KIT_CACHE_DIR is reused across runs) and the prompt
+#   is built with the model backend's prompt builder.
+# - Every image, multi-frame image and PDF creative under the directory (see creatives.py) is read, split into pages
+#   and preprocessed in the PDF process pool (--workers, default PDF_WORKERS). Only the preprocessed pages come back.
+# - Model calls go through the backend router (timeouts, retries, fallbacks, see backend_router.py), at most
+#   --concurrency at a time, and through the result cache: with RESULT_CACHE_DB set, a nightly run only calls the model
+#   for new or changed assets (and for all of them after the brand kit changed a section in the prompt).
+# - One record per asset is streamed to --out as it completes (JSONL, or CSV with one column per criterion).
+# - Progress is checkpointed (--checkpoint, default <out>.checkpoint): one line per finished asset, flushed right away.
+#   --resume skips those and appends to --out. Failed assets are not checkpointed, so a resumed run retries them.
+#   Before appending, --out is cut down to the records of the checkpointed assets (one per path): error records and
+#   records written just before a crash (not checkpointed yet) are dropped, as those assets are evaluated again.
+#   The checkpoint is tied to the brand kit, model and prompt; resuming with other ones is refused.
+
+ASSET_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif", ".webp", ".bmp", ".tif", ".tiff", ".pdf")
+CSV_COLUMNS = ["path", "status", "pages", "total", "max_total", *verdicts.CRITERIA, "cached", "model_used", "latency_ms", "error"]
+FSYNC_EVERY = 50  # checkpoint lines between fsyncs
+
+# Paths of the assets under root (relative, sorted, so every run walks the tree in the same order)
+def find_assets(root: Path, extensions=ASSET_EXTENSIONS) -> list[str]:
+    found = []
+    for directory, subdirs, files in os.walk(root):
+        subdirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(extensions) and not name.startswith("."):
+                found.append(Path(directory, name).relative_to(root).as_posix())
+    return found
+
+# Runs in the PDF process pool: reads one asset, splits it into pages and preprocesses them for the backend.
+# Returns [(page number, PreparedImage)].
+def prepare_asset(path: str, profile: str, dpi: int, max_pages: int) -> list:
+    with open(path, "rb") as f:
+        data = f.read()
+    if creatives.is_pdf(data[:1024]):
+        pages = [(page.number, page.data) for page in creatives.render_pdf_pages(data, dpi, max_pages)]
+    else:
+        frames = creatives.split_frames(data, max_pages)
+        pages = [(1, data)] if frames is None else [(page.number, page.data) for page in frames]
+    return [(number, preprocess_image(page_data, profile)) for number, page_data in pages]
+
+class Checkpoint:
+    def __init__(self, path: Path, meta: dict):
+        self.path = path
+        self.meta = meta
+        self._file = None
+        self._unsynced = 0
+
+    # Assets finished by an earlier run (raises ValueError if it was a run with another brand kit/model/prompt)
+    def load(self) -> set:
+        if not self.path.exists():
+            return set()
+        done = set()
+        with open(self.path, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        if not lines:
+            return done
+        meta = json.loads(lines[0])
+        if meta != self.meta:
+            raise ValueError(f"{self.path} belongs to another audit ({meta}), not resuming")
+        for line in lines[1:]:
+            try:
+                done.add(json.loads(line)["path"])
+            except (ValueError, KeyError):
+                pass  # a line cut off by a crash
+        return done
+
+    def open(self, resume: bool):
+        fresh = not resume or not self.path.exists() or self.path.stat().st_size == 0
+        self._file = open(self.path, "w" if fresh else "a", encoding="utf-8")
+        if fresh:
+            self._file.write(json.dumps(self.meta) + "\n")
+            self._file.flush()
+
+    def mark(self, path: str):
+        self._file.write(json.dumps({"path": path}) + "\n")
+        self._file.flush()
+        self._unsynced += 1
+        if self._unsynced >= FSYNC_EVERY:
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+
+    def close(self):
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+
+# Keeps the first record of every path in done (the output of an interrupted run), so each path is in it once
+def compact_output(path: Path, fmt: str, done: set):
+    if not path.exists():
+        return
+    with open(path, encoding="utf-8", newline="") as f:
+        if fmt == "csv":
+            rows = list(csv.DictReader(f))
+        else:
+            rows = []
+            for line in f:
+                try:
+                    rows.append(json.loads(line))
+                except ValueError:
+                    pass  # a line cut off by a crash
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8", newline="") as f:
+        if fmt == "csv":
+            writer = csv.DictWriter(f, fieldnames=CSV_COLUMNS, extrasaction="ignore")
+            writer.writeheader()
+        seen = set()
+        for row in rows:
+            if row.get("path") in done and row["path"] not in seen:
+                seen.add(row["path"])
+                if fmt == "csv":
+                    writer.writerow(row)
+                else:
+                    f.write(json.dumps(row) + "\n")
+    os.replace(tmp, path)
+
+# Streams the records to a JSONL or CSV file, flushing after every record
+class RecordWriter:
+    def __init__(self, path: Path, fmt: str, append: bool):
+        self.fmt = fmt
+        write_header = not (append and path.exists() and path.stat().st_size > 0)
+        self._file = open(path, "a" if append else "w", encoding="utf-8", newline="")
+        if fmt == "csv":
+            self._csv = csv.DictWriter(self._file, fieldnames=CSV_COLUMNS, extrasaction="ignore")
+            if write_header:
+                self._csv.writeheader()
+
+    def write(self, record: dict):
+        if self.fmt == "csv":
+            verdict = record.get("verdict") or {}
+            criteria = verdict.get("criteria") or {}
+            self._csv.writerow({
+                **record,
+                "pages": len(record.get("pages") or []),
+                "total": verdict.get("total"),
+                "max_total": verdict.get("max_total"),
+                **{key: (criteria.get(key) or {}).get("passed") for key in verdicts.CRITERIA},
+            })
+        else:
+            self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+class Audit:
+    def __init__(self, args, registry=None):
+        self.args = args
+        registry = registry or model_registry
+        self.backend = registry.get(args.model)
+        if self.backend is None:
+            raise ValueError(f"Unknown model: {args.model} (known: {', '.join(registry.names())})")
+        self.router = BackendRouter.from_env(registry.get)
+        self.result_cache = EvaluationResultCache.from_env()
+        self.brand_kit_cache = BrandKitCache.from_env()
+        self.model_slots = asyncio.Semaphore(args.concurrency)
+        self.stats = {"assets": 0, "skipped": 0, "evaluated": 0, "failed": 0, "model_calls": 0, "pages": 0}
+        self.parsed = []  # verdict of every evaluated page, for the summary
+
+    async def _prompt(self, brand_kit: Path):
+        requirements = await self.brand_kit_cache.aget_or_extract(str(brand_kit))
+        if self.args.structured:
+            return self.backend.prompt_builder(requirements, structured=True), verdicts.PROMPT_VARIANT
+        return self.backend.prompt_builder(requirements), ""
+
+    # One page through the result cache and the router. Returns (model output, cached, model used).
+    async def _evaluate_page(self, image, prompt, prompt_digest, variant):
+        backend = self.backend
+        key = result_key(image.sha256, prompt_digest, backend.name, backend.prompt_version + variant)
+        if self.args.use_cache:
+            cached = await self.result_cache.aget(key)
+            if cached is not None:
+                return cached["model_output"], True, backend.name
+        async with self.model_slots:
+            self.stats["model_calls"] += 1
+            output, model_used = await self.router.infer(backend, image.data, prompt, image.mime_type, self.args.structured)
+        if model_used == backend.name:
+            await self.result_cache.aput(key, {"model_output": output}, self.brand_digest)
+        return output, False, model_used
+
+    async def _evaluate_asset(self, path: str, prompt, prompt_digest, variant) -> dict:
+        started = time.perf_counter()
+        pages = await executors.run_pdf(
+            prepare_asset, str(self.root / path), self.backend.image_profile, self.args.dpi, self.args.max_pages,
+        )
+        # Identical pages of the asset are evaluated once
+        unique = {}
+        for number, image in pages:
+            unique.setdefault(image.sha256, (number, image))
+        outputs = dict(zip(unique, await asyncio.gather(*(
+            self._evaluate_page(image, prompt, prompt_digest, variant) for _, image in unique.values()
+        ))))
+
+        results, page_verdicts = [], {}
+        for number, image in pages:
+            output, cached, model_used = outputs[image.sha256]
+            page_verdicts[number] = verdict = verdicts.parse_verdict(output)
+            result = {"page": number, "model_output": output, "verdict": verdict.to_dict() if verdict else None,
+                      "cached": cached, "model_used": model_used}
+            if unique[image.sha256][0] != number:
+                result["duplicate_of"] = unique[image.sha256][0]
+            results.append(result)
+
+        if len(results) == 1:
+            verdict = results[0]["verdict"]
+            self.parsed.append(page_verdicts[results[0]["page"]])
+        else:
+            document = creatives.document_verdict(page_verdicts)
+            verdict = document["verdict"]
+            self.parsed.extend(page_verdicts.values())
+        self.stats["pages"] += len(results)
+        return {
+            "path": path,
+            "status": "ok",
+            "verdict": verdict,  # multi-page assets: a criterion passes only if it passes on every page
+            "pages": results,
+            "cached": all(r["cached"] for r in results),
+            "model_used": ",".join(sorted({r["model_used"] for r in results})),
+            "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+
+    async def run(self, brand_kit: Path, root: Path, out: Path, checkpoint_path: Path) -> dict:
+        self.root = root
+        self.brand_digest = pdf_hash(str(brand_kit))
+        prompt, variant = await self._prompt(brand_kit)
+        prompt_digest = prompt_hash(prompt)
+
+        checkpoint = Checkpoint(checkpoint_path, {
+            "brand_kit": self.brand_digest,
+            "model": self.backend.name,
+            "prompt": prompt_digest,
+            "root": str(root.resolve()),
+        })
+        done = checkpoint.load() if self.args.resume else set()
+        assets = find_assets(root)
+        self.stats["assets"] = len(assets)
+        if self.args.resume:
+            compact_output(out, self.args.format, done)
+        writer = RecordWriter(out, self.args.format, append=self.args.resume)
+        checkpoint.open(self.args.resume)
+
+        started = time.perf_counter()
+        in_flight = asyncio.Semaphore(self.args.concurrency * 2)  # assets being prepared or evaluated
+
+        async def one(path):
+            try:
+                record = await self._evaluate_asset(path, prompt, prompt_digest, variant)
+            except Exception as e:
+                log.warning("Asset %s failed: %s", path, e)
+                record = {"path": path, "status": "error", "error": str(e) or type(e).__name__}
+            finally:
+                in_flight.release()
+            writer.write(record)
+            if record["status"] == "ok":
+                checkpoint.mark(path)
+                self.stats["evaluated"] += 1
+            else:
+                self.stats["failed"] += 1
+            finished = self.stats["evaluated"] + self.stats["failed"]
+            if finished % self.args.progress_every == 0:
+                rate = finished / (time.perf_counter() - started)
+                log.info("%d/%d assets (%.1f/s)", finished, len(assets) - self.stats["skipped"], rate)
+
+        tasks = []
+        try:
+            for path in assets:
+                if path in done:
+                    self.stats["skipped"] += 1
+                    continue
+                await in_flight.acquire()
+                tasks.append(asyncio.create_task(one(path)))
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()  # interrupted: the checkpoint has everything finished so far
+            writer.close()
+            checkpoint.close()
+
+        return {
+            **self.stats,
+            "elapsed_s": round(time.perf_counter() - started, 1),
+            "verdicts": verdicts.aggregate(self.parsed),  # average total and pass rate per criterion over all pages
+            "out": str(out),
+        }
+
+def _parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description="Offline brand compliance audits")
+    commands = parser.add_subparsers(dest="command", required=True)
+    audit = commands.add_parser("audit", help="Evaluate every creative under a directory against a brand kit")
+    audit.add_argument("brand_kit", type=Path, help="brand kit PDF")
+    audit.add_argument("root", type=Path, help="directory of creatives (searched recursively)")
+    audit.add_argument("--out", type=Path, required=True, help="output file (.jsonl or .csv)")
+    audit.add_argument("--format", choices=("jsonl", "csv"), default=None, help="default: from the --out extension")
+    audit.add_argument("--model", default="ChatGPT-4o", help="model backend (ChatGPT-4o, Gwen-3b)")
+    audit.add_argument("--concurrency", type=int, default=8, help="model calls in flight")
+    audit.add_argument("--workers", type=int, default=None, help="processes for reading/preprocessing (PDF_WORKERS)")
+    audit.add_argument("--checkpoint", type=Path, default=None, help="default: <out>.checkpoint")
+    audit.add_argument("--resume", action="store_true", help="skip the assets in the checkpoint, append to --out")
+    audit.add_argument("--structured", action="store_true", help="ask for JSON verdicts (see verdicts.py)")
+    audit.add_argument("--no-cache", dest="use_cache", action="store_false", help="always call the model")
+    audit.add_argument("--dpi", type=int, default=creatives.CREATIVE_DPI, help="render resolution of PDF creatives")
+    audit.add_argument("--max-pages", type=int, default=creatives.CREATIVE_MAX_PAGES)
+    audit.add_argument("--progress-every", type=int, default=100, help="log progress every N assets")
+    return parser
+
+def main(argv=None) -> int:
+    args = _parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s", stream=sys.stderr)
+    logging.getLogger("httpx").setLevel(logging.WARNING)  # no log line per model call
+    args.format = args.format or ("csv" if args.out.suffix.lower() == ".csv" else "jsonl")
+    args.concurrency = max(1, args.concurrency)
+    args.progress_every = max(1, args.progress_every)
+    args.dpi = creatives.clamp_dpi(args.dpi)
+    if args.workers is not None:
+        os.environ["PDF_WORKERS"] = str(args.workers)  # read when the pool is created (see executors.py)
+    checkpoint = args.checkpoint or args.out.with_name(args.out.name + ".checkpoint")
+
+    try:
+        summary = asyncio.run(Audit(args).run(args.brand_kit, args.root, args.out, checkpoint))
+    except ValueError as e:
+        log.error("%s", e)
+        return 2
+    finally:
+        executors.shutdown()
+    print(json.dumps(summary, indent=2))
+    return 0 if summary["failed"] == 0 else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,241 @@
+import os
+import re
+import time
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+# Pixel-level colour checks for the "Colour Palette" and "Logo Colour" criteria
+# - The image is sampled down to ANALYSIS_MAX_SIDE (nearest neighbour, so no blended colours are invented) and
+#   quantized to 5 bits per channel. The histogram of the quantized colours is what gets compared, so the cost depends
+#   on the number of distinct colours (a few thousand at most), not on the image size. The analysis itself takes a few
+#   milliseconds, most of the time goes into decoding the upload.
+# - Colours are compared in CIELAB with CIEDE2000 (perceptual distance). A bin matches the palette if its nearest
+#   approved colour is within MATCH_DELTA_E.
+# - Low-chroma bins (white/grey/black) that match no palette colour count as neutral and are left out of the palette
+#   score, so a white background does not fail an otherwise on-brand image.
+# - A pixel analysis can't find the logo, so the logo check only says whether the approved logo colours appear at all
+#   (each at least LOGO_MIN_COVERAGE of the image).
+# - main.py can hand the result to the model as measured facts (colour_facts=true) or return it directly
+#   (POST /colour_compliance). Bump ENGINE_VERSION when the analysis changes (it is part of the result cache key).
+
+ENGINE_VERSION = "1"
+
+ANALYSIS_MAX_SIDE = 256
+MATCH_DELTA_E = float(os.getenv("COLOUR_MATCH_DELTA_E", "10"))
+PALETTE_PASS_RATIO = float(os.getenv("COLOUR_PALETTE_PASS_RATIO", "0.8"))
+LOGO_MIN_COVERAGE = float(os.getenv("COLOUR_LOGO_MIN_COVERAGE", "0.005"))
+NEUTRAL_CHROMA = 8.0
+
+_HEX = re.compile(r"^#?([0-9a-fA-F]{6}|[0-9a-fA-F]{3})$")
+
+# "#85A0FE" / "85a0fe" / "#FFF" -> (133, 160, 254), None if it is not a hex colour
+def parse_hex(colour: str):
+    match = _HEX.match(colour.strip())
+    if not match:
+        return None
+    digits = match.group(1)
+    if len(digits) == 3:
+        digits = "".join(c * 2 for c in digits)
+    return tuple(int(digits[i:i + 2], 16) for i in (0, 2, 4))
+
+def to_hex(rgb) -> str:
+    return "#{:02X}{:02X}{:02X}".format(*(int(round(c)) for c in rgb))
+
+# Parses a list of hex strings, dropping duplicates and anything that is not a colour (order is kept)
+def _palette(colours) -> list[str]:
+    seen = {}
+    for colour in colours or []:
+        rgb = parse_hex(colour)
+        if rgb is not None:
+            seen.setdefault(to_hex(rgb), rgb)
+    return list(seen)
+
+# sRGB (0-255, shape (..., 3)) -> CIELAB (D65)
+def rgb_to_lab(rgb) -> np.ndarray:
+    c = np.asarray(rgb, dtype=np.float64) / 255.0
+    c = np.where(c > 0.04045, ((c + 0.055) / 1.055) ** 2.4, c / 12.92)
+    xyz = c @ np.array([
+        [0.4124564, 0.2126729, 0.0193339],
+        [0.3575761, 0.7151522, 0.1191920],
+        [0.1804375, 0.0721750, 0.9503041],
+    ])
+    xyz /= np.array([0.95047, 1.0, 1.08883])
+    f = np.where(xyz > (6 / 29) ** 3, np.cbrt(xyz), xyz / (3 * (6 / 29) ** 2) + 4 / 29)
+    return np.stack([116 * f[..., 1] - 16, 500 * (f[..., 0] - f[..., 1]), 200 * (f[..., 1] - f[..., 2])], axis=-1)
+
+# CIEDE2000 colour difference, broadcasting over the leading dimensions of lab1 and lab2
+def ciede2000(lab1, lab2) -> np.ndarray:
+    L1, a1, b1 = np.moveaxis(np.asarray(lab1, dtype=np.float64), -1, 0)
+    L2, a2, b2 = np.moveaxis(np.asarray(lab2, dtype=np.float64), -1, 0)
+
+    C_mean = (np.hypot(a1, b1) + np.hypot(a2, b2)) / 2
+    G = 0.5 * (1 - np.sqrt(C_mean ** 7 / (C_mean ** 7 + 25.0 ** 7)))
+    a1p, a2p = (1 + G) * a1, (1 + G) * a2
+    C1p, C2p = np.hypot(a1p, b1), np.hypot(a2p, b2)
+    h1p = np.degrees(np.arctan2(b1, a1p)) % 360
+    h2p = np.degrees(np.arctan2(b2, a2p)) % 360
+
+    dLp = L2 - L1
+    dCp = C2p - C1p
+    dhp = h2p - h1p
+    dhp = np.where(dhp > 180, dhp - 360, dhp)
+    dhp = np.where(dhp < -180, dhp + 360, dhp)
+    dhp = np.where(C1p * C2p == 0, 0.0, dhp)
+    dHp = 2 * np.sqrt(C1p * C2p) * np.sin(np.radians(dhp / 2))
+
+    Lp_mean = (L1 + L2) / 2
+    Cp_mean = (C1p + C2p) / 2
+    hp_sum = h1p + h2p
+    hp_mean = np.where(np.abs(h1p - h2p) > 180, np.where(hp_sum < 360, hp_sum + 360, hp_sum - 360), hp_sum) / 2
+    hp_mean = np.where(C1p * C2p == 0, hp_sum, hp_mean)
+
+    T = (1 - 0.17 * np.cos(np.radians(hp_mean - 30)) + 0.24 * np.cos(np.radians(2 * hp_mean))
+         + 0.32 * np.cos(np.radians(3 * hp_mean + 6)) - 0.20 * np.cos(np.radians(4 * hp_mean - 63)))
+    d_theta = 30 * np.exp(-(((hp_mean - 275) / 25) ** 2))
+    R_C = 2 * np.sqrt(Cp_mean ** 7 / (Cp_mean ** 7 + 25.0 ** 7))
+    S_L = 1 + 0.015 * (Lp_mean - 50) ** 2 / np.sqrt(20 + (Lp_mean - 50) ** 2)
+    S_C = 1 + 0.045 * Cp_mean
+    S_H = 1 + 0.015 * Cp_mean * T
+    R_T = -np.sin(np.radians(2 * d_theta)) * R_C
+
+    return np.sqrt(
+        (dLp / S_L) ** 2 + (dCp / S_C) ** 2 + (dHp / S_H) ** 2 + R_T * (dCp / S_C) * (dHp / S_H)
+    )
+
+# Samples the image down and returns its pixels as an (N, 3) uint8 array (transparent pixels are dropped)
+def _pixels(image_bytes: bytes, max_side: int) -> np.ndarray:
+    image = Image.open(BytesIO(image_bytes))
+    if max(image.size) > max_side:
+        scale = max_side / max(image.size)
+        size = (max(1, int(image.width * scale)), max(1, int(image.height * scale)))
+        image = image.resize(size, Image.Resampling.NEAREST)
+    rgba = np.asarray(image.convert("RGBA")).reshape(-1, 4)
+    return rgba[rgba[:, 3] >= 128, :3]
+
+# Dominant-colour histogram: (mean colour of every 5-bit bin, pixel count of the bin), largest first
+def colour_histogram(pixels: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    q = (pixels >> 3).astype(np.int32)
+    codes = (q[:, 0] << 10) | (q[:, 1] << 5) | q[:, 2]
+    _, inverse, counts = np.unique(codes, return_inverse=True, return_counts=True)
+    means = np.stack([np.bincount(inverse, weights=pixels[:, i]) for i in range(3)], axis=1) / counts[:, None]
+    order = np.argsort(counts)[::-1]
+    return means[order], counts[order]
+
+# Share of the pixels matching each colour in `palette` (nearest colour within MATCH_DELTA_E)
+# CIEDE2000 is only computed against the NEAREST_CANDIDATES closest palette colours by plain Lab distance,
+# which is a lot cheaper than the full (bins x palette) matrix and almost always picks the same nearest colour.
+NEAREST_CANDIDATES = 4
+
+def _coverage(bin_lab, counts, palette, match_delta_e):
+    palette_lab = rgb_to_lab(np.array([parse_hex(c) for c in palette]))
+    euclidean = ((bin_lab[:, None, :] - palette_lab[None, :, :]) ** 2).sum(axis=-1)
+    k = min(NEAREST_CANDIDATES, len(palette))
+    candidates = np.argpartition(euclidean, k - 1, axis=1)[:, :k]
+    distances = ciede2000(bin_lab[:, None, :], palette_lab[candidates])
+    best = distances.argmin(axis=1)
+    rows = np.arange(len(best))
+    nearest, delta_e = candidates[rows, best], distances[rows, best]
+    matched = delta_e <= match_delta_e
+    per_colour = np.bincount(nearest[matched], weights=counts[matched], minlength=len(palette)) / counts.sum()
+    return nearest, delta_e, matched, per_colour
+
+def analyze_colours(
+    image_bytes: bytes,
+    palette,
+    logo_colours=(),
+    match_delta_e: float = MATCH_DELTA_E,
+    max_side: int = ANALYSIS_MAX_SIDE,
+) -> dict:
+    started = time.perf_counter()
+    palette, logo_colours = _palette(palette), _palette(logo_colours)
+
+    pixels = _pixels(image_bytes, max_side)
+    if len(pixels) == 0:
+        raise ValueError("Image has no opaque pixels")
+    means, counts = colour_histogram(pixels)
+    bin_lab = rgb_to_lab(means)
+    total = counts.sum()
+    neutral = np.hypot(bin_lab[:, 1], bin_lab[:, 2]) < NEUTRAL_CHROMA
+
+    result = {
+        "engine_version": ENGINE_VERSION,
+        "match_delta_e": match_delta_e,
+        "palette_score": None,
+        "palette_pass": None,
+        "coverage": {},
+        "off_palette_coverage": None,
+        "neutral_coverage": round(float(counts[neutral].sum() / total), 4),
+        "dominant_colours": [],
+        "logo_colours": {"coverage": {}, "pass": None},
+    }
+
+    if palette:
+        nearest, delta_e, matched, per_colour = _coverage(bin_lab, counts, palette, match_delta_e)
+        neutral_only = neutral & ~matched
+        scored = total - counts[neutral_only].sum()
+        score = float(counts[matched].sum() / scored) if scored else 1.0
+        result.update({
+            "palette_score": round(score, 4),
+            "palette_pass": score >= PALETTE_PASS_RATIO,
+            "coverage": {c: round(float(v), 4) for c, v in sorted(zip(palette, per_colour), key=lambda x: -x[1]) if v > 0},
+            "off_palette_coverage": round(float(counts[~matched & ~neutral_only].sum() / total), 4),
+        })
+        result["dominant_colours"] = [
+            {
+                "colour": to_hex(means[i]),
+                "coverage": round(float(counts[i] / total), 4),
+                "nearest": palette[nearest[i]],
+                "delta_e": round(float(delta_e[i]), 1),
+                "neutral": bool(neutral[i]),
+            }
+            for i in range(min(8, len(counts)))
+        ]
+    else:
+        result["dominant_colours"] = [
+            {"colour": to_hex(means[i]), "coverage": round(float(counts[i] / total), 4), "neutral": bool(neutral[i])}
+            for i in range(min(8, len(counts)))
+        ]
+
+    if logo_colours:
+        _, _, _, per_logo = _coverage(bin_lab, counts, logo_colours, match_delta_e)
+        result["logo_colours"] = {
+            "coverage": {c: round(float(v), 4) for c, v in zip(logo_colours, per_logo)},
+            "pass": bool((per_logo >= LOGO_MIN_COVERAGE).any()),
+        }
+
+    result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    return result
+
+# Same as analyze_colours, with the colour lists taken from extract_brand_compliance output
+def analyze_brand_colours(image_bytes: bytes, brand_data: dict) -> dict:
+    return analyze_colours(
+        image_bytes,
+        brand_data.get("logo_colour_palette", {}).get("Colours", []),
+        brand_data.get("logo_colour", {}).get("Logo colours", []),
+    )
+
+def _percent(value) -> str:
+    return f"{100 * value:.1f}%"
+
+# The analysis as a prompt section, so the model judges the colour criteria from measurements instead of guessing
+def colour_facts_prompt(analysis: dict) -> str:
+    lines = ["\n\n**Measured colours (pixel analysis of the image, treat these as facts):**"]
+    if analysis["palette_score"] is not None:
+        lines.append(
+            f"- {_percent(analysis['palette_score'])} of the non-neutral image area is within ΔE2000 "
+            f"{analysis['match_delta_e']:g} of an approved palette colour "
+            f"(pass threshold {_percent(PALETTE_PASS_RATIO)}: {'met' if analysis['palette_pass'] else 'not met'})."
+        )
+    dominant = ", ".join(
+        f"{d['colour']} {_percent(d['coverage'])}" + (f" (nearest {d['nearest']}, ΔE {d['delta_e']})" if "nearest" in d else "")
+        for d in analysis["dominant_colours"][:5]
+    )
+    lines.append(f"- Dominant colours: {dominant}.")
+    lines.append(f"- Neutral (white/grey/black) area: {_percent(analysis['neutral_coverage'])}.")
+    logo = analysis["logo_colours"]
+    if logo["pass"] is not None:
+        found = [c for c, v in logo["coverage"].items() if v >= LOGO_MIN_COVERAGE]
+        lines.append(f"- Approved logo colours present in the image: {', '.join(found) if found else 'none'}.")
+    return "\n".join(lines)
@@ -1,6 +1,15 @@
+from app.verdicts import JSON_RESPONSE_FORMAT
+
+# Version of the prompt template below. Bump it whenever the template changes, so cached evaluations
+# made with the old prompt are not served anymore (see result_cache.py).
+# 2: outputs are decoded without the prompt (older cached outputs start with it)
+# 3: the prompt is sent in the chat template with the image placeholder (older outputs never saw the image)
+PROMPT_VERSION = "3"
+
 # This function simply builds a compliance prompt for the Gwen model, based on extracted data (brand_data). These are the results
 # which is returned in the format that is returned from extract_brand_compliance, i.e., a dict.
-def build_compliance_prompt_qwen(brand_data: dict) -> str:
+# structured=True asks for a JSON verdict instead of the free-text format (see verdicts.py)
+def build_compliance_prompt_qwen(brand_data: dict, structured: bool = False) -> str:
     font_styles = brand_data.get("font_styles", {})
     logo_safezone = brand_data.get("logo_safezone", {})
     logo_colours = brand_data.get("logo_colour", {}).get("Logo colours", [])
@@ -29,7 +38,8 @@ def build_compliance_prompt_qwen(brand_data: dict) -> str:
 
         f"- **Approved Colour Palette (the image should primarily use these colours)**\n"
         f"  {', '.join(colour_palette[:10]) + ('...' if len(colour_palette) > 10 else '')}\n\n"
-
+    )
+    prompt += JSON_RESPONSE_FORMAT if structured else (
         "### Response Format\n"
         "- Font Style: ✅/❌ – explanation\n"
         "- Logo Safe Zone: ✅/❌ – explanation\n"
@@ -0,0 +1,161 @@
+import asyncio
+import hashlib
+import math
+import os
+from dataclasses import dataclass
+from io import BytesIO
+
+from PIL import Image, ImageSequence
+
+from app.executors import run_pdf
+from app.verdicts import CRITERIA, CriterionVerdict, Verdict, aggregate
+
+# Multi-page creatives: PDF creatives and multi-frame images (animated GIF/PNG/WebP, multi-page TIFF)
+# - PDF pages are rasterized with PyMuPDF's get_pixmap at CREATIVE_DPI (or the request's dpi) in the PDF process pool
+#   (see executors.py). Every pixmap is encoded to PNG in memory and dropped before the next page is rendered, so a
+#   worker holds one page of pixels at a time and nothing is written to disk.
+# - A page is never rendered larger than CREATIVE_MAX_PIXELS (the zoom is lowered for large-format pages), and the
+#   pages are split over several pool tasks (CREATIVE_PAGES_PER_TASK each), so one big creative can't take a PDF
+#   worker for long or allocate unbounded memory.
+# - Frames are split with Pillow and encoded to PNG through one reused in-memory buffer.
+# - Every page carries the SHA-256 of its PNG, so identical pages (repeated slides, static frames of an animation) are
+#   evaluated once (dedupe) and share the result cache with the same image uploaded on its own.
+# - At most CREATIVE_MAX_PAGES pages/frames per creative.
+# - document_verdict combines the page verdicts: a criterion passes for the document only if it passes on every page.
+
+CREATIVE_DPI = int(os.getenv("CREATIVE_DPI", "150"))
+CREATIVE_MAX_DPI = int(os.getenv("CREATIVE_MAX_DPI", "300"))
+CREATIVE_MAX_PAGES = int(os.getenv("CREATIVE_MAX_PAGES", "20"))
+CREATIVE_MAX_PIXELS = int(os.getenv("CREATIVE_MAX_PIXELS", str(2048 * 2048)))
+CREATIVE_PAGES_PER_TASK = int(os.getenv("CREATIVE_PAGES_PER_TASK", "4"))
+
+@dataclass
+class CreativePage:
+    number: int    # 1-based page/frame number
+    data: bytes    # PNG
+    sha256: str
+    size: tuple    # (width, height) in pixels
+
+def is_pdf(head: bytes) -> bool:
+    return head.lstrip()[:5] == b"%PDF-"
+
+# DPI of a request, within 36..CREATIVE_MAX_DPI
+def clamp_dpi(dpi: int | None) -> int:
+    return max(36, min(dpi or CREATIVE_DPI, CREATIVE_MAX_DPI))
+
+def _check_pages(count: int, max_pages: int):
+    if count == 0:
+        raise ValueError("Creative has no pages")
+    if count > max_pages:
+        raise ValueError(f"Creative has {count} pages, at most {max_pages} can be evaluated")
+
+def _page(number: int, data: bytes, size) -> CreativePage:
+    return CreativePage(number, data, hashlib.sha256(data).hexdigest(), tuple(size))
+
+def _open_pdf(source):
+    import fitz
+
+    return fitz.open(source) if isinstance(source, (str, os.PathLike)) else fitz.open(stream=source, filetype="pdf")
+
+# Zoom of a page at dpi, lowered so the rendered page has at most max_pixels (the pixmap rounds its sides up)
+def _zoom(rect, dpi: int, max_pixels: int) -> float:
+    zoom = dpi / 72
+    if max_pixels and rect.width * zoom * rect.height * zoom > max_pixels:
+        zoom *= (max_pixels / (rect.width * zoom * rect.height * zoom)) ** 0.5
+        while math.ceil(rect.width * zoom) * math.ceil(rect.height * zoom) > max_pixels:
+            zoom *= 0.995
+    return zoom
+
+# Runs in the PDF process pool: the number of pages (checked against max_pages)
+def count_pdf_pages(source, max_pages: int = CREATIVE_MAX_PAGES) -> int:
+    doc = _open_pdf(source)
+    try:
+        _check_pages(doc.page_count, max_pages)
+        return doc.page_count
+    finally:
+        doc.close()
+
+# Runs in the PDF process pool. source is a file path (spooled upload) or the PDF bytes.
+# Renders the pages first..first+count-1 (0-based, default: all of them).
+def render_pdf_pages(
+    source,
+    dpi: int = CREATIVE_DPI,
+    max_pages: int = CREATIVE_MAX_PAGES,
+    first: int = 0,
+    count: int | None = None,
+    max_pixels: int = CREATIVE_MAX_PIXELS,
+) -> list[CreativePage]:
+    import fitz
+
+    doc = _open_pdf(source)
+    try:
+        _check_pages(doc.page_count, max_pages)
+        last = doc.page_count if count is None else min(doc.page_count, first + count)
+        pages = []
+        for number in range(first, last):
+            page = doc.load_page(number)
+            zoom = _zoom(page.rect, dpi, max_pixels)
+            pixmap = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+            pages.append(_page(number + 1, pixmap.tobytes("png"), (pixmap.width, pixmap.height)))
+            pixmap = None  # free the pixels before the next page is rendered
+        return pages
+    finally:
+        doc.close()
+
+# Renders a PDF creative in the PDF process pool, pages_per_task pages per task, so the pages of one creative are
+# spread over the workers and other requests get a worker in between. source should be a path (every task opens it).
+async def arender_pdf_pages(
+    source, dpi: int = CREATIVE_DPI, max_pages: int = CREATIVE_MAX_PAGES, pages_per_task: int = CREATIVE_PAGES_PER_TASK,
+) -> list[CreativePage]:
+    page_count = await run_pdf(count_pdf_pages, source, max_pages)
+    pages_per_task = max(1, pages_per_task)
+    chunks = await asyncio.gather(*(
+        run_pdf(render_pdf_pages, source, dpi, max_pages, first, pages_per_task)
+        for first in range(0, page_count, pages_per_task)
+    ))
+    return [page for chunk in chunks for page in chunk]
+
+# The frames of a multi-frame image as PNGs, None for a single-frame image (evaluated as it is)
+def split_frames(image_bytes: bytes, max_pages: int = CREATIVE_MAX_PAGES) -> list[CreativePage] | None:
+    image = Image.open(BytesIO(image_bytes))
+    count = getattr(image, "n_frames", 1)
+    if count <= 1:
+        return None
+    _check_pages(count, max_pages)
+    pages, buffer = [], BytesIO()
+    for number, frame in enumerate(ImageSequence.Iterator(image), start=1):
+        frame = frame.convert("RGBA" if "A" in frame.getbands() or "transparency" in frame.info else "RGB")
+        buffer.seek(0)
+        buffer.truncate()
+        frame.save(buffer, format="PNG")
+        pages.append(_page(number, buffer.getvalue(), frame.size))
+    return pages
+
+# Page number whose result page i can reuse (identical PNG), or its own number
+def duplicate_of(pages: list[CreativePage]) -> dict:
+    first, representative = {}, {}
+    for page in pages:
+        representative[page.number] = first.setdefault(page.sha256, page.number)
+    return representative
+
+# Combines the verdicts of the pages (None = output couldn't be parsed) into one for the whole creative:
+# a criterion fails if it fails on any page, and is unknown if no page judged it
+def document_verdict(page_verdicts: dict) -> dict:
+    criteria, failed_pages = {}, {}
+    for key in CRITERIA:
+        judged = {n: v.criteria[key] for n, v in page_verdicts.items() if v is not None and v.criteria[key].passed is not None}
+        failed = sorted(n for n, c in judged.items() if not c.passed)
+        failed_pages[key] = failed
+        if not judged:
+            criteria[key] = CriterionVerdict(None)
+        elif failed:
+            criteria[key] = CriterionVerdict(False, f"Page {failed[0]}: {judged[failed[0]].reason}".strip())
+        else:
+            criteria[key] = CriterionVerdict(True)
+    verdict = Verdict(criteria=criteria, total=sum(c.passed is True for c in criteria.values()), source="pages")
+    return {
+        "pages": len(page_verdicts),
+        "verdict": verdict.to_dict(),
+        "failed_pages": failed_pages,                  # page numbers failing each criterion
+        "aggregate": aggregate(page_verdicts.values()),  # average total and pass rate per criterion over the pages
+    }
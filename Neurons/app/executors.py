@@ -0,0 +1,55 @@
+import asyncio
+import functools
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Executors used to keep blocking work off the event loop
+# - PDF parsing (PyMuPDF) is CPU-bound and holds the GIL, so it runs in a process pool (PDF_WORKERS processes).
+#   PDF_WORKERS=0 runs it in the default thread pool instead (e.g. for tests, or tiny containers).
+# - Local model inference (Qwen) runs on the batching scheduler's own worker thread (see qwen_batching.py).
+# - The pool is created lazily on first use and shut down when the app stops (see main.py).
+
+_lock = threading.Lock()
+_pdf_pool = None
+
+def _pdf_workers() -> int:
+    return int(os.getenv("PDF_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+def get_pdf_pool():
+    global _pdf_pool
+    workers = _pdf_workers()
+    if workers <= 0:
+        return None
+    with _lock:
+        if _pdf_pool is None:
+            # "spawn" so the workers don't inherit the threads/locks of the (already running) server process
+            _pdf_pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        return _pdf_pool
+
+# Runs fn(*args) in the PDF process pool (fn and args must be picklable)
+async def run_pdf(fn, *args):
+    global _pdf_pool
+    pool = get_pdf_pool()
+    if pool is None:
+        return await asyncio.to_thread(fn, *args)
+
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(pool, functools.partial(fn, *args))
+    except BrokenProcessPool:
+        # A worker died (e.g. OOM on a huge PDF). Drop the pool so the next call gets a fresh one.
+        with _lock:
+            if _pdf_pool is pool:
+                _pdf_pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+        raise
+
+def shutdown():
+    global _pdf_pool
+    with _lock:
+        pool, _pdf_pool = _pdf_pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
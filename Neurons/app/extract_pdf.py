@@ -1,108 +1,392 @@
+import hashlib
+import os
+import re
+import time
 import fitz  # PyMuPDF
-from io import BytesIO
 
 # Functions to extract brand compliance requirements using fitz (PyMuPDF)
 
 # - The functions works by reading through the PDF and extracing information, based on keyword matches
 # - E.g., font styles are extracted by looking at the words "primary" and "seconday" and extracting the fonts based on this
 # - This is obviously non-generalizable, as if the structure of the PDF changes, these functions might not
-#   necesarilly perform as expected. 
+#   necesarilly perform as expected.
 
-def extract_font_styles(pdf_path):
-    doc = fitz.open(stream=BytesIO(pdf_path), filetype="pdf")
+# - The PDF is opened once and the text of each page is pulled once (read_page_texts). The texts are then handed to
+#   every section extractor, so adding a new section does not add another full pass over the document.
+# - A section extractor is a pair of functions:
+#     * page_fn(text) -> partial result for a single page (or None if the page has nothing for this section)
+#     * merge_fn(list of partial results, in page order) -> the final dict for the section
+#   Keeping the per-page results separate from the merge makes it possible to only look at some of the pages later on.
+
+# - Page-targeted extraction (extract_brand_compliance_indexed): most of a brand kit is imagery, and each section
+#   only lives on a page or two. The table of contents (the PDF outline, or a printed "Table of contents" page near the
+#   start) tells which pages belong to which section (see toc_keywords below), so only those pages are read.
+#   If a section finds nothing on its pages (or there is no table of contents), it falls back to a full scan.
+# - The result comes with a section index (JSON): for every section, the pages that actually had something for it.
+#   It also carries the timings of the run (timings_ms: PDF open, table of contents, every section), so the caller
+#   can record them even when the extraction ran in a worker process (see metrics.py).
+#   The index is cached per PDF hash (see brand_kit_cache.py), so re-extracting a known PDF (e.g. after CACHE_VERSION
+#   was bumped) only reads those pages. Bump INDEX_VERSION when page_fn matching rules or toc_keywords change.
+
+# - Brand kit versions: every page a section looks at gets a content hash (page_hash: its content streams, form
+#   XObjects and fonts, no text layout needed), and the index keeps the page_fn results of those pages by page hash.
+#   Given the index of the previous version (previous=...), the text of pages with a known hash is not read again,
+#   their page_fn results are reused and merged with those of the new/changed pages. The result is the same as
+#   extracting from scratch.
+#   Hashing costs about as much as reading the text, so pages are only hashed (and their results kept) when a brand
+#   kit version is registered (record_pages=True, or previous given). The evaluate endpoints never hash.
+
+# - Every function taking a PDF accepts either its bytes or a file path. A path is opened as a file, so PyMuPDF only
+#   reads what it needs and no copy of a big PDF is made (the API spools uploads to temp files, see uploads.py).
+
+INDEX_VERSION = "1"
+
+# A printed table of contents is only looked for on the first few pages
+TOC_SCAN_PAGES = 3
+
+def _open(pdf):
+    if isinstance(pdf, (str, os.PathLike)):
+        return fitz.open(pdf, filetype="pdf")
+    return fitz.open(stream=pdf, filetype="pdf")
+
+# Opens the PDF once and returns the text of each page (in page order)
+def read_page_texts(pdf_path):
+    doc = _open(pdf_path)
+    try:
+        return [page.get_text() for page in doc]
+    finally:
+        doc.close()
+
+# Page texts of an open document, pulled on first use (each page is read at most once)
+class _PageTexts:
+    def __init__(self, doc):
+        self.doc = doc
+        self._texts = {}
+        self._hashes = {}
+        if hasattr(doc, "load_page"):
+            self.page_count = len(doc)
+        else:
+            # Documents without random access are read in one go
+            for i, page in enumerate(doc):
+                self._texts[i] = page.get_text()
+            self.page_count = len(self._texts)
+
+    def text(self, i):
+        if i not in self._texts:
+            self._texts[i] = self.doc.load_page(i).get_text()
+        return self._texts[i]
+
+    # Content hash of a page (see page_hash), pages of other document types are hashed by their text
+    def hash(self, i):
+        if i not in self._hashes:
+            if getattr(self.doc, "is_pdf", False):
+                self._hashes[i] = page_hash(self.doc, self.doc.load_page(i))
+            else:
+                self._hashes[i] = hashlib.sha256(self.text(i).encode("utf-8")).hexdigest()
+        return self._hashes[i]
+
+    @property
+    def pages_read(self):
+        return len(self._texts)
+
+# Content hash of a page. If it is unchanged, so is the text every page_fn sees.
+def page_hash(doc, page) -> str:
+    hasher = hashlib.sha256(page.read_contents())
+    for xref, *_ in page.get_xobjects():
+        hasher.update(doc.xref_stream(xref) or b"")
+    # Fonts by resource name and type (xref numbers change whenever a PDF is re-saved)
+    hasher.update(repr([font[1:6] for font in page.get_fonts()] + [tuple(page.rect), page.rotation]).encode())
+    return hasher.hexdigest()
+
+# ---------- Font styles ----------
+def _font_styles_page(text):
     font_styles = {}
+    lines = text.splitlines()
 
-    for page in doc:
-        text = page.get_text()
-        lines = text.splitlines()
+    for i, line in enumerate(lines):
+        if line.strip().lower() == "primary" and i + 1 < len(lines):
+            font_styles["Primary"] = lines[i + 1].strip()
+        elif line.strip().lower() == "secondary" and i + 1 < len(lines):
+            font_styles["Secondary"] = lines[i + 1].strip()
 
-        for i, line in enumerate(lines):
-            if line.strip().lower() == "primary" and i + 1 < len(lines):
-                font_styles["Primary"] = lines[i + 1].strip()
-            elif line.strip().lower() == "secondary" and i + 1 < len(lines):
-                font_styles["Secondary"] = lines[i + 1].strip()
+    return font_styles or None
 
-    doc.close()
+# Later pages overwrite earlier ones, same as looping over the whole document
+def _font_styles_merge(partials):
+    font_styles = {}
+    for partial in partials:
+        font_styles.update(partial)
     return font_styles
 
-def extract_logo_safezone_styles(pdf_path):
-    doc = fitz.open(stream=BytesIO(pdf_path), filetype="pdf")
+# ---------- Logo safe zone ----------
+def _logo_safezone_page(text):
+    if "the safe zone" not in text.lower():
+        return None
+
     logo_safezone = {}
+    lines = text.splitlines()
+    buffer = []
+    found_section = False
+
+    for i, line in enumerate(lines):
+        if "the safe zone" in line.lower():
+            found_section = True
+            buffer.append(line.strip())
+            continue
+        if found_section:
+            # Stop if we've reached a new section (heuristic: a blank line or unrelated header)
+            if line.strip() == "" or line.strip().lower() in ["yes", "no"]:
+                break
+            buffer.append(line.strip())
+
+    # Join the buffer into a paragraph
+    safezone_text = " ".join(buffer)
+
+    # Extract value and requirements from the paragraph
+    value_part = ""
+    if "x is" in safezone_text.lower():
+        # Extract the value using a simple split
+        value_part = next((s for s in safezone_text.split(".") if "x is" in s.lower()), "").strip()
+        logo_safezone["Value"] = value_part
+
+    # Everything else is the requirement
+    requirement_part = safezone_text.replace(value_part, "").strip()
+    logo_safezone["Requirements"] = requirement_part
 
-    for page in doc:
-        text = page.get_text()
-        if "the safe zone" in text.lower():
-            lines = text.splitlines()
-            buffer = []
-            found_section = False
-
-            for i, line in enumerate(lines):
-                if "the safe zone" in line.lower():
-                    found_section = True
-                    buffer.append(line.strip())
-                    continue
-                if found_section:
-                    # Stop if we've reached a new section (heuristic: a blank line or unrelated header)
-                    if line.strip() == "" or line.strip().lower() in ["yes", "no"]:
-                        break
-                    buffer.append(line.strip())
-
-            # Join the buffer into a paragraph
-            safezone_text = " ".join(buffer)
-
-            # Extract value and requirements from the paragraph
-            if "x is" in safezone_text.lower():
-                # Extract the value using a simple split
-                value_part = next((s for s in safezone_text.split(".") if "x is" in s.lower()), "").strip()
-                logo_safezone["Value"] = value_part
-
-            # Everything else is the requirement
-            requirement_part = safezone_text.replace(value_part, "").strip()
-            logo_safezone["Requirements"] = requirement_part
-
-            break  # Stop after first match
-
-    doc.close()
     return logo_safezone
 
-def extract_logo_colours(pdf_path):
-    doc = fitz.open(stream=BytesIO(pdf_path), filetype="pdf")
-    logo_colour = {"Logo colours": []}
+# Only the first page mentioning the safe zone is used
+def _logo_safezone_merge(partials):
+    return dict(partials[0]) if partials else {}
 
-    for page in doc:
-        text = page.get_text()
-        lines = text.splitlines()
+# ---------- Colours ----------
+# Just simply check if a line starts with "#" - if it does, we assume it is a colour and we append it. There is a large palette of colours, so we just extract each one, and return them in a dict.
+def _hex_lines(text):
+    return [line.strip() for line in text.splitlines() if line.strip().startswith("#")]
 
-        if "primary" in text:
-            for line in lines:
-                # Just simply check if a line starts with "#" - if it does, we assume it is a colour and we append it. There is a large palette of colours, so we just extract each one, and return them in a dict.
-                if line.strip().startswith("#"):
-                    logo_colour["Logo colours"].append(line.strip())
+def _logo_colours_page(text):
+    if "primary" not in text:
+        return None
+    return _hex_lines(text) or None
 
-    doc.close()
-    return logo_colour
+def _logo_colours_merge(partials):
+    return {"Logo colours": [colour for partial in partials for colour in partial]}
 
-def extract_palette_styles(pdf_path):
-    doc = fitz.open(stream=BytesIO(pdf_path), filetype="pdf")
-    logo_colour_palette = {"Colours": []}
+def _palette_page(text):
+    return _hex_lines(text) or None
+
+def _palette_merge(partials):
+    return {"Colours": [colour for partial in partials for colour in partial]}
+
+# ---------- Section registry ----------
+# The order of this dict is the order of the keys in the extract_brand_compliance result.
+SECTION_EXTRACTORS = {
+    "font_styles": (_font_styles_page, _font_styles_merge),
+    "logo_safezone": (_logo_safezone_page, _logo_safezone_merge),
+    "logo_colour": (_logo_colours_page, _logo_colours_merge),
+    "logo_colour_palette": (_palette_page, _palette_merge),
+}
 
-    for page in doc:
-        text = page.get_text()
-        lines = text.splitlines()
+# Table of contents titles (lowercase substrings) pointing at the pages of each section
+SECTION_TOC_KEYWORDS = {
+    "font_styles": ("typography", "font", "typeface"),
+    "logo_safezone": ("safe zone", "clear space", "clearspace"),
+    "logo_colour": ("colour", "color"),
+    "logo_colour_palette": ("colour", "color", "palette"),
+}
 
-        for line in lines:
-            # Just simply check if a line starts with "#" - if it does, we assume it is a colour and we append it. There is a large palette of colours, so we just extract each one, and return them in a dict.
-            if line.strip().startswith("#"):
-                logo_colour_palette["Colours"].append(line.strip())
+# Adds (or replaces) a section extractor, so new sections are picked up by extract_brand_compliance
+# Without toc_keywords the section is always extracted with a full scan
+def register_section_extractor(name, page_fn, merge_fn, toc_keywords=()):
+    SECTION_EXTRACTORS[name] = (page_fn, merge_fn)
+    SECTION_TOC_KEYWORDS[name] = tuple(k.lower() for k in toc_keywords)
 
-    doc.close()
-    return logo_colour_palette
+# Runs the given sections (default: all registered) over a list of page texts
+def extract_sections_from_texts(page_texts, sections=None):
+    names = list(SECTION_EXTRACTORS) if sections is None else list(sections)
+    partials = {name: [] for name in names}
+
+    for text in page_texts:
+        for name in names:
+            page_fn, _ = SECTION_EXTRACTORS[name]
+            partial = page_fn(text)
+            if partial is not None:
+                partials[name].append(partial)
+
+    return {name: SECTION_EXTRACTORS[name][1](partials[name]) for name in names}
+
+# ---------- Table of contents ----------
+# "04logo", "07 Colours", "12  Typography" -> (printed page number, title)
+_CONTENTS_LINE = re.compile(r"^\s*(\d{1,3})\s*([^\d\s].*?)\s*$")
+
+# Entries of a printed "Table of contents" page as [level, title, page] (1-based, like fitz get_toc)
+def _contents_page_entries(pages):
+    for i in range(min(TOC_SCAN_PAGES, pages.page_count)):
+        text = pages.text(i)
+        if "contents" not in text.lower():
+            continue
+        entries = []
+        for line in text.splitlines():
+            match = _CONTENTS_LINE.match(line)
+            if match:
+                entries.append([1, match.group(2), int(match.group(1))])
+        if entries:
+            return entries
+    return []
+
+def _outline(doc):
+    get_toc = getattr(doc, "get_toc", None)
+    return [list(entry[:3]) for entry in get_toc(simple=True)] if get_toc is not None else []
+
+# Returns (entries, source): the PDF outline if there is one, else a printed table of contents, else nothing
+def read_toc(doc, pages):
+    outline = _outline(doc)
+    if outline:
+        return outline, "outline"
+    entries = _contents_page_entries(pages)
+    return (entries, "contents_page") if entries else ([], None)
+
+# Turns the entries into (lowercase title, first page, last page) ranges (0-based, inclusive)
+# An entry runs until the next entry on the same or a higher level starts
+def toc_ranges(entries, page_count):
+    ranges = []
+    for i, (level, title, page) in enumerate(entries):
+        start = page - 1
+        if not 0 <= start < page_count:
+            continue
+        end = page_count - 1
+        for next_level, _, next_page in entries[i + 1:]:
+            if next_level <= level and next_page - 1 > start:
+                end = min(end, next_page - 2)
+                break
+        ranges.append((title.lower(), start, end))
+    return ranges
+
+def _toc_pages(ranges, keywords):
+    pages = set()
+    for title, start, end in ranges:
+        if any(keyword in title for keyword in keywords):
+            pages.update(range(start, end + 1))
+    return sorted(pages)
+
+# ---------- Page-targeted extraction ----------
+# page_fn results by page hash: the ones of an earlier version (reused) and the ones of this run
+class _PageResults:
+    def __init__(self, previous=None, record=True):
+        self.previous = previous or {}
+        self.record = record  # False: no hashing, page_fn just runs on the text
+        self.results = {}   # page hash -> {section name: page_fn result}
+        self.reused = set()
+
+    def run(self, name, page_fn, pages, i):
+        if not self.record:
+            return page_fn(pages.text(i))
+        key = pages.hash(i)
+        if name in self.previous.get(key, {}):
+            partial = self.previous[key][name]
+            self.reused.add(i)
+        else:
+            partial = page_fn(pages.text(i))
+        self.results.setdefault(key, {})[name] = partial
+        return partial
+
+# Runs page_fn over the given pages, returns (partials, pages that had something)
+def _run_section(pages, name, page_fn, page_numbers, page_results):
+    partials, hits = [], []
+    for i in page_numbers:
+        partial = page_results.run(name, page_fn, pages, i)
+        if partial is not None:
+            partials.append(partial)
+            hits.append(i)
+    return partials, hits
+
+# Returns (requirements, section index). index is a section index from an earlier run on the same PDF (or None),
+# previous the index of an earlier version of the brand kit (or None). With record_pages (implied by previous) the
+# index also gets the page hashes and page_fn results a later version can reuse.
+def extract_brand_compliance_indexed(pdf_bytes, index=None, sections=None, previous=None, record_pages=False):
+    names = list(SECTION_EXTRACTORS) if sections is None else list(sections)
+    known = (index or {}).get("sections", {}) if (index or {}).get("version") == INDEX_VERSION else {}
+    record_pages = record_pages or previous is not None
+    previous = previous if (previous or {}).get("version") == INDEX_VERSION else None
+
+    timings = {}
+    started = time.perf_counter()
+    doc = _open(pdf_bytes)
+    try:
+        pages = _PageTexts(doc)
+        timings["pdf_open"] = (time.perf_counter() - started) * 1000
+        page_results = _PageResults((previous or {}).get("page_results"), record=record_pages)
+
+        started = time.perf_counter()
+        if index and known:
+            toc, toc_source = index.get("toc", []), index.get("toc_source")
+            toc_page_hashes = index.get("toc_page_hashes", [])
+        else:
+            scanned = range(min(TOC_SCAN_PAGES, pages.page_count))
+            previous_toc_pages = (previous or {}).get("toc_page_hashes")
+            if previous_toc_pages and not _outline(doc) and [pages.hash(i) for i in scanned] == previous_toc_pages:
+                # The pages a printed table of contents is looked for on are unchanged
+                toc, toc_source = previous["toc"], previous["toc_source"]
+            else:
+                toc, toc_source = read_toc(doc, pages)
+            toc_page_hashes = [pages.hash(i) for i in scanned] if record_pages and toc_source != "outline" else []
+        ranges = toc_ranges(toc, pages.page_count)
+        timings["toc"] = (time.perf_counter() - started) * 1000
+
+        results, section_index = {}, {}
+        for name in names:
+            started = time.perf_counter()
+            page_fn, merge_fn = SECTION_EXTRACTORS[name]
+            if name in known:
+                # The pages that had something last time (may be empty: the section is not in this PDF)
+                source = known[name]["source"]
+                partials, hits = _run_section(pages, name, page_fn, known[name]["pages"], page_results)
+            else:
+                source = "toc"
+                toc_pages = _toc_pages(ranges, SECTION_TOC_KEYWORDS.get(name, ()))
+                partials, hits = _run_section(pages, name, page_fn, toc_pages, page_results)
+                if not partials:
+                    source = "full_scan"
+                    partials, hits = _run_section(pages, name, page_fn, range(pages.page_count), page_results)
+            results[name] = merge_fn(partials)
+            section_index[name] = {"pages": hits, "source": source}
+            # Includes pulling the text of pages no earlier section needed
+            timings[f"extract.{name}"] = (time.perf_counter() - started) * 1000
+
+        section_index = {**known, **section_index}
+        out = {
+            "version": INDEX_VERSION,
+            "page_count": pages.page_count,
+            "toc": toc,
+            "toc_source": toc_source,
+            "sections": section_index,
+            "pages_read": pages.pages_read,
+            "timings_ms": {stage: round(ms, 3) for stage, ms in timings.items()},
+        }
+        if record_pages:
+            out["toc_page_hashes"] = toc_page_hashes
+            out["page_results"] = page_results.results
+            out["pages_reused"] = sorted(page_results.reused)  # pages whose results came from the previous version
+        return results, out
+    finally:
+        doc.close()
+
+def _extract_section(pdf_path, name):
+    return extract_brand_compliance_indexed(pdf_path, sections=[name])[0][name]
+
+# ---------- Per-section API (kept for callers that only need one section) ----------
+def extract_font_styles(pdf_path):
+    return _extract_section(pdf_path, "font_styles")
+
+def extract_logo_safezone_styles(pdf_path):
+    return _extract_section(pdf_path, "logo_safezone")
+
+def extract_logo_colours(pdf_path):
+    return _extract_section(pdf_path, "logo_colour")
+
+def extract_palette_styles(pdf_path):
+    return _extract_section(pdf_path, "logo_colour_palette")
 
 # The function that will be used in the API
 def extract_brand_compliance(pdf_bytes):
-    return {
-        "font_styles": extract_font_styles(pdf_bytes),
-        "logo_safezone": extract_logo_safezone_styles(pdf_bytes),
-        "logo_colour": extract_logo_colours(pdf_bytes),
-        "logo_colour_palette": extract_palette_styles(pdf_bytes)
-    }
+    return extract_brand_compliance_indexed(pdf_bytes)[0]
@@ -1,24 +1,136 @@
 import io
+import threading
 from PIL import Image
-import torch
-from transformers import AutoProcessor, AutoModelForVision2Seq
 
-# Load once at import (so container warms the model only once)
+from app.verdicts import json_complete
+
+# The model is loaded on first use (or when warmed through the backend registry, see model_backends.py),
+# not at import time. torch/transformers are imported inside load_model for the same reason.
 MODEL_ID = "Qwen/Qwen2.5-VL-3B-Instruct"
 
-processor = AutoProcessor.from_pretrained(MODEL_ID)
-model = AutoModelForVision2Seq.from_pretrained(
-    MODEL_ID,
-    torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32,
-    device_map="auto",   # uses GPU if available, otherwise CPU
-)
+processor = None
+model = None
+_load_lock = threading.Lock()
+
+# One generate call at a time on the model (the batching scheduler and streaming requests share it)
+generate_lock = threading.Lock()
+
+def load_model():
+    """Load the processor and model once (thread-safe). Takes a while on first call."""
+    global processor, model
+    with _load_lock:
+        if model is not None:
+            return
+        import torch
+        from transformers import AutoProcessor, AutoModelForVision2Seq
+
+        processor = AutoProcessor.from_pretrained(MODEL_ID)
+        model = AutoModelForVision2Seq.from_pretrained(
+            MODEL_ID,
+            torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32,
+            device_map="auto",   # uses GPU if available, otherwise CPU
+        )
+
+def _chat_text(prompt: str) -> str:
+    """The prompt in Qwen2.5-VL's chat template, with the image placeholder (<|vision_start|><|image_pad|><|vision_end|>)
+    in front of it. The processor expands the placeholder to the image's patch tokens; without it the image isn't bound
+    to the prompt. Ends with the assistant turn, so the model answers right away."""
+    messages = [{"role": "user", "content": [{"type": "image"}, {"type": "text", "text": prompt}]}]
+    return processor.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+
+def _inputs(images: list, prompts: list[str]):
+    """Model inputs for (image, prompt) pairs, one image per prompt."""
+    # Decoder-only models must be padded on the left, so every sequence continues right after its own prompt
+    processor.tokenizer.padding_side = "left"
+    texts = [_chat_text(prompt) for prompt in prompts]
+    return processor(text=texts, images=images, padding=True, return_tensors="pt").to(model.device)
+
+def _json_stopping_criteria(prompt_length: int, structured: list[bool]):
+    """Ends each structured sequence once its new text is a complete JSON object (see verdicts.py). Only attached when
+    the batch has a structured request, and only those rows are decoded; free-text rows run until max_new_tokens / EOS."""
+    import torch
+    from transformers import StoppingCriteria, StoppingCriteriaList
+
+    rows = [i for i, flag in enumerate(structured) if flag]
+
+    class _JsonComplete(StoppingCriteria):
+        def __call__(self, input_ids, scores, **kwargs):
+            done = torch.zeros(input_ids.shape[0], dtype=torch.bool, device=input_ids.device)
+            texts = processor.batch_decode(input_ids[rows, prompt_length:], skip_special_tokens=True)
+            for row, text in zip(rows, texts):
+                done[row] = json_complete(text)
+            return done
 
-def Qwen_response(image_bytes: bytes, prompt: str, max_new_tokens: int = 512) -> str:
+    return StoppingCriteriaList([_JsonComplete()]) if rows else None
+
+def _generate(inputs, max_new_tokens: int, structured: list[bool]) -> list[str]:
+    """One generate call. Returns the generated text of every sequence, without the prompt."""
+    import torch
+
+    prompt_length = inputs["input_ids"].shape[1]
+    with generate_lock, torch.no_grad():
+        output = model.generate(
+            **inputs,
+            max_new_tokens=max_new_tokens,
+            stopping_criteria=_json_stopping_criteria(prompt_length, structured),
+        )
+    return processor.batch_decode(output[:, prompt_length:], skip_special_tokens=True)
+
+def Qwen_response(image_bytes: bytes, prompt: str, max_new_tokens: int = 512, structured: bool = False) -> str:
     """Run multimodal inference with Qwen2.5-VL (Transformers)."""
+    load_model()
+    image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+    return _generate(_inputs([image], [prompt]), max_new_tokens, [structured])[0]
+
+def Qwen_response_batch(
+    image_bytes_list: list[bytes], prompts: list[str], max_new_tokens: int = 512, structured: list[bool] | None = None,
+) -> list[str]:
+    """Run one batched (padded) generate call for several (image, prompt) pairs. Used by qwen_batching.py.
+    structured: per request, whether it asked for a JSON verdict (that sequence stops at its closing brace)."""
+    load_model()
+    images = [Image.open(io.BytesIO(b)).convert("RGB") for b in image_bytes_list]
+    return _generate(_inputs(images, prompts), max_new_tokens, structured or [False] * len(prompts))
+
+def Qwen_response_stream(image_bytes: bytes, prompt: str, max_new_tokens: int = 512, stop: threading.Event | None = None):
+    """Run inference and yield the generated text piece by piece (TextIteratorStreamer). Blocking generator.
+    Setting stop (from any thread) ends the generation at the next token, and frees the model for other requests."""
+    import torch
+    from transformers import StoppingCriteria, StoppingCriteriaList, TextIteratorStreamer
+    load_model()
     image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-    inputs = processor(text=prompt, images=image, return_tensors="pt").to(model.device)
+    inputs = _inputs([image], [prompt])
+
+    streamer = TextIteratorStreamer(processor.tokenizer, skip_prompt=True, skip_special_tokens=True)
+    stop = stop or threading.Event()
+    errors = []
+
+    # Ends generation early once the consumer stops reading (stop is set, or the generator is closed)
+    class _StopWhenClosed(StoppingCriteria):
+        def __call__(self, input_ids, scores, **kwargs):
+            return stop.is_set()
 
-    with torch.no_grad():
-        output = model.generate(**inputs, max_new_tokens=max_new_tokens)
+    def generate():
+        try:
+            with generate_lock, torch.no_grad():
+                if stop.is_set():  # the consumer went away while waiting for the model
+                    streamer.end()
+                    return
+                model.generate(
+                    **inputs,
+                    max_new_tokens=max_new_tokens,
+                    streamer=streamer,
+                    stopping_criteria=StoppingCriteriaList([_StopWhenClosed()]),
+                )
+        except Exception as e:
+            errors.append(e)
+            streamer.end()  # unblocks the loop below
 
-    return processor.batch_decode(output, skip_special_tokens=True)[0]
+    threading.Thread(target=generate, name="qwen-stream", daemon=True).start()
+    try:
+        for text in streamer:
+            if text:
+                yield text
+        if errors:
+            raise errors[0]
+    finally:
+        stop.set()
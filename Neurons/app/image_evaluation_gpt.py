@@ -1,45 +1,116 @@
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI, Timeout
 import base64
 import os
 from pathlib import Path
 from dotenv import load_dotenv
 
+from app.verdicts import RESPONSE_FORMAT, VERDICT_MAX_TOKENS
+
 # Load .env from parent directory
 env_path = Path(__file__).resolve().parent.parent / ".env"
 load_dotenv(dotenv_path=env_path)
 
-# Access the environment variable
-api_key = os.getenv("OPENAI_API_KEY")
-if not api_key:
-    raise RuntimeError("OPENAI_API_KEY is not set. See README -> Configure secrets.")
+# Timeouts for the OpenAI calls. A hanging call should fail, not keep a worker busy forever.
+# - Retries are left to the backend router (backend_router.py), so the client itself never retries: otherwise every
+#   router attempt would hide up to a few client attempts and the router's timeout would cut them off mid-retry.
+# - OPENAI_TIMEOUT defaults to ROUTER_TIMEOUT. Keep it at or below the router's timeout for the backend, a longer one
+#   is cut off by the router anyway.
+timeout = Timeout(
+    float(os.getenv("OPENAI_TIMEOUT") or os.getenv("ROUTER_TIMEOUT", "60")),
+    connect=float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5")),
+)
 
-# Initialize the OpenAI client
-client = OpenAI(api_key=api_key)
+# The OpenAI clients are created on first use (see model_backends.py), so importing this module never fails.
+# OPENAI_BASE_URL can point the clients at a local stub server (e.g. for load tests), default is the OpenAI API
+# - client is the blocking client (scripts, worker threads)
+# - async_client is used by the API. It is created once, so its connection pool (keep-alive) is shared by all requests.
+client = None
+async_client = None
 
-# Get response:
-def GPT_4o_response(image_bytes: bytes, prompt: str) -> str:
+def _client_settings() -> dict:
+    # Access the environment variable
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise RuntimeError("OPENAI_API_KEY is not set. See README -> Configure secrets.")
+    return {
+        "api_key": api_key,
+        "base_url": os.getenv("OPENAI_BASE_URL") or None,
+        "timeout": timeout,
+        "max_retries": 0,
+    }
+
+def get_client() -> OpenAI:
+    global client
+    if client is None:
+        client = OpenAI(**_client_settings())
+    return client
+
+def get_async_client() -> AsyncOpenAI:
+    global async_client
+    if async_client is None:
+        async_client = AsyncOpenAI(**_client_settings())
+    return async_client
+
+def _messages(image_bytes: bytes, prompt: str, mime_type: str) -> list:
     # Encode image to base64
     encoded_image = base64.b64encode(image_bytes).decode("utf-8")
 
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        messages=[
-            {
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": prompt},
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:image/png;base64,{encoded_image}",
-                            "detail": "high"
-                        }
+    return [
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": prompt},
+                {
+                    "type": "image_url",
+                    "image_url": {
+                        "url": f"data:{mime_type};base64,{encoded_image}",
+                        "detail": "high"
                     }
-                ]
-            }
-        ],
-        max_tokens=1024,
-        temperature=0.2,
+                }
+            ]
+        }
+    ]
+
+# structured=True: the answer is a JSON verdict held to the schema (OpenAI structured outputs, see verdicts.py),
+# so it is short and bounded by VERDICT_MAX_TOKENS
+def _completion_settings(structured: bool) -> dict:
+    if structured:
+        return {"max_tokens": VERDICT_MAX_TOKENS, "temperature": 0.2, "response_format": RESPONSE_FORMAT}
+    return {"max_tokens": 1024, "temperature": 0.2}
+
+# Get response:
+# mime_type should match the image bytes (see image_preprocessing.py)
+def GPT_4o_response(image_bytes: bytes, prompt: str, mime_type: str = "image/png", structured: bool = False) -> str:
+    response = get_client().chat.completions.create(
+        model="gpt-4o",
+        messages=_messages(image_bytes, prompt, mime_type),
+        **_completion_settings(structured),
     )
 
     return response.choices[0].message.content
+
+# Same as GPT_4o_response, but without blocking the event loop
+async def GPT_4o_response_async(image_bytes: bytes, prompt: str, mime_type: str = "image/png", structured: bool = False) -> str:
+    response = await get_async_client().chat.completions.create(
+        model="gpt-4o",
+        messages=_messages(image_bytes, prompt, mime_type),
+        **_completion_settings(structured),
+    )
+
+    return response.choices[0].message.content
+
+# Streaming variant: yields the text chunks as GPT-4o generates them (used by /evaluate_brand_compliance_stream)
+async def GPT_4o_response_stream(image_bytes: bytes, prompt: str, mime_type: str = "image/png"):
+    stream = await get_async_client().chat.completions.create(
+        model="gpt-4o",
+        messages=_messages(image_bytes, prompt, mime_type),
+        **_completion_settings(False),
+        stream=True,
+    )
+    try:
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    finally:
+        # The client may stop reading early (e.g. the browser went away): release the connection
+        await stream.close()
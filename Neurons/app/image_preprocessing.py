@@ -0,0 +1,185 @@
+import hashlib
+import os
+import struct
+import time
+from dataclasses import dataclass, field
+from io import BytesIO
+
+from PIL import Image, ImageOps
+
+# Image preprocessing shared by all model backends (runs before every model call)
+# - Caps the resolution per model. For GPT-4o the cap mirrors what the API does itself with detail="high"
+#   (fit in 2048x2048, then shortest side 768), so the model sees the same pixels, we just upload far fewer bytes.
+#   Qwen2.5-VL resizes to a max number of pixels in its processor, so we cap at that.
+# - Picks the format: PNG for images with transparency or few colours (logos, flat graphics - JPEG artifacts
+#   would blur text and colours), JPEG for photo-like renders. The MIME type follows the chosen format.
+# - Re-encoding strips metadata (EXIF, ICC, text chunks). EXIF orientation is applied first. When the upload is kept
+#   as it is (re-encoding wouldn't make it smaller), its metadata segments/chunks are dropped without re-encoding, so
+#   no EXIF (camera, GPS) or XMP is ever sent to a model API.
+# - Computes a SHA-256 of the original bytes and a 64-bit perceptual hash (dHash), so identical and
+#   near-identical images can be detected (see dedupe in main.py).
+
+# Per-model limits: max_side (longest side), max_short_side (shortest side), max_pixels (width * height)
+PROFILES = {
+    "gpt": {"max_side": 2048, "max_short_side": 768, "max_pixels": None},
+    "qwen": {"max_side": None, "max_short_side": None, "max_pixels": 1280 * 28 * 28},
+}
+
+JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "90"))
+
+@dataclass
+class PreparedImage:
+    data: bytes
+    mime_type: str
+    sha256: str            # of the original upload
+    phash: str             # 64-bit dHash as 16 hex chars
+    stats: dict = field(default_factory=dict)
+
+def _target_size(width: int, height: int, profile: dict) -> tuple[int, int]:
+    scale = 1.0
+    if profile.get("max_side"):
+        scale = min(scale, profile["max_side"] / max(width, height))
+    if profile.get("max_short_side"):
+        scale = min(scale, profile["max_short_side"] / min(width, height))
+    if profile.get("max_pixels"):
+        scale = min(scale, (profile["max_pixels"] / (width * height)) ** 0.5)
+    if scale >= 1.0:
+        return width, height
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+# dHash: compare neighbouring pixels of a 9x8 greyscale thumbnail -> 64 bits
+def perceptual_hash(image: Image.Image) -> str:
+    small = image.convert("L").resize((9, 8), Image.Resampling.LANCZOS)
+    pixels = small.tobytes()
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return f"{bits:016x}"
+
+def hamming_distance(hash_a: str, hash_b: str) -> int:
+    return bin(int(hash_a, 16) ^ int(hash_b, 16)).count("1")
+
+# Images seen so far, to find an earlier image with the same SHA-256 or (max_distance set) a perceptual hash at most
+# max_distance bits away. For the near lookup the 64-bit hash is split into max_distance + 1 bands: two hashes within
+# max_distance bits agree on at least one whole band, so only images sharing a band are compared, not all of them.
+class DuplicateIndex:
+    def __init__(self, max_distance: int | None = None):
+        self.max_distance = max_distance
+        self._exact = {}   # sha256 -> value
+        self._bands = {}   # (band, bits) -> [(seq, phash, value)]
+        self._seq = 0
+        bands = min(max_distance + 1, 64) if max_distance is not None else 0
+        self._spans = [(64 * i // bands, 64 * (i + 1) // bands) for i in range(bands)]
+
+    def _band_keys(self, phash: str):
+        bits = int(phash, 16)
+        return [(n, (bits >> start) & ((1 << (end - start)) - 1)) for n, (start, end) in enumerate(self._spans)]
+
+    # The value of the first image added that image duplicates, or None
+    def find(self, image: PreparedImage):
+        value = self._exact.get(image.sha256)
+        if value is not None or not self._spans:
+            return value
+        matches = [
+            (seq, value)
+            for key in self._band_keys(image.phash)
+            for seq, phash, value in self._bands.get(key, ())
+            if hamming_distance(phash, image.phash) <= self.max_distance
+        ]
+        return min(matches, key=lambda match: match[0])[1] if matches else None
+
+    def add(self, image: PreparedImage, value):
+        self._exact.setdefault(image.sha256, value)
+        for key in self._band_keys(image.phash):
+            self._bands.setdefault(key, []).append((self._seq, image.phash, value))
+        self._seq += 1
+
+def _has_transparency(image: Image.Image) -> bool:
+    if image.mode in ("RGBA", "LA"):
+        return image.getchannel("A").getextrema()[0] < 255
+    return image.mode == "P" and "transparency" in image.info
+
+# JPEG markers kept when stripping: JFIF (APP0) and Adobe (APP14, tells how the colours are encoded)
+_JPEG_KEEP_APP = {0xE0, 0xEE}
+
+# The upload's JPEG without APP1..APP15 (EXIF, XMP, ICC, IPTC, ...) and comments, the image data untouched
+def _strip_jpeg_metadata(data: bytes) -> bytes:
+    out, i = [data[:2]], 2
+    while i + 4 <= len(data):
+        if data[i] != 0xFF:
+            raise ValueError("Broken JPEG segment")
+        marker = data[i + 1]
+        if marker == 0xFF:  # fill byte
+            i += 1
+            continue
+        if marker == 0xDA:  # start of scan: the rest is image data
+            break
+        length = struct.unpack(">H", data[i + 2:i + 4])[0]
+        end = i + 2 + length
+        if not (0xE0 <= marker <= 0xEF or marker == 0xFE) or marker in _JPEG_KEEP_APP:
+            out.append(data[i:end])
+        i = end
+    out.append(data[i:])
+    return b"".join(out)
+
+# PNG chunks needed to show the image the same way, everything else (text, eXIf, iCCP, tIME, ...) is dropped
+_PNG_KEEP = {b"IHDR", b"PLTE", b"tRNS", b"gAMA", b"cHRM", b"sRGB", b"sBIT", b"pHYs", b"IDAT", b"IEND"}
+
+def _strip_png_metadata(data: bytes) -> bytes:
+    out, i = [data[:8]], 8
+    while i + 8 <= len(data):
+        length, kind = struct.unpack(">I4s", data[i:i + 8])
+        end = i + 12 + length  # length, type, data, CRC
+        if kind in _PNG_KEEP:
+            out.append(data[i:end])
+        i = end
+    return b"".join(out)
+
+def preprocess_image(image_bytes: bytes, profile_name: str = "gpt") -> PreparedImage:
+    started = time.perf_counter()
+    profile = PROFILES[profile_name]
+
+    image = Image.open(BytesIO(image_bytes))
+    original_format = image.format
+    original_size = image.size
+    upright = image.getexif().get(0x0112, 1) == 1  # no EXIF rotation to apply
+    image = ImageOps.exif_transpose(image)
+    phash = perceptual_hash(image)
+
+    size = _target_size(*image.size, profile)
+    transparent = _has_transparency(image)
+    image = image.convert("RGBA" if transparent else "RGB")
+    if size != image.size:
+        image = image.resize(size, Image.Resampling.LANCZOS)
+
+    # Few colours (logos, flat graphics) -> lossless PNG, photo-like -> JPEG
+    out = BytesIO()
+    if transparent or image.getcolors(maxcolors=256) is not None:
+        image.save(out, format="PNG", optimize=True)
+        mime_type = "image/png"
+    else:
+        image.save(out, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+        mime_type = "image/jpeg"
+    data = out.getvalue()
+
+    # Nothing was resized or rotated and re-encoding made it bigger: keep the upload's pixels, minus its metadata
+    if upright and size == original_size and len(data) >= len(image_bytes) and original_format in ("PNG", "JPEG"):
+        strip = _strip_png_metadata if original_format == "PNG" else _strip_jpeg_metadata
+        data, mime_type = strip(image_bytes), f"image/{original_format.lower()}"
+
+    return PreparedImage(
+        data=data,
+        mime_type=mime_type,
+        sha256=hashlib.sha256(image_bytes).hexdigest(),
+        phash=phash,
+        stats={
+            "original_bytes": len(image_bytes),
+            "processed_bytes": len(data),
+            "bytes_saved_pct": round(100 * (1 - len(data) / len(image_bytes)), 1) if image_bytes else 0.0,
+            "original_size": list(original_size),
+            "processed_size": list(size),
+            "mime_type": mime_type,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+        },
+    )
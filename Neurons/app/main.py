@@ -1,42 +1,358 @@
 from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Request, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from collections import deque
+from contextlib import asynccontextmanager
 from PIL import Image
 from io import BytesIO
-import logging, uuid
+import asyncio, functools, hashlib, json, logging, os, time, uuid
 
-#from app.image_evaluation_Qwen import Qwen_response
-#from app.compliance_prompt_Qwen import build_compliance_prompt_qwen
-from app.extract_pdf import extract_brand_compliance
+from app import creatives, executors, metrics, qwen_batching, uploads, verdicts
+from app.qwen_batching import QueueFullError
+from app.brand_kit_cache import BrandKitCache
+from app.brand_kit_store import BrandKitStore
 from app.compliance_prompt_gpt import build_compliance_prompt
-from app.image_evaluation_gpt import GPT_4o_response
+from app.model_backends import BackendUnavailableError, registry as model_registry
+from app.backend_router import BackendRouter
+from app.image_preprocessing import DuplicateIndex, PreparedImage, preprocess_image
+from app.result_cache import EvaluationResultCache, prompt_hash, result_key
+from app.colour_compliance import ENGINE_VERSION as COLOUR_ENGINE_VERSION, analyze_brand_colours, colour_facts_prompt
 
-app = FastAPI()
+# The handlers below never block the event loop themselves:
+# - PDF parsing runs in a process pool (see executors.py), local inference on the Qwen batching scheduler (see qwen_batching.py)
+# - OpenAI calls use the async client (shared connection pool, timeouts)
+# - SQLite lookups run in the default thread pool
+# - Model backends load lazily on first use. WARM_BACKENDS (comma separated model names) are loaded in the
+#   background at startup instead; GET /ready reports the load state of every backend.
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    model_registry.warm(_warm_backends())
+    yield
+    qwen_batching.shutdown()
+    executors.shutdown()
+
+def _warm_backends() -> list[str]:
+    return [name.strip() for name in os.getenv("WARM_BACKENDS", "").split(",") if name.strip()]
+
+app = FastAPI(lifespan=lifespan)
 logging.basicConfig(level=logging.INFO)
+metrics.configure_logging(os.getenv("LOG_FORMAT", "text"))  # LOG_FORMAT=json: structured logs
 log = logging.getLogger("neurons.api")
 
+# Request bodies above MAX_REQUEST_MB are rejected with 413 while they stream in (see uploads.py)
+app.add_middleware(uploads.UploadSizeLimitMiddleware)
+
+# Request latency, in-flight requests and the request_id of every request (see metrics.py)
+app.add_middleware(metrics.RequestMetricsMiddleware)
+
+# Cache of extracted brand kit requirements/prompts, keyed by a hash of the PDF bytes
+brand_kit_cache = BrandKitCache.from_env()
+
+# Registry of uploaded brand kits (SQLite file, see BRAND_KIT_DB)
+brand_kit_store = BrandKitStore.from_env()
+
+# Cache of model outputs, keyed by (image hash, prompt hash, model, prompt version)
+result_cache = EvaluationResultCache.from_env()
+
+# Timeouts, retries, circuit breaking, fallbacks and hedging around every model call (see backend_router.py).
+# Backends are looked up in the registry on every call.
+backend_router = BackendRouter.from_env(lambda name: model_registry.get(name))
+
+# Upper limit for the number of concurrent model calls in a batch (a request can ask for fewer)
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+
+# Max number of differing perceptual hash bits (out of 64) for two images to count as near-duplicates
+NEAR_DUPLICATE_DISTANCE = int(os.getenv("NEAR_DUPLICATE_DISTANCE", "4"))
+
+# Time to first byte of the streamed evaluations (ms, most recent streams), see GET /streaming/metrics
+_ttfb_samples = deque(maxlen=1000)
+
 @app.get("/")
 def home():
     return {"message": "Brand Compliance API is running"}
 
+# Hit/miss counters of the brand kit cache
+@app.get("/brand_kit_cache/stats")
+def brand_kit_cache_stats():
+    return brand_kit_cache.stats()
+
+# Readiness: the load state of every model backend. 503 until all backends in WARM_BACKENDS are ready.
+@app.get("/ready")
+def ready(response: Response):
+    backends = model_registry.status()
+    is_ready = all(backends.get(name, {}).get("state") == "ready" for name in _warm_backends())
+    if not is_ready:
+        response.status_code = 503
+    return {"ready": is_ready, "backends": backends}
+
+# Loads a backend in the background (e.g. right before a batch job), returns immediately
+@app.post("/backends/{model_name}/warm")
+def warm_backend(model_name: str):
+    backend = model_registry.get(model_name)
+    if backend is None:
+        raise HTTPException(status_code=404, detail=f"Unknown model: {model_name}")
+    backend.warm()
+    return {"model_name": model_name, **backend.status()}
+
+# Hit/miss counters of the evaluation result cache
+@app.get("/result_cache/stats")
+def result_cache_stats():
+    return result_cache.stats()
+
+# Latency percentiles, retries/timeouts/hedges and the circuit state of every backend the router has called
+@app.get("/backends/stats")
+def backend_stats():
+    return backend_router.stats()
+
+# Batch size / queue wait metrics of the local Qwen model's batching scheduler
+@app.get("/qwen/metrics")
+def qwen_metrics():
+    return qwen_batching.get_qwen_scheduler().metrics()
+
+# Cache and queue numbers, read on every scrape of GET /metrics
+metrics.registry.register(metrics.Gauge(
+    "neurons_cache_hit_ratio", "Share of lookups answered from the cache.", ("cache",),
+    fn=lambda: {("brand_kit",): brand_kit_cache.stats()["hit_ratio"], ("result",): result_cache.stats()["hit_ratio"]},
+))
+metrics.registry.register(metrics.Counter(
+    "neurons_cache_lookups_total", "Cache lookups by outcome.", ("cache", "outcome"),
+    fn=lambda: {
+        **{("brand_kit", outcome): brand_kit_cache.stats()[outcome] for outcome in ("hits", "disk_hits", "misses")},
+        **{("result", outcome): result_cache.stats()[outcome] for outcome in ("hits", "db_hits", "misses", "bypassed")},
+    },
+))
+metrics.registry.register(metrics.Gauge(
+    "neurons_qwen_queue_depth", "Requests waiting for the local Qwen model.",
+    fn=lambda: qwen_batching.get_qwen_scheduler().metrics()["queue_depth"],
+))
+
+# Prometheus text format: stage/request latency histograms, in-flight requests, cache hit ratios, Qwen queue depth
+@app.get("/metrics")
+def prometheus_metrics():
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+# The request_id set by the metrics middleware (X-Request-ID header if the client sent one)
+def _request_id(request: Request) -> str:
+    return metrics.request_id_var.get() or request.headers.get("X-Request-ID") or uuid.uuid4().hex
+
+# Time to first byte (request received -> first chunk of model output sent) of /evaluate_brand_compliance_stream
+@app.get("/streaming/metrics")
+def streaming_metrics():
+    samples = sorted(_ttfb_samples)
+    return {
+        "streams": len(samples),
+        "ttfb_ms": {
+            "avg": sum(samples) / len(samples) if samples else 0.0,
+            "p50": samples[int(0.5 * (len(samples) - 1))] if samples else 0.0,
+            "p95": samples[int(0.95 * (len(samples) - 1))] if samples else 0.0,
+            "max": samples[-1] if samples else 0.0,
+        },
+    }
+
 # API function to extract brand compliance information from the PDF.
 # Testing can be done by requesting the following to the API: curl -X POST http://127.0.0.1:8000/extract_brand_compliance -F "file=@C:\Users\ander\OneDrive - University of Copenhagen\Desktop\Neurons\Neurons_brand_kit.pdf"
 @app.post("/extract_brand_compliance")
 async def upload_pdf(file: UploadFile = File(...)):
-    contents = await file.read()  # this gives you raw bytes
-    results = extract_brand_compliance(contents)  # pass only the bytes
+    async with uploads.spooled(file) as pdf:  # temp file + hash, never the whole PDF in memory (see uploads.py)
+        results = await brand_kit_cache.aget_or_extract(pdf.path, pdf.sha256)  # only parses the PDF if it has not been seen before
     return {"Requirements": results, "message": "Requirements"}
 
 # API function to build a compliance prompt.
 # Test: curl -X POST http://127.0.0.1:8000/extract_brand_compliance -F "file=@C:\Users\ander\OneDrive - University of Copenhagen\Desktop\Neurons\Neurons_brand_kit.pdf"
 @app.post("/build_compliance_prompt")
 async def upload_pdf(file: UploadFile = File(...)):
-    contents = await file.read()  # raw bytes from PDF
-    compliance_data = extract_brand_compliance(contents)  # your updated version that handles bytes
-    prompt = build_compliance_prompt(compliance_data)     # build string prompt from dict
+    async with uploads.spooled(file) as pdf:
+        prompt = await brand_kit_cache.aget_or_build_prompt(pdf.path, build_compliance_prompt, "gpt", pdf.sha256)  # cached by PDF hash
     return {
         "Prompt": prompt,
         "message": "Brand compliance prompt successfully generated."
     }
 
+# Logic regarding choosing of model, driven by the backend registry (see model_backends.py)
+# - Returns the ModelBackend. backend.infer(image_bytes, prompt, mime_type) loads the backend on first use.
+# - backend.prompt_name is the name the prompt is cached/stored under (see brand_kit_cache.py and brand_kit_store.py)
+def _select_model(model_name: str, request_id: str):
+    backend = model_registry.get(model_name)
+    if backend is not None:
+        return backend
+
+    # client error: log as warning, include request_id
+    log.warning(
+        "Unknown model",
+        extra={"request_id": request_id},
+    )
+    raise HTTPException(status_code=400, detail=f"Unknown model: {model_name}")
+
+# The prompt builder and the name its prompts are cached under. structured=true asks for a JSON verdict
+# (see verdicts.py), cached as a separate prompt.
+def _prompt_builder(backend, structured: bool = False):
+    if structured:
+        return functools.partial(backend.prompt_builder, structured=True), f"{backend.prompt_name}{verdicts.PROMPT_VARIANT}"
+    return backend.prompt_builder, backend.prompt_name
+
+# The prompt of a brand kit from the registry (pre-rendered when it was registered, except the structured ones).
+# A prompt stored with another template version than the backend's (or none, for kits registered before versions were
+# stored) is rebuilt from the requirements.
+def _kit_prompt(kit: dict, backend, structured: bool = False) -> str:
+    if structured:
+        return backend.prompt_builder(kit["requirements"], structured=True)
+    stored = kit["prompts"].get(backend.prompt_name)
+    if stored and kit["prompt_versions"].get(backend.prompt_name) == backend.prompt_version:
+        return stored
+    return backend.prompt_builder(kit["requirements"])
+
+# Per-criterion pass/fail and total of a model output (None if it can't be parsed)
+def _verdict(model_output: str):
+    verdict = verdicts.parse_verdict(model_output)
+    return verdict.to_dict() if verdict is not None else None
+
+# Downscales/re-encodes the upload for the backend (see image_preprocessing.py), off the event loop
+# (Pillow releases the GIL while decoding/resizing/encoding). Uploads Pillow can't read are a client error.
+async def _prepare_image(image_bytes: bytes, backend) -> PreparedImage:
+    try:
+        with metrics.span("preprocess", profile=backend.image_profile):
+            return await asyncio.to_thread(preprocess_image, image_bytes, backend.image_profile)
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid image: {e}")
+
+# Measures the image's colours against the brand kit (see colour_compliance.py), off the event loop
+async def _analyze_colours(image_bytes: bytes, brand_data: dict) -> dict:
+    try:
+        with metrics.span("colour_analysis"):
+            return await asyncio.to_thread(analyze_brand_colours, image_bytes, brand_data)
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid image: {e}")
+
+# colour_facts=true: the colour analysis is appended to the prompt as measured facts.
+# Returns (prompt, prompt_variant, analysis); the variant keeps those results apart in the result cache.
+async def _with_colour_facts(prompt: str, image_bytes: bytes, brand_data: dict, colour_facts: bool):
+    if not colour_facts:
+        return prompt, "", None
+    analysis = await _analyze_colours(image_bytes, brand_data)
+    return prompt + colour_facts_prompt(analysis), f"+colour{COLOUR_ENGINE_VERSION}", analysis
+
+# Evaluates one image through the result cache
+# - Returns (model_output, cached, preprocessing stats, model_used). On a cache hit the image is not even preprocessed
+#   (stats = None). model_used is the backend that answered: a fallback (see backend_router.py) answered with another
+#   model than requested, so that answer is not cached.
+# - use_cache=False skips the lookup, the fresh result still replaces the cached one
+# - prompt_variant is added to the prompt version in the cache key (for prompts with extra, per-image content)
+# - image_digest: the image's sha256, if it was already hashed while reading the upload
+# - brand_kit_hash is only recorded with the result, the key has the prompt's hash (see result_cache.py)
+# - structured: the prompt asks for a JSON verdict, the backend limits the output to it (see verdicts.py)
+async def _evaluate_image(backend, image_bytes: bytes, prompt: str, brand_kit_hash: str, use_cache: bool = True, prompt_variant: str = "", image_digest: str | None = None, structured: bool = False):
+    image_digest = image_digest or hashlib.sha256(image_bytes).hexdigest()
+    key = result_key(image_digest, prompt_hash(prompt), backend.name, backend.prompt_version + prompt_variant)
+    if use_cache:
+        cached = await result_cache.aget(key)
+        if cached is not None:
+            return cached["model_output"], True, None, backend.name
+    else:
+        result_cache.record_bypass()
+
+    image = await _prepare_image(image_bytes, backend)
+    with metrics.span("model_call", model=backend.name):
+        model_output, model_used = await backend_router.infer(backend, image.data, prompt, image.mime_type, structured)
+    if model_used == backend.name:
+        await result_cache.aput(key, {"model_output": model_output}, brand_kit_hash)
+    return model_output, False, image.stats, model_used
+
+# Reads the creative (the image_file upload) of the evaluate endpoints. Returns (image_bytes, image_digest, pages):
+# - a PDF creative is spooled to a temp file and rendered page by page in the PDF process pool (image_bytes = None)
+# - a multi-frame image (GIF, TIFF, APNG, WebP) is split into its frames
+# - pages is None for a plain single image, which is evaluated as it was uploaded
+async def _read_creative(image_file: UploadFile, dpi: int | None = None):
+    is_pdf = creatives.is_pdf(await image_file.read(1024))
+    try:
+        if is_pdf:
+            async with uploads.spooled(image_file, max_bytes=uploads.MAX_IMAGE_UPLOAD_BYTES, what="Creative") as creative:
+                with metrics.span("render_pages", source="pdf"):
+                    pages = await creatives.arender_pdf_pages(creative.path, creatives.clamp_dpi(dpi))
+            return None, None, pages
+
+        image_bytes, image_digest = await uploads.read_limited(image_file)
+        try:
+            with metrics.span("render_pages", source="frames"):
+                pages = await asyncio.to_thread(creatives.split_frames, image_bytes)
+        except (OSError, Image.DecompressionBombError):
+            pages = None  # not an image Pillow can read: reported by _prepare_image
+        return image_bytes, image_digest, pages
+    except (ValueError, RuntimeError) as e:  # too many pages, or a broken PDF (PyMuPDF raises RuntimeErrors)
+        raise HTTPException(status_code=400, detail=f"Invalid creative: {e}")
+
+# Evaluates every page of a multi-page creative, BATCH_MAX_CONCURRENCY at a time. Identical pages are evaluated once
+# (they carry "duplicate_of"). Returns (page results, document summary, see creatives.document_verdict).
+async def _evaluate_pages(backend, pages, prompt, brand_kit_hash, brand_data, use_cache, colour_facts, structured):
+    semaphore = asyncio.Semaphore(BATCH_MAX_CONCURRENCY)
+    representative = creatives.duplicate_of(pages)
+
+    async def evaluate_page(page):
+        async with semaphore:
+            page_prompt, variant, colour_analysis = await _with_colour_facts(prompt, page.data, brand_data, colour_facts)
+            variant = (verdicts.PROMPT_VARIANT if structured else "") + variant
+            model_output, cached, preprocessing, model_used = await _evaluate_image(
+                backend, page.data, page_prompt, brand_kit_hash, use_cache, variant, page.sha256, structured,
+            )
+        return {
+            "page": page.number,
+            "size": list(page.size),
+            "model_output": model_output,
+            "cached": cached,
+            "model_used": model_used,
+            "preprocessing": preprocessing,
+            "colour_analysis": colour_analysis,
+        }
+
+    tasks = [asyncio.ensure_future(evaluate_page(page)) for page in pages if representative[page.number] == page.number]
+    try:
+        evaluated = {result["page"]: result for result in await asyncio.gather(*tasks)}
+    finally:
+        for task in tasks:
+            task.cancel()  # one page failed: don't leave the others running
+
+    results, page_verdicts = [], {}
+    for page in pages:
+        rep = representative[page.number]
+        page_verdicts[page.number] = verdict = verdicts.parse_verdict(evaluated[rep]["model_output"])
+        result = dict(evaluated[rep], page=page.number, size=list(page.size), verdict=verdict.to_dict() if verdict else None)
+        if rep != page.number:
+            result["duplicate_of"] = rep
+        results.append(result)
+    return results, creatives.document_verdict(page_verdicts)
+
+# The evaluation part of the evaluate endpoints' responses, for a single image or a multi-page creative
+async def _evaluate_upload(backend, creative, prompt, brand_kit_hash, brand_data, use_cache, colour_facts, structured) -> dict:
+    image_bytes, image_digest, pages = creative
+    if pages is not None:
+        results, document = await _evaluate_pages(
+            backend, pages, prompt, brand_kit_hash, brand_data, use_cache, colour_facts, structured,
+        )
+        return {
+            "prompt_used": prompt,
+            "model_output": "\n\n".join(f"Page {r['page']}:\n{r['model_output']}" for r in results),
+            "verdict": document["verdict"],  # a criterion passes only if it passes on every page
+            "cached": all(r["cached"] for r in results),
+            "model_used": ",".join(sorted({r["model_used"] for r in results})),
+            "preprocessing": None,            # per page, under "pages"
+            "colour_analysis": None,
+            "pages": results,                 # one result per page/frame
+            "document": document,             # failing pages per criterion, pass rates over the pages
+        }
+
+    prompt, variant, colour_analysis = await _with_colour_facts(prompt, image_bytes, brand_data, colour_facts)
+    variant = (verdicts.PROMPT_VARIANT if structured else "") + variant
+    model_output, cached, preprocessing, model_used = await _evaluate_image(
+        backend, image_bytes, prompt, brand_kit_hash, use_cache, variant, image_digest, structured,
+    )
+    return {
+        "prompt_used": prompt,
+        "model_output": model_output,
+        "verdict": _verdict(model_output),  # per-criterion pass/fail and total, parsed from the output
+        "cached": cached,                   # True if served from the evaluation result cache
+        "model_used": model_used,           # differs from model_name if a fallback backend answered
+        "preprocessing": preprocessing,     # size savings of the image preprocessing (None when cached)
+        "colour_analysis": colour_analysis, # only with colour_facts=true
+    }
+
 # The function that will get called in the frontend to evaluate brand compliance, given an image and a PDF
 # Error handling in terms of uploading is mostly handled in the frontend, and its associated backend (C# code)
 #    - Look at "image_evaluation.razor" for more information 
@@ -47,36 +363,35 @@ async def evaluate_brand_compliance(
     request: Request,
     response: Response,
     brand_kit: UploadFile = File(...), # PDF
-    image_file: UploadFile = File(...), # Image
+    image_file: UploadFile = File(...), # Image, multi-frame image or PDF creative (see creatives.py)
     model_name: str = Form(...),
+    use_cache: bool = Form(True), # False: always call the model (the result still refreshes the cache)
+    colour_facts: bool = Form(False), # True: add the measured image colours to the prompt (see colour_compliance.py)
+    structured: bool = Form(False), # True: the model answers with a JSON verdict (see verdicts.py)
+    dpi: int | None = Form(None), # resolution PDF creatives are rendered at (default CREATIVE_DPI)
 ):
     # Small amount of logging
-    request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+    request_id = _request_id(request)
+    metrics.observe_since_request_start("upload")
     response.headers["X-Request-ID"] = request_id
 
     try:
-        brand_bytes = await brand_kit.read() # Bytes of brand compliance
-        image_bytes = await image_file.read() # Bytes of image
-
-        # Extract brand compliance from the pdf byes
-        brand_data = extract_brand_compliance(brand_bytes)
-
-        # Logic regarding choosing of model.
-        # As of now, only the "ChatGPT-4o" is available, but it is obviously quite easy to implement others
-        if model_name == "ChatGPT-4o":
-            prompt = build_compliance_prompt(brand_data)
-            model_output = GPT_4o_response(image_bytes, prompt)
-        else:
-            # client error: log as warning, include request_id
-            log.warning(
-                "Unknown model",
-                extra={"request_id": request_id},
-            )
-            raise HTTPException(status_code=400, detail=f"Unknown model: {model_name}")
+        creative = await _read_creative(image_file, dpi) # Bytes of image (+ hash), or its pages
+        backend = _select_model(model_name, request_id)
+
+        # The PDF goes to a temp file (hashed on the way), which is removed once the prompt is built
+        async with uploads.spooled(brand_kit) as pdf:
+            brand_digest = pdf.sha256
+            # Extraction + prompt building is skipped entirely if this brand kit has been seen before
+            prompt_builder, prompt_name = _prompt_builder(backend, structured)
+            prompt = await brand_kit_cache.aget_or_build_prompt(pdf.path, prompt_builder, prompt_name, brand_digest)
+            brand_data = await brand_kit_cache.aget_or_extract(pdf.path, brand_digest) if colour_facts else None
+        evaluation = await _evaluate_upload(
+            backend, creative, prompt, brand_digest, brand_data, use_cache, colour_facts, structured,
+        )
 
         result = {
-            "prompt_used": prompt,
-            "model_output": model_output,
+            **evaluation,
             "status": "ok",                # status and request_id is ignored in the UI/frontend, however can be helpful for logging
             "request_id": request_id,      
         }
@@ -92,10 +407,427 @@ async def evaluate_brand_compliance(
 
     except HTTPException:
         raise
+    except QueueFullError:
+        log.warning("Local model queue full", extra={"request_id": request_id})
+        raise HTTPException(status_code=503, detail="Model is busy, try again later")
+    except BackendUnavailableError as e:
+        log.warning("Model backend unavailable", extra={"request_id": request_id})
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         # unexpected error:
         log.exception(
             "evaluate_brand_compliance failed",
             extra={"request_id": request_id},
         )
-        raise HTTPException(status_code=500, detail="Internal server error")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+# ---------- Colour compliance ----------
+# Answers the "Colour Palette" and "Logo Colour" criteria from the pixels alone (no model call, milliseconds).
+# The brand kit is uploaded as brand_kit or referenced by brand_kit_id.
+# Test: curl -X POST http://127.0.0.1:8000/colour_compliance -F "brand_kit=@Neurons_brand_kit.pdf" -F "image_file=@neurons_1.png"
+@app.post("/colour_compliance")
+async def colour_compliance(
+    image_file: UploadFile = File(...), # Image
+    brand_kit: UploadFile | None = File(None), # PDF
+    brand_kit_id: str | None = Form(None),
+):
+    if brand_kit_id is not None:
+        kit = await asyncio.to_thread(brand_kit_store.get, brand_kit_id)
+        if kit is None:
+            raise HTTPException(status_code=404, detail=f"Unknown brand kit: {brand_kit_id}")
+        brand_data = kit["requirements"]
+    elif brand_kit is not None:
+        async with uploads.spooled(brand_kit) as pdf:
+            brand_data = await brand_kit_cache.aget_or_extract(pdf.path, pdf.sha256)
+    else:
+        raise HTTPException(status_code=400, detail="Either brand_kit or brand_kit_id is required")
+
+    image_bytes, _ = await uploads.read_limited(image_file)
+    return await _analyze_colours(image_bytes, brand_data)
+
+# ---------- Streaming evaluation ----------
+# Same as /evaluate_brand_compliance_wAPI, but the model output is sent as Server-Sent Events while it is generated,
+# so the UI can show the verdict as it is written instead of a spinner. Events:
+# - "start": request_id, cached, preprocessing
+# - "token": {"text": ...} for every chunk of model output (a cached result arrives as a single chunk)
+# - "done": model_output (the full text), prompt_used, cached, ttfb_ms, total_ms
+# - "error": {"detail": ...} if the model call fails after the stream started
+# Client errors (unknown model, invalid image) are still answered with a 4xx before the stream starts.
+# ttfb_ms is measured from the request being received to the first chunk of model output being sent.
+# Test: curl -N -X POST http://127.0.0.1:8000/evaluate_brand_compliance_stream -F "brand_kit=@Neurons_brand_kit.pdf" -F "image_file=@neurons_1.png" -F "model_name=ChatGPT-4o"
+@app.post("/evaluate_brand_compliance_stream")
+async def evaluate_brand_compliance_stream(
+    request: Request,
+    brand_kit: UploadFile = File(...), # PDF
+    image_file: UploadFile = File(...), # Image
+    model_name: str = Form(...),
+    use_cache: bool = Form(True),
+):
+    started = time.perf_counter()
+    request_id = _request_id(request)
+    metrics.observe_since_request_start("upload")
+
+    image_bytes, image_digest = await uploads.read_limited(image_file)
+    backend = _select_model(model_name, request_id)
+
+    async with uploads.spooled(brand_kit) as pdf:
+        brand_digest = pdf.sha256
+        try:
+            prompt = await brand_kit_cache.aget_or_build_prompt(pdf.path, backend.prompt_builder, backend.prompt_name, brand_digest)
+        except Exception:
+            log.exception("evaluate_brand_compliance_stream failed", extra={"request_id": request_id})
+            raise HTTPException(status_code=500, detail="Internal server error")
+
+    key = result_key(image_digest, prompt_hash(prompt), backend.name, backend.prompt_version)
+    cached = await result_cache.aget(key) if use_cache else None
+    if not use_cache:
+        result_cache.record_bypass()
+    image = await _prepare_image(image_bytes, backend) if cached is None else None
+
+    return StreamingResponse(
+        _stream_events(backend, image, prompt, key, brand_digest, cached, started, request_id),
+        media_type="text/event-stream",
+        headers={"X-Request-ID": request_id, "Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def _cached_chunks(model_output: str):
+    yield model_output
+
+async def _stream_events(backend, image, prompt, key, brand_digest, cached, started, request_id):
+    yield _sse("start", {
+        "request_id": request_id,
+        "cached": cached is not None,
+        "preprocessing": image.stats if image is not None else None,
+    })
+
+    if cached is not None:
+        chunks = _cached_chunks(cached["model_output"])
+    else:
+        chunks = backend_router.stream(backend, image.data, prompt, image.mime_type)
+    parts = []
+    ttfb_ms = None
+    model_started = time.perf_counter()
+    try:
+        async for chunk in chunks:
+            if ttfb_ms is None:
+                ttfb_ms = round((time.perf_counter() - started) * 1000, 1)
+                _ttfb_samples.append(ttfb_ms)
+                metrics.observe_stage("stream_ttfb", ttfb_ms / 1000)
+            parts.append(chunk)
+            yield _sse("token", {"text": chunk})
+    except QueueFullError:
+        log.warning("Local model queue full", extra={"request_id": request_id})
+        yield _sse("error", {"detail": "Model is busy, try again later"})
+        return
+    except BackendUnavailableError as e:
+        log.warning("Model backend unavailable", extra={"request_id": request_id})
+        yield _sse("error", {"detail": str(e)})
+        return
+    except Exception:
+        log.exception("evaluate_brand_compliance_stream failed", extra={"request_id": request_id})
+        yield _sse("error", {"detail": "Internal server error"})
+        return
+    finally:
+        await chunks.aclose()  # also when the client disconnected mid-stream
+
+    model_output = "".join(parts)
+    if cached is None:
+        metrics.observe_stage("model_call", time.perf_counter() - model_started, model=backend.name)
+        await result_cache.aput(key, {"model_output": model_output}, brand_digest)
+
+    log.info("evaluate_brand_compliance_stream ok", extra={"request_id": request_id})
+    yield _sse("done", {
+        "prompt_used": prompt,
+        "model_output": model_output,
+        "status": "ok",
+        "request_id": request_id,
+        "cached": cached is not None,
+        "ttfb_ms": ttfb_ms,
+        "total_ms": round((time.perf_counter() - started) * 1000, 1),
+    })
+
+# ---------- Brand kit registry ----------
+# Upload a brand kit once and reference it by its id afterwards, instead of re-uploading the PDF with every image.
+# Test: curl -X POST http://127.0.0.1:8000/brand_kits -F "file=@Neurons_brand_kit.pdf"
+@app.post("/brand_kits")
+async def register_brand_kit(file: UploadFile = File(...)):
+    async with uploads.spooled(file) as pdf:
+        # The section index (with page hashes) is stored for the next version of the kit
+        requirements, index = await brand_kit_cache.aextract_version(pdf.path, None, pdf.sha256)
+        kit = await asyncio.to_thread(
+            brand_kit_store.add, pdf.path, file.filename, lambda _: requirements, pdf.sha256, index,
+        )
+    return {
+        "brand_kit_id": kit["brand_kit_id"],
+        "Requirements": kit["requirements"],
+        "message": "Brand kit registered.",
+    }
+
+# Registers a revised PDF as a new version of a brand kit. Only the pages that changed since the previous version are
+# read again (see extract_pdf.py), and "changes" lists the sections whose requirements changed. Evaluations cached for
+# the previous version stay valid for the new one unless one of those sections changed (see result_cache.py).
+# Test: curl -X POST http://127.0.0.1:8000/brand_kits/<id>/versions -F "file=@Neurons_brand_kit_v2.pdf"
+@app.post("/brand_kits/{brand_kit_id}/versions")
+async def register_brand_kit_version(brand_kit_id: str, file: UploadFile = File(...)):
+    previous_index = await asyncio.to_thread(brand_kit_store.section_index, brand_kit_id)
+    if previous_index is None and await asyncio.to_thread(brand_kit_store.get, brand_kit_id) is None:
+        raise HTTPException(status_code=404, detail=f"Unknown brand kit: {brand_kit_id}")
+
+    async with uploads.spooled(file) as pdf:
+        requirements, index = await brand_kit_cache.aextract_version(pdf.path, previous_index, pdf.sha256)
+        kit = await asyncio.to_thread(
+            brand_kit_store.add, pdf.path, file.filename, lambda _: requirements, pdf.sha256, index, brand_kit_id,
+        )
+    return {
+        "brand_kit_id": kit["brand_kit_id"],
+        "parent_id": kit["parent_id"],
+        "version": kit["version"],
+        "changes": kit["changes"],  # changed sections, pages read again / reused
+        "Requirements": kit["requirements"],
+        "message": "Brand kit version registered.",
+    }
+
+@app.get("/brand_kits")
+def list_brand_kits():
+    return {"brand_kits": brand_kit_store.list()}
+
+@app.get("/brand_kits/{brand_kit_id}")
+def get_brand_kit(brand_kit_id: str):
+    kit = brand_kit_store.get(brand_kit_id)
+    if kit is None:
+        raise HTTPException(status_code=404, detail=f"Unknown brand kit: {brand_kit_id}")
+    return kit
+
+@app.delete("/brand_kits/{brand_kit_id}")
+def delete_brand_kit(brand_kit_id: str):
+    if not brand_kit_store.delete(brand_kit_id):
+        raise HTTPException(status_code=404, detail=f"Unknown brand kit: {brand_kit_id}")
+    return {"brand_kit_id": brand_kit_id, "message": "Brand kit deleted."}
+
+# Same as /evaluate_brand_compliance_wAPI, but the brand kit is referenced by the id returned from POST /brand_kits
+# Test: curl -X POST http://127.0.0.1:8000/evaluate_brand_compliance_by_id -F "brand_kit_id=<id>" -F "image_file=@neurons_1.png" -F "model_name=ChatGPT-4o"
+@app.post("/evaluate_brand_compliance_by_id")
+async def evaluate_brand_compliance_by_id(
+    request: Request,
+    response: Response,
+    brand_kit_id: str = Form(...),
+    image_file: UploadFile = File(...), # Image, multi-frame image or PDF creative
+    model_name: str = Form(...),
+    use_cache: bool = Form(True),
+    colour_facts: bool = Form(False),
+    structured: bool = Form(False),
+    dpi: int | None = Form(None),
+):
+    request_id = _request_id(request)
+    metrics.observe_since_request_start("upload")
+    response.headers["X-Request-ID"] = request_id
+
+    kit = await asyncio.to_thread(brand_kit_store.get, brand_kit_id)
+    if kit is None:
+        log.warning("Unknown brand kit", extra={"request_id": request_id})
+        raise HTTPException(status_code=404, detail=f"Unknown brand kit: {brand_kit_id}")
+
+    try:
+        creative = await _read_creative(image_file, dpi) # Bytes of image (+ hash), or its pages
+
+        backend = _select_model(model_name, request_id)
+        # Prompts are pre-rendered when the brand kit is registered
+        prompt = _kit_prompt(kit, backend, structured)
+        # The brand kit id is the hash of the PDF, so cached results are shared with /evaluate_brand_compliance_wAPI
+        evaluation = await _evaluate_upload(
+            backend, creative, prompt, brand_kit_id, kit["requirements"], use_cache, colour_facts, structured,
+        )
+
+        log.info("evaluate_brand_compliance_by_id ok", extra={"request_id": request_id})
+        return {
+            **evaluation,
+            "status": "ok",
+            "request_id": request_id,
+            "brand_kit_id": brand_kit_id,
+        }
+
+    except HTTPException:
+        raise
+    except QueueFullError:
+        log.warning("Local model queue full", extra={"request_id": request_id})
+        raise HTTPException(status_code=503, detail="Model is busy, try again later")
+    except BackendUnavailableError as e:
+        log.warning("Model backend unavailable", extra={"request_id": request_id})
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception:
+        log.exception(
+            "evaluate_brand_compliance_by_id failed",
+            extra={"request_id": request_id},
+        )
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+# ---------- Batch evaluation ----------
+# Evaluates many images against one brand kit (either uploaded as brand_kit, or referenced by brand_kit_id).
+# - At most max_concurrency model calls are in flight at a time.
+# - Results are streamed back as NDJSON (one JSON object per line) in the order they complete, followed by a
+#   final summary line with "done": true.
+# - dedupe: "exact" (default) evaluates byte-identical images once, "near" also reuses the result for images with
+#   (almost) the same perceptual hash, "none" evaluates everything. Reused results carry "duplicate_of".
+# - Every result carries its parsed "verdict"; the summary line aggregates them (average total, pass rate per
+#   criterion). structured=true asks the model for JSON verdicts (see verdicts.py).
+# Test: curl -N -X POST http://127.0.0.1:8000/evaluate_brand_compliance_batch -F "brand_kit=@Neurons_brand_kit.pdf" -F "image_files=@neurons_1.png" -F "image_files=@neurons_2.png" -F "model_name=ChatGPT-4o"
+@app.post("/evaluate_brand_compliance_batch")
+async def evaluate_brand_compliance_batch(
+    request: Request,
+    image_files: list[UploadFile] = File(...), # Images
+    model_name: str = Form(...),
+    brand_kit: UploadFile | None = File(None), # PDF
+    brand_kit_id: str | None = Form(None),
+    max_concurrency: int | None = Form(None),
+    dedupe: str = Form("exact"),
+    use_cache: bool = Form(True),
+    structured: bool = Form(False),
+):
+    request_id = _request_id(request)
+    metrics.observe_since_request_start("upload")
+
+    if dedupe not in ("none", "exact", "near"):
+        raise HTTPException(status_code=400, detail=f"Unknown dedupe mode: {dedupe}")
+    backend = _select_model(model_name, request_id)
+
+    # Resolve the brand kit before streaming starts, so client errors are still proper 4xx responses
+    if brand_kit_id is not None:
+        kit = await asyncio.to_thread(brand_kit_store.get, brand_kit_id)
+        if kit is None:
+            raise HTTPException(status_code=404, detail=f"Unknown brand kit: {brand_kit_id}")
+        prompt = _kit_prompt(kit, backend, structured)
+        brand_digest = brand_kit_id
+    elif brand_kit is not None:
+        async with uploads.spooled(brand_kit) as pdf:
+            brand_digest = pdf.sha256
+            prompt_builder, prompt_name = _prompt_builder(backend, structured)
+            prompt = await brand_kit_cache.aget_or_build_prompt(pdf.path, prompt_builder, prompt_name, brand_digest)
+    else:
+        raise HTTPException(status_code=400, detail="Either brand_kit or brand_kit_id is required")
+
+    concurrency = max(1, min(max_concurrency or BATCH_MAX_CONCURRENCY, BATCH_MAX_CONCURRENCY))
+
+    # The uploads are read up front, the form is closed once the handler returns
+    images = [(image.filename, (await uploads.read_limited(image))[0]) for image in image_files]
+
+    return StreamingResponse(
+        _batch_results(images, prompt, backend, brand_digest, concurrency, dedupe, use_cache, request_id, structured),
+        media_type="application/x-ndjson",
+        headers={"X-Request-ID": request_id},
+    )
+
+# Preprocessing, dedupe and model calls are pipelined, so the first results go out while later images are still
+# being decoded:
+# - Every image is preprocessed (at most `concurrency` at a time) and its upload bytes are dropped right after.
+# - Dedupe decisions are made in upload order (image i waits for images 0..i-1 to be decided, not evaluated), so the
+#   first of a set of duplicates is the one evaluated. A DuplicateIndex finds them without comparing every pair.
+# - A unique image is evaluated as soon as it is decided; a duplicate gets its representative's result once there is one.
+async def _batch_results(images, prompt, backend, brand_digest, concurrency, dedupe, use_cache, request_id, structured=False):
+    prepare_slots, model_slots = asyncio.Semaphore(concurrency), asyncio.Semaphore(concurrency)
+    prompt_digest = prompt_hash(prompt)
+    index = None if dedupe == "none" else DuplicateIndex(NEAR_DUPLICATE_DISTANCE if dedupe == "near" else None)
+    decided = [asyncio.Event() for _ in images]
+    finished = asyncio.Queue()  # (index, representative index, result)
+    results, followers = {}, {}  # representative -> its result / duplicates waiting for it
+
+    async def prepare(i):
+        filename, image_bytes = images[i]
+        async with prepare_slots:
+            try:
+                with metrics.span("preprocess", profile=backend.image_profile):
+                    return await asyncio.to_thread(preprocess_image, image_bytes, backend.image_profile)
+            except Exception:
+                return None  # reported as an error for this image
+            finally:
+                images[i] = (filename, None)
+
+    async def evaluate(i, image):
+        filename = images[i][0]
+        prompt_version = backend.prompt_version + (verdicts.PROMPT_VARIANT if structured else "")
+        key = result_key(image.sha256, prompt_digest, backend.name, prompt_version)
+        cached = await result_cache.aget(key) if use_cache else None
+        if cached is not None:
+            return {"index": i, "filename": filename, "status": "ok", "model_output": cached["model_output"],
+                    "cached": True, "latency_ms": 0.0, "preprocessing": image.stats}
+        if not use_cache:
+            result_cache.record_bypass()
+
+        async with model_slots:
+            started = time.perf_counter()
+            try:
+                with metrics.span("model_call", model=backend.name):
+                    model_output, model_used = await backend_router.infer(backend, image.data, prompt, image.mime_type, structured)
+                if model_used == backend.name:
+                    await result_cache.aput(key, {"model_output": model_output}, brand_digest)
+                result = {"index": i, "filename": filename, "status": "ok", "model_output": model_output,
+                          "cached": False, "model_used": model_used}
+            except Exception as e:
+                log.exception("batch item failed", extra={"request_id": request_id})
+                result = {"index": i, "filename": filename, "status": "error", "error": str(e), "cached": False}
+            result["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            result["preprocessing"] = image.stats
+            return result
+
+    async def handle(i):
+        image = await prepare(i)
+        try:
+            if i:
+                await decided[i - 1].wait()
+            if image is None:
+                finished.put_nowait((i, i, {"index": i, "filename": images[i][0], "status": "error",
+                                            "error": "Invalid image", "latency_ms": 0.0}))
+                return
+            representative = index.find(image) if index is not None else None
+            if representative is not None:
+                if representative in results:
+                    finished.put_nowait((i, representative, results[representative]))
+                else:
+                    followers.setdefault(representative, []).append(i)
+                return
+            if index is not None:
+                index.add(image, i)
+        finally:
+            decided[i].set()
+
+        result = await evaluate(i, image)
+        verdict = verdicts.parse_verdict(result.get("model_output"))
+        result["verdict"] = verdict.to_dict() if verdict is not None else None
+        results[i] = result
+        for duplicate in [i, *followers.pop(i, [])]:
+            finished.put_nowait((duplicate, i, result))
+
+    tasks = [asyncio.create_task(handle(i)) for i in range(len(images))]
+    failed = 0
+    model_calls = 0
+    parsed = []  # verdict of every image, for the summary
+    try:
+        for _ in range(len(images)):
+            i, representative, result = await finished.get()
+            item = dict(result, index=i, filename=images[i][0])
+            if i != representative:
+                item["duplicate_of"] = representative
+            else:
+                model_calls += result.get("cached") is False
+            failed += item["status"] != "ok"
+            if item["status"] == "ok":
+                parsed.append(verdicts.parse_verdict(result.get("model_output")))
+            yield json.dumps(item) + "\n"
+    finally:
+        # Client went away (or something failed): don't leave model calls running in the background
+        for task in tasks:
+            task.cancel()
+
+    log.info("evaluate_brand_compliance_batch ok", extra={"request_id": request_id})
+    yield json.dumps({
+        "done": True,
+        "count": len(images),
+        "failed": failed,
+        "model_calls": model_calls,
+        "verdicts": verdicts.aggregate(parsed),  # average total and pass rate per criterion
+        "prompt_used": prompt,
+        "request_id": request_id,
+    }) + "\n"
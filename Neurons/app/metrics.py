@@ -0,0 +1,264 @@
+import json
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from starlette.routing import Match
+
+# Latency instrumentation and a Prometheus endpoint (GET /metrics), without extra dependencies
+# - span("stage") times a block of the hot path (PDF open, per-section extraction, prompt build, preprocessing, model
+#   call, queue wait, ...). Every span is observed in the neurons_stage_duration_seconds histogram and logged as a
+#   structured "stage" log line carrying the request_id of the request it belongs to.
+# - The request_id lives in a context variable set by RequestMetricsMiddleware, so code deep in the call stack (and
+#   asyncio.to_thread workers, which copy the context) log it without passing it around. Work in the PDF process pool
+#   can't see it: extract_pdf.py returns its timings instead and the caller records them (see brand_kit_cache.py).
+# - The middleware also tracks request latency per endpoint and the number of requests in flight.
+# - Gauges can be backed by a function, evaluated on every scrape (cache hit ratios, queue depth).
+# - LOG_FORMAT=json switches the log output to one JSON object per line, including request_id and the other fields.
+
+log = logging.getLogger("neurons.timing")
+
+request_id_var = ContextVar("request_id", default=None)
+_request_started_var = ContextVar("request_started", default=None)
+
+# Seconds. Covers everything from cache lookups to slow model calls.
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _label_text(labelnames, values) -> str:
+    if not labelnames:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)) + "}"
+
+def _number(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}", *self._samples()]
+
+# Counters and gauges. fn (optional) is called on every scrape instead of using the stored values;
+# it returns a number, or a dict {label values tuple: number}
+class _ValueMetric(_Metric):
+    def __init__(self, name, help_text, labelnames=(), fn=None):
+        super().__init__(name, help_text, labelnames)
+        self.fn = fn
+        self._values = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        if self.fn is not None:
+            try:
+                value = self.fn()
+            except Exception:
+                log.exception("Metric %s failed", self.name)
+                return []
+            items = value.items() if isinstance(value, dict) else [((), value)]
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        return [f"{self.name}{_label_text(self.labelnames, key)} {_number(value)}" for key, value in items]
+
+class Counter(_ValueMetric):
+    kind = "counter"
+
+class Gauge(_ValueMetric):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._series = {}  # label values -> [bucket counts, sum, count]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def _samples(self):
+        with self._lock:
+            items = [(key, (list(s[0]), s[1], s[2])) for key, s in self._series.items()]
+        lines = []
+        for key, (counts, total, count) in items:
+            for bound, bucket_count in zip(self.buckets, counts):
+                labels = _label_text(self.labelnames + ("le",), key + (_number(bound),))
+                lines.append(f"{self.name}_bucket{labels} {bucket_count}")
+            labels = _label_text(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_number(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def get(self, name: str):
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.register(Histogram(
+    "neurons_stage_duration_seconds", "Time spent per hot-path stage.", ("stage",),
+))
+REQUEST_SECONDS = registry.register(Histogram(
+    "neurons_request_duration_seconds", "HTTP request latency (until the last byte of the response).",
+    ("method", "endpoint", "status"),
+))
+IN_FLIGHT = registry.register(Gauge(
+    "neurons_requests_in_flight", "HTTP requests currently being handled.", ("endpoint",),
+))
+
+# Records a stage duration (seconds) measured elsewhere, e.g. in a worker process or thread.
+# request_id defaults to the one of the current request.
+# The fields are in the message for the text log format, and separate (extra) for LOG_FORMAT=json.
+def observe_stage(stage: str, seconds: float, request_id: str | None = None, **fields):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    request_id = request_id or request_id_var.get()
+    duration_ms = round(seconds * 1000, 2)
+    log.info(
+        "stage %s %.1fms request_id=%s%s",
+        stage, duration_ms, request_id, "".join(f" {key}={value}" for key, value in fields.items()),
+        extra={"request_id": request_id, "stage": stage, "duration_ms": duration_ms, **fields},
+    )
+
+@contextmanager
+def span(stage: str, **fields):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - started, **fields)
+
+# Time from the request arriving to now, recorded as a stage. Called at the start of a handler, this is the
+# upload + multipart parsing time (FastAPI reads the whole form before the handler runs).
+def observe_since_request_start(stage: str):
+    started = _request_started_var.get()
+    if started is not None:
+        observe_stage(stage, time.perf_counter() - started)
+
+# ---------- ASGI middleware ----------
+# The route template of the request (/brand_kits/{brand_kit_id}, not the raw path), so the number of series stays bounded
+def _endpoint(scope) -> str:
+    app = scope.get("app")
+    for route in getattr(getattr(app, "router", None), "routes", []):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", "unmatched")
+    return "unmatched"
+
+# Pure ASGI (not BaseHTTPMiddleware), so streamed responses are timed until their last chunk
+class RequestMetricsMiddleware:
+    def __init__(self, app, skip_paths=("/metrics",)):
+        self.app = app
+        self.skip_paths = set(skip_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.skip_paths:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        request_id = headers.get(b"x-request-id", b"").decode("latin-1") or uuid.uuid4().hex
+        scope.setdefault("state", {})["request_id"] = request_id
+        request_id_token = request_id_var.set(request_id)
+        started = time.perf_counter()
+        started_token = _request_started_var.set(started)
+        status = {"code": 500}
+        endpoint = _endpoint(scope)
+        IN_FLIGHT.inc(endpoint=endpoint)
+        finished = False
+
+        def finish():
+            nonlocal finished
+            if finished:
+                return
+            finished = True
+            REQUEST_SECONDS.observe(
+                time.perf_counter() - started, method=scope["method"], endpoint=endpoint, status=status["code"],
+            )
+            IN_FLIGHT.dec(endpoint=endpoint)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                finish()
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            finish()
+            request_id_var.reset(request_id_token)
+            _request_started_var.reset(started_token)
+
+# ---------- Logging ----------
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+# One JSON object per log line: time, level, logger, message, request_id and every `extra` field
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", None) or request_id_var.get(),
+        }
+        entry.update({k: v for k, v in vars(record).items() if k not in _RECORD_FIELDS and k not in entry})
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+def configure_logging(log_format: str = "text"):
+    if log_format == "json":
+        for handler in logging.getLogger().handlers:
+            handler.setFormatter(JsonFormatter())
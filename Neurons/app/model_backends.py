@@ -0,0 +1,193 @@
+import asyncio
+import logging
+import threading
+import time
+
+from app import compliance_prompt_gpt, compliance_prompt_Qwen
+from app.compliance_prompt_gpt import build_compliance_prompt
+from app.compliance_prompt_Qwen import build_compliance_prompt_qwen
+
+log = logging.getLogger("neurons.backends")
+
+# Registry of the model backends the API can evaluate images with
+# - Each backend has a name (the model_name sent by the frontend), the prompt it uses, and a loader.
+# - The loader runs on first use (or when the backend is warmed explicitly, e.g. at startup in a background thread)
+#   and returns an async function (image_bytes, prompt, mime_type) -> model output. infer(..., structured=True) calls it
+#   with structured=True as well: the prompt asks for a JSON verdict and the backend bounds the output to it
+#   (see verdicts.py). The keyword is only passed when set, so model functions without it keep working.
+# - image_profile is the preprocessing profile for the backend's images (see image_preprocessing.py).
+# - prompt_version is the version of the prompt template, part of the evaluation cache key (see result_cache.py).
+# - stream_fn (optional) is an async generator function (image_bytes, prompt, mime_type) yielding the output in chunks
+#   as it is generated. It is only called after the backend is loaded. Backends without one stream the whole output
+#   as a single chunk.
+# - Nothing heavy happens at import time, so the service starts fast and unused backends are never loaded.
+# - New backends are added with registry.register(ModelBackend(...)) at the bottom of this file.
+
+NOT_LOADED, LOADING, READY, FAILED = "not_loaded", "loading", "ready", "failed"
+
+class BackendUnavailableError(RuntimeError):
+    pass
+
+class ModelBackend:
+    def __init__(
+        self,
+        name: str,
+        prompt_name: str,
+        prompt_builder,
+        loader,
+        description: str = "",
+        image_profile: str = "gpt",
+        prompt_version: str = "1",
+        stream_fn=None,
+    ):
+        self.name = name
+        self.prompt_name = prompt_name        # the name the prompt is cached/stored under
+        self.prompt_builder = prompt_builder
+        self.prompt_version = prompt_version
+        self.loader = loader
+        self.stream_fn = stream_fn
+        self.image_profile = image_profile
+        self.description = description
+        self.state = NOT_LOADED
+        self.error = None
+        self.load_seconds = None
+        self._model_fn = None
+        self._lock = threading.Lock()
+
+    # Loads the backend (blocking, thread-safe, only once). A failed load is retried on the next call.
+    def load(self):
+        with self._lock:
+            if self._model_fn is not None:
+                return self._model_fn
+            self.state, self.error = LOADING, None
+            started = time.perf_counter()
+            try:
+                model_fn = self.loader()
+            except Exception as e:
+                self.state, self.error = FAILED, str(e)
+                log.exception("Loading backend %s failed", self.name)
+                raise BackendUnavailableError(f"Model backend {self.name} is unavailable: {e}") from e
+            self.load_seconds = round(time.perf_counter() - started, 3)
+            self._model_fn, self.state = model_fn, READY
+            log.info("Backend %s ready after %.1fs", self.name, self.load_seconds)
+            return model_fn
+
+    # Starts loading in a background thread (e.g. at startup), returns immediately
+    def warm(self):
+        if self.state in (READY, LOADING):
+            return
+
+        def _warm():
+            try:
+                self.load()
+            except BackendUnavailableError:
+                pass  # already logged, the state says "failed"
+
+        threading.Thread(target=_warm, name=f"warm-{self.name}", daemon=True).start()
+
+    async def infer(self, image_bytes: bytes, prompt: str, mime_type: str = "image/png", structured: bool = False) -> str:
+        model_fn = self._model_fn or await asyncio.to_thread(self.load)
+        if structured:
+            return await model_fn(image_bytes, prompt, mime_type, structured=True)
+        return await model_fn(image_bytes, prompt, mime_type)
+
+    async def infer_stream(self, image_bytes: bytes, prompt: str, mime_type: str = "image/png"):
+        if self.stream_fn is None:
+            yield await self.infer(image_bytes, prompt, mime_type)
+            return
+        if self._model_fn is None:
+            await asyncio.to_thread(self.load)
+        stream = self.stream_fn(image_bytes, prompt, mime_type)
+        try:
+            async for chunk in stream:
+                yield chunk
+        finally:
+            await stream.aclose()
+
+    def status(self) -> dict:
+        return {
+            "state": self.state,
+            "error": self.error,
+            "load_seconds": self.load_seconds,
+            "description": self.description,
+        }
+
+class BackendRegistry:
+    def __init__(self):
+        self._backends = {}
+
+    def register(self, backend: ModelBackend):
+        self._backends[backend.name] = backend
+
+    def get(self, name: str) -> ModelBackend | None:
+        return self._backends.get(name)
+
+    def names(self) -> list[str]:
+        return list(self._backends)
+
+    # Warms the given backends (unknown names are logged and skipped)
+    def warm(self, names):
+        for name in names:
+            backend = self.get(name)
+            if backend is None:
+                log.warning("Cannot warm unknown backend %s", name)
+                continue
+            backend.warm()
+
+    def status(self) -> dict:
+        return {name: backend.status() for name, backend in self._backends.items()}
+
+# ---------- Loaders ----------
+def _load_gpt():
+    from app import image_evaluation_gpt as gpt
+    gpt.get_async_client()  # fails here (not on every request) if OPENAI_API_KEY is missing
+    return gpt.GPT_4o_response_async
+
+def _load_qwen():
+    from app import image_evaluation_Qwen as qwen
+    from app.qwen_batching import Qwen_response_batched
+    from app.verdicts import VERDICT_MAX_TOKENS
+    qwen.load_model()
+
+    # Qwen decodes the bytes itself, the MIME type is not needed.
+    # Structured verdicts stop at the end of the JSON object, at most VERDICT_MAX_TOKENS.
+    async def infer(image_bytes, prompt, mime_type=None, structured=False):
+        if structured:
+            return await Qwen_response_batched(image_bytes, prompt, max_new_tokens=VERDICT_MAX_TOKENS, structured=True)
+        return await Qwen_response_batched(image_bytes, prompt)
+    return infer
+
+# ---------- Streaming ----------
+async def _stream_gpt(image_bytes, prompt, mime_type="image/png"):
+    from app import image_evaluation_gpt as gpt
+    stream = gpt.GPT_4o_response_stream(image_bytes, prompt, mime_type)
+    try:
+        async for chunk in stream:
+            yield chunk
+    finally:
+        await stream.aclose()
+
+# Streaming requests bypass the micro-batcher (a batch only returns once every sequence is done).
+# The blocking TextIteratorStreamer is read from a worker thread, chunk by chunk.
+# If the client goes away, stop ends the generation at the next token (and releases generate_lock). The generator
+# can't be closed instead: a worker thread may still be inside next() on it.
+async def _stream_qwen(image_bytes, prompt, mime_type=None):
+    from app import image_evaluation_Qwen as qwen
+    stop = threading.Event()
+    chunks = qwen.Qwen_response_stream(image_bytes, prompt, stop=stop)
+    done = object()
+    try:
+        while (chunk := await asyncio.to_thread(next, chunks, done)) is not done:
+            yield chunk
+    finally:
+        stop.set()
+
+registry = BackendRegistry()
+registry.register(ModelBackend(
+    "ChatGPT-4o", "gpt", build_compliance_prompt, _load_gpt, "OpenAI GPT-4o (remote)",
+    prompt_version=compliance_prompt_gpt.PROMPT_VERSION, stream_fn=_stream_gpt,
+))
+registry.register(ModelBackend(
+    "Gwen-3b", "qwen", build_compliance_prompt_qwen, _load_qwen, "Qwen2.5-VL-3B (local, micro-batched)",
+    image_profile="qwen", prompt_version=compliance_prompt_Qwen.PROMPT_VERSION, stream_fn=_stream_qwen,
+))
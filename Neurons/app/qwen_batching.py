@@ -0,0 +1,216 @@
+import asyncio
+import os
+import queue
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future
+
+from app import metrics
+
+# Dynamic micro-batching in front of the local Qwen2.5-VL model
+# - Requests (image, prompt) are put on a bounded queue. A single worker thread takes the first waiting request,
+#   then keeps collecting requests until the batch is full (max_batch_size) or the window (max_wait_ms) has passed.
+# - The whole batch is run as one padded `generate` call, and the outputs are handed back to the waiting requests.
+# - On a CPU-only host this turns N concurrent 3B generations into one batched generation, instead of N serial ones.
+# - The worker thread is also the dedicated local inference executor: only one `generate` runs at a time.
+#
+# Settings (environment): QWEN_MAX_BATCH_SIZE, QWEN_BATCH_WINDOW_MS, QWEN_MAX_QUEUE_DEPTH
+
+STOP_POLL_SECONDS = 0.1  # how often an idle worker checks whether the scheduler was closed
+
+class QueueFullError(RuntimeError):
+    pass
+
+class _Request:
+    __slots__ = ("image_bytes", "prompt", "max_new_tokens", "structured", "future", "enqueued_at", "request_id")
+
+    def __init__(self, image_bytes, prompt, max_new_tokens, structured=False):
+        self.image_bytes = image_bytes
+        self.prompt = prompt
+        self.max_new_tokens = max_new_tokens
+        self.structured = structured
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+        self.request_id = metrics.request_id_var.get()  # the worker thread has no request context
+
+class BatchScheduler:
+    # run_batch(image_bytes_list, prompts, max_new_tokens, structured) -> list of outputs (same order)
+    # structured: per request, whether it asked for a JSON verdict
+    def __init__(self, run_batch, max_batch_size: int = 4, max_wait_ms: float = 25, max_queue_depth: int = 64):
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue(maxsize=max_queue_depth)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._closed = False
+        self._stop = threading.Event()  # not a sentinel on the queue: a put on the full, bounded queue would block
+
+        # Metrics
+        self._batch_sizes = Counter()
+        self._queue_waits = deque(maxlen=1000)  # seconds, most recent requests
+        self._batch_latencies = deque(maxlen=1000)  # seconds spent in run_batch
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+
+    @classmethod
+    def from_env(cls, run_batch):
+        return cls(
+            run_batch,
+            max_batch_size=int(os.getenv("QWEN_MAX_BATCH_SIZE", "4")),
+            max_wait_ms=float(os.getenv("QWEN_BATCH_WINDOW_MS", "25")),
+            max_queue_depth=int(os.getenv("QWEN_MAX_QUEUE_DEPTH", "64")),
+        )
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._worker, name="qwen-batcher", daemon=True)
+                self._thread.start()
+
+    # Queues one request and returns a concurrent.futures.Future with the model output.
+    # Raises QueueFullError when max_queue_depth requests are already waiting.
+    def submit(self, image_bytes: bytes, prompt: str, max_new_tokens: int = 512, structured: bool = False) -> Future:
+        if self._closed:
+            raise RuntimeError("The scheduler is closed")
+        self._ensure_worker()
+        request = _Request(image_bytes, prompt, max_new_tokens, structured)
+        try:
+            self._queue.put_nowait(request)
+        except queue.Full:
+            with self._lock:
+                self._rejected += 1
+            raise QueueFullError("Local model queue is full, try again later")
+        return request.future
+
+    async def infer(self, image_bytes: bytes, prompt: str, max_new_tokens: int = 512, structured: bool = False) -> str:
+        return await asyncio.wrap_future(self.submit(image_bytes, prompt, max_new_tokens, structured))
+
+    # Takes the first request (waiting until there is one, or the scheduler is closed), then collects more until the
+    # batch is full or the window has passed
+    def _collect_batch(self):
+        while True:
+            if self._stop.is_set():
+                return None
+            try:
+                first = self._queue.get(timeout=STOP_POLL_SECONDS)
+                break
+            except queue.Empty:
+                continue
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _worker(self):
+        while True:
+            batch = self._collect_batch()
+            if batch is None:
+                return
+            # Requests that were cancelled while waiting are dropped from the batch
+            batch = [r for r in batch if r.future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            started = time.perf_counter()
+            for r in batch:
+                metrics.observe_stage("queue_wait", started - r.enqueued_at, request_id=r.request_id)
+            try:
+                outputs = self.run_batch(
+                    [r.image_bytes for r in batch],
+                    [r.prompt for r in batch],
+                    max(r.max_new_tokens for r in batch),
+                    [r.structured for r in batch],
+                )
+                if len(outputs) != len(batch):
+                    raise RuntimeError(f"run_batch returned {len(outputs)} outputs for {len(batch)} requests")
+            except Exception as e:
+                for r in batch:
+                    r.future.set_exception(e)
+                failed, outputs = len(batch), None
+            else:
+                for r, output in zip(batch, outputs):
+                    r.future.set_result(output)
+                failed = 0
+            finished = time.perf_counter()
+            metrics.observe_stage("model_batch", finished - started, batch_size=len(batch))
+
+            with self._lock:
+                self._batch_sizes[len(batch)] += 1
+                self._queue_waits.extend(started - r.enqueued_at for r in batch)
+                self._batch_latencies.append(finished - started)
+                self._completed += len(batch) - failed
+                self._failed += failed
+
+    # Stops the worker after the batch it is running (waits at most `timeout` seconds for it). Requests still in the
+    # queue fail with RuntimeError.
+    def close(self, timeout: float = 5):
+        self._closed = True
+        self._stop.set()
+        while True:
+            try:
+                request = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if request.future.set_running_or_notify_cancel():
+                request.future.set_exception(RuntimeError("The scheduler is closed"))
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            waits = sorted(self._queue_waits)
+            batches = sum(self._batch_sizes.values())
+            return {
+                "max_batch_size": self.max_batch_size,
+                "batch_window_ms": self.max_wait * 1000,
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth": self._queue.maxsize,
+                "batches": batches,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "batch_size_counts": dict(sorted(self._batch_sizes.items())),
+                "avg_batch_size": (sum(k * v for k, v in self._batch_sizes.items()) / batches) if batches else 0.0,
+                "queue_wait_ms": {
+                    "avg": 1000 * sum(waits) / len(waits) if waits else 0.0,
+                    "p95": 1000 * waits[int(0.95 * (len(waits) - 1))] if waits else 0.0,
+                    "max": 1000 * waits[-1] if waits else 0.0,
+                },
+                "avg_batch_latency_ms": 1000 * sum(self._batch_latencies) / len(self._batch_latencies) if self._batch_latencies else 0.0,
+            }
+
+# ---------- The scheduler in front of the Qwen model ----------
+# Created on first use, so the model (torch/transformers) is only imported when a Qwen request comes in
+_qwen_scheduler = None
+_qwen_lock = threading.Lock()
+
+def _run_qwen_batch(image_bytes_list, prompts, max_new_tokens, structured):
+    from app.image_evaluation_Qwen import Qwen_response_batch
+    return Qwen_response_batch(image_bytes_list, prompts, max_new_tokens=max_new_tokens, structured=structured)
+
+def get_qwen_scheduler() -> BatchScheduler:
+    global _qwen_scheduler
+    with _qwen_lock:
+        if _qwen_scheduler is None:
+            _qwen_scheduler = BatchScheduler.from_env(_run_qwen_batch)
+        return _qwen_scheduler
+
+async def Qwen_response_batched(image_bytes: bytes, prompt: str, max_new_tokens: int = 512, structured: bool = False) -> str:
+    return await get_qwen_scheduler().infer(image_bytes, prompt, max_new_tokens, structured)
+
+def shutdown():
+    global _qwen_scheduler
+    with _qwen_lock:
+        scheduler, _qwen_scheduler = _qwen_scheduler, None
+    if scheduler is not None:
+        scheduler.close()
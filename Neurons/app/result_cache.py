@@ -0,0 +1,158 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from pathlib import Path
+
+from app.brand_kit_cache import LRUCache
+
+# Cache of evaluation results
+# - Creative teams re-submit the same image against the same brand kit many times while iterating, and every
+#   evaluation is a multi-second model call. Results are cached by
+#   (image content hash, prompt hash, model name, prompt template version).
+# - The prompt is built from the brand kit's requirements, so keying by its hash (instead of the hash of the PDF) keeps
+#   the results of a brand kit valid across new versions of it that didn't change any section in the prompt (e.g. new
+#   imagery), while a changed section (fonts, safe zone, colours) changes the prompt and invalidates them. The SQLite
+#   tier still records the brand kit hash of every result.
+# - In-memory LRU (size + TTL), plus an optional SQLite tier (RESULT_CACHE_DB) which survives restarts.
+#   The SQLite tier uses the same TTL and is trimmed to RESULT_CACHE_DB_MAX_ENTRIES (oldest first).
+# - A request can bypass the lookup (use_cache=false in main.py); the fresh result still replaces the cached one.
+
+def result_key(image_sha256: str, prompt_sha256: str, model_name: str, prompt_version: str) -> str:
+    raw = json.dumps([image_sha256, prompt_sha256, model_name, prompt_version])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def prompt_hash(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+class EvaluationResultCache:
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl_seconds: float | None = 86400,
+        db_path: str | Path | None = None,
+        max_db_entries: int = 100_000,
+    ):
+        self.memory = LRUCache(max_entries, ttl_seconds)
+        self.ttl_seconds = ttl_seconds
+        self.db_path = Path(db_path) if db_path else None
+        self.max_db_entries = max_db_entries
+        self.hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self._lock = threading.Lock()
+        self._writes_since_trim = 0
+
+        if self.db_path is not None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            with closing(self._connect()) as conn, conn:
+                conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS results (
+                        key TEXT PRIMARY KEY,
+                        brand_kit_hash TEXT NOT NULL,
+                        created_at REAL NOT NULL,
+                        value TEXT NOT NULL
+                    )
+                    """
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS results_created_at ON results (created_at)")
+                conn.execute("CREATE INDEX IF NOT EXISTS results_brand_kit ON results (brand_kit_hash)")
+
+    # Settings are read from the environment (see .env.example)
+    @classmethod
+    def from_env(cls):
+        ttl = float(os.getenv("RESULT_CACHE_TTL", "86400"))
+        return cls(
+            max_entries=int(os.getenv("RESULT_CACHE_SIZE", "1024")),
+            ttl_seconds=ttl if ttl > 0 else None,
+            db_path=os.getenv("RESULT_CACHE_DB") or None,
+            max_db_entries=int(os.getenv("RESULT_CACHE_DB_MAX_ENTRIES", "100000")),
+        )
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def _db_get(self, key: str):
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT created_at, value FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        created_at, value = row
+        if self.ttl_seconds is not None and time.time() - created_at > self.ttl_seconds:
+            return None
+        return json.loads(value)
+
+    def _db_put(self, key: str, brand_kit_hash: str, value):
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO results (key, brand_kit_hash, created_at, value) VALUES (?, ?, ?, ?)",
+                (key, brand_kit_hash, time.time(), json.dumps(value)),
+            )
+            # Trimming is a full index scan, so only do it every now and then
+            self._writes_since_trim += 1
+            if self._writes_since_trim >= 100:
+                self._writes_since_trim = 0
+                conn.execute(
+                    "DELETE FROM results WHERE key IN "
+                    "(SELECT key FROM results ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_db_entries,),
+                )
+
+    # Returns the cached result or None (memory first, then SQLite)
+    def get(self, key: str):
+        value = self.memory.get(key)
+        if value is not None:
+            with self._lock:
+                self.hits += 1
+            return value
+
+        if self.db_path is not None:
+            value = self._db_get(key)
+            if value is not None:
+                self.memory.put(key, value)
+                with self._lock:
+                    self.db_hits += 1
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, value, brand_kit_hash: str = ""):
+        self.memory.put(key, value)
+        if self.db_path is not None:
+            self._db_put(key, brand_kit_hash, value)
+
+    # Async variants for the API: memory hits are answered directly, SQLite runs in a worker thread
+    async def aget(self, key: str):
+        if self.db_path is None:
+            return self.get(key)
+        return await asyncio.to_thread(self.get, key)
+
+    async def aput(self, key: str, value, brand_kit_hash: str = ""):
+        if self.db_path is None:
+            return self.put(key, value, brand_kit_hash)
+        await asyncio.to_thread(self.put, key, value, brand_kit_hash)
+
+    def record_bypass(self):
+        with self._lock:
+            self.bypassed += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.db_hits + self.misses
+            return {
+                "hits": self.hits,
+                "db_hits": self.db_hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "hit_ratio": (self.hits + self.db_hits) / lookups if lookups else 0.0,
+                "memory_entries": len(self.memory),
+                "db_enabled": self.db_path is not None,
+            }
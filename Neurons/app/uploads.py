@@ -0,0 +1,157 @@
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+from contextlib import asynccontextmanager
+
+from fastapi import HTTPException
+
+# Upload handling with bounded memory, also for 50 MB brand books and many concurrent uploads
+# - Starlette already spools multipart file parts to a temporary file (in memory up to 1 MB, then on disk). The handlers
+#   used to read() every upload into memory, and the PDF bytes were then copied again to open them with PyMuPDF and
+#   once more (pickled) for every hand-off to the PDF process pool.
+# - spooled() copies the upload in UPLOAD_CHUNK_SIZE chunks to a named temp file (UPLOAD_TMP_DIR), hashing the chunks
+#   on the way and giving up with 413 once the size limit is exceeded. The PDF is then opened from that path
+#   (PyMuPDF reads the pages it needs from the file) and only the path goes to the process pool. The file is removed
+#   when the block ends.
+# - Images get decoded anyway, so read_limited() reads them into memory, in chunks and within MAX_IMAGE_UPLOAD_MB.
+# - UploadSizeLimitMiddleware rejects request bodies above MAX_REQUEST_MB (by Content-Length, or counted while a
+#   chunked body streams in) before the multipart parser spools them anywhere.
+
+MB = 1024 * 1024
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(MB)))
+MAX_PDF_UPLOAD_BYTES = int(float(os.getenv("MAX_PDF_UPLOAD_MB", "200")) * MB)
+MAX_IMAGE_UPLOAD_BYTES = int(float(os.getenv("MAX_IMAGE_UPLOAD_MB", "50")) * MB)
+MAX_REQUEST_BYTES = int(float(os.getenv("MAX_REQUEST_MB", "500")) * MB)
+
+def _too_large(what: str, max_bytes: int) -> HTTPException:
+    return HTTPException(status_code=413, detail=f"{what} is larger than {max_bytes / MB:g} MB")
+
+# An upload copied to a temp file. sha256 is the hash of the content (= pdf_hash of the bytes).
+class SpooledUpload:
+    def __init__(self, path: str, size: int, sha256: str, filename: str | None):
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+        self.filename = filename
+
+    def read_bytes(self) -> bytes:
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def remove(self):
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+def _copy_to_temp(source, max_bytes: int, suffix: str, what: str):
+    hasher = hashlib.sha256()
+    size = 0
+    fd, path = tempfile.mkstemp(suffix=suffix, prefix="upload-", dir=os.getenv("UPLOAD_TMP_DIR") or None)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while chunk := source.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise _too_large(what, max_bytes)
+                hasher.update(chunk)
+                out.write(chunk)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return path, size, hasher.hexdigest()
+
+# Copies the upload to a temp file (off the event loop) and yields the SpooledUpload; the file is removed afterwards
+@asynccontextmanager
+async def spooled(upload, max_bytes: int = None, suffix: str = ".pdf", what: str = "Brand kit"):
+    max_bytes = MAX_PDF_UPLOAD_BYTES if max_bytes is None else max_bytes
+    await upload.seek(0)
+    path, size, digest = await asyncio.to_thread(_copy_to_temp, upload.file, max_bytes, suffix, what)
+    spool = SpooledUpload(path, size, digest, upload.filename)
+    try:
+        yield spool
+    finally:
+        spool.remove()
+
+def _read_limited(source, max_bytes: int, what: str):
+    hasher = hashlib.sha256()
+    chunks, size = [], 0
+    while chunk := source.read(UPLOAD_CHUNK_SIZE):
+        size += len(chunk)
+        if size > max_bytes:
+            raise _too_large(what, max_bytes)
+        hasher.update(chunk)
+        chunks.append(chunk)
+    return b"".join(chunks), hasher.hexdigest()
+
+# Reads an (image) upload into memory within the size limit. Returns (bytes, sha256).
+async def read_limited(upload, max_bytes: int = None, what: str = "Image"):
+    max_bytes = MAX_IMAGE_UPLOAD_BYTES if max_bytes is None else max_bytes
+    await upload.seek(0)
+    return await asyncio.to_thread(_read_limited, upload.file, max_bytes, what)
+
+# ---------- ASGI middleware ----------
+class _BodyTooLarge(Exception):
+    pass
+
+# Pure ASGI, so the body is checked while it streams in (413 instead of spooling gigabytes to disk first)
+class UploadSizeLimitMiddleware:
+    def __init__(self, app, max_bytes: int = None):
+        self.app = app
+        self.max_bytes = MAX_REQUEST_BYTES if max_bytes is None else max_bytes
+
+    async def _reject(self, send):
+        body = json.dumps({"detail": f"Request body is larger than {self.max_bytes / MB:g} MB"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.max_bytes <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        try:
+            declared = int(headers.get(b"content-length", b"0"))
+        except ValueError:
+            declared = 0
+        if declared > self.max_bytes:
+            await self._reject(send)
+            return
+
+        received = 0
+        exceeded = False
+        started = False
+
+        async def receive_wrapper():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    exceeded = True
+                    raise _BodyTooLarge()
+            return message
+
+        # FastAPI turns errors while parsing the form into a 400; answer those with the 413 instead
+        async def send_wrapper(message):
+            nonlocal started
+            if exceeded:
+                if not started:
+                    started = True
+                    await self._reject(send)
+                return
+            started = True
+            await send(message)
+
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        except _BodyTooLarge:
+            if not started:
+                await self._reject(send)
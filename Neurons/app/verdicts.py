@@ -0,0 +1,198 @@
+import json
+import os
+import re
+from dataclasses import asdict, dataclass, field
+
+# Structured compliance verdicts
+# - The four criteria of the compliance prompts, as a JSON schema. With structured=true the prompt asks for a single
+#   JSON object instead of prose (JSON_RESPONSE_FORMAT), GPT-4o is held to the schema with OpenAI structured outputs
+#   (RESPONSE_FORMAT) and Qwen stops generating as soon as the object is complete (json_complete). Both get at most
+#   VERDICT_MAX_TOKENS instead of the 512/1024 tokens of a free-text answer.
+# - parse_verdict turns a model output into typed per-criterion pass/fail plus the total. It reads the JSON verdicts,
+#   and also the free-text format ("- Font Style: ✅ – ..." / "**Total Score: X/4**"), so older (cached) results can be
+#   aggregated as well. Model outputs are the answer only (Qwen's is decoded without the prompt).
+# - Bump SCHEMA_VERSION when the schema or JSON_RESPONSE_FORMAT change (it is part of the result cache key).
+
+SCHEMA_VERSION = "2"
+VERDICT_MAX_TOKENS = int(os.getenv("VERDICT_MAX_TOKENS", "256"))
+
+# JSON key -> the criterion's name in the prompts
+CRITERIA = {
+    "font_style": "Font Style",
+    "logo_safe_zone": "Logo Safe Zone",
+    "logo_colour": "Logo Colour",
+    "colour_palette": "Colour Palette",
+}
+
+_CRITERION_SCHEMA = {
+    "type": "object",
+    "properties": {"pass": {"type": "boolean"}, "reason": {"type": "string"}},
+    "required": ["pass", "reason"],
+    "additionalProperties": False,
+}
+
+VERDICT_SCHEMA = {
+    "type": "object",
+    "properties": {**{key: _CRITERION_SCHEMA for key in CRITERIA}, "total": {"type": "integer"}},
+    "required": [*CRITERIA, "total"],
+    "additionalProperties": False,
+}
+
+# response_format of the OpenAI chat completions API (strict: the output always matches the schema)
+RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "brand_compliance_verdict", "strict": True, "schema": VERDICT_SCHEMA},
+}
+
+# Added to the prompt version in the result cache key for structured evaluations
+PROMPT_VARIANT = f"+json{SCHEMA_VERSION}"
+
+# Replaces the free-text response format at the end of the prompts
+JSON_RESPONSE_FORMAT = (
+    "**Your Response Format:**\n"
+    "Answer with a single JSON object like the example below and nothing else. \"pass\" is true or false, "
+    "keep every reason under 15 words, \"total\" is the number of passed criteria.\n"
+    + json.dumps({
+        **{key: {"pass": True, "reason": f"Why the {name.lower()} passed or failed"} for key, name in CRITERIA.items()},
+        "total": len(CRITERIA),
+    })
+)
+
+@dataclass
+class CriterionVerdict:
+    passed: bool | None  # None: the criterion is missing from the output
+    reason: str = ""
+
+@dataclass
+class Verdict:
+    criteria: dict = field(default_factory=dict)  # JSON key -> CriterionVerdict
+    total: int = 0                                 # number of passed criteria
+    reported_total: int | None = None              # the total the model wrote (may disagree)
+    max_total: int = len(CRITERIA)
+    source: str = "json"                           # "json" or "text"
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+# True once text holds a complete JSON object (braces balanced, outside of strings). Used as Qwen's stop condition.
+# Text that doesn't start with "{" (a free-text answer) is never complete.
+def json_complete(text: str) -> bool:
+    text = text.lstrip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[-1].lstrip()
+    if not text.startswith("{"):
+        return False
+    depth, in_string, escaped = 0, False, False
+    for ch in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == "{":
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+            if depth == 0:
+                return True
+    return False
+
+def _from_json(obj: dict) -> Verdict | None:
+    if not isinstance(obj, dict) or not any(key in obj for key in CRITERIA):
+        return None
+    criteria = {}
+    for key in CRITERIA:
+        item = obj.get(key)
+        if isinstance(item, dict) and isinstance(item.get("pass"), bool):
+            criteria[key] = CriterionVerdict(item["pass"], str(item.get("reason", "")))
+        else:
+            criteria[key] = CriterionVerdict(None)
+    reported = obj.get("total")
+    return Verdict(
+        criteria=criteria,
+        total=sum(c.passed is True for c in criteria.values()),
+        reported_total=reported if isinstance(reported, int) and not isinstance(reported, bool) else None,
+        source="json",
+    )
+
+# The last JSON object in text that carries the criteria (there may be prose or the prompt around it)
+def _find_json(text: str) -> Verdict | None:
+    decoder = json.JSONDecoder()
+    found, i = None, text.find("{")
+    while i != -1:
+        try:
+            obj, end = decoder.raw_decode(text, i)
+        except ValueError:
+            i = text.find("{", i + 1)
+            continue
+        found = _from_json(obj) or found
+        i = text.find("{", end)
+    return found
+
+_TOTAL = re.compile(r"Total Score:\s*\**\s*(\d+)\s*/\s*\d+", re.IGNORECASE)
+
+# "- **Font Style**", "2. Logo Color" ...: the label of a verdict line has to start with the criterion's name
+_LABELS = {
+    key: re.compile(r"^[^a-z]*" + r"\s+".join(name.lower().replace("colour", "colou?r").split()) + r"s?\b", re.IGNORECASE)
+    for key, name in CRITERIA.items()
+}
+
+def _from_text(text: str) -> Verdict | None:
+    criteria = {key: CriterionVerdict(None) for key in CRITERIA}
+    for line in text.splitlines():
+        if "✅" not in line and "❌" not in line:
+            continue
+        # Only the label (before the first ":", dash or mark) names the criterion, the explanation may mention others
+        label = re.split(r"[:–—✅❌]", line, maxsplit=1)[0]
+        for key, pattern in _LABELS.items():
+            if pattern.match(label):
+                # The last line about a criterion wins
+                reason = re.split(r"[–—-]\s", line.split(":", 1)[-1], maxsplit=1)
+                criteria[key] = CriterionVerdict("✅" in line, reason[-1].strip() if len(reason) > 1 else "")
+                break
+    total = _TOTAL.findall(text)
+    if all(c.passed is None for c in criteria.values()) and not total:
+        return None
+    return Verdict(
+        criteria=criteria,
+        total=sum(c.passed is True for c in criteria.values()),
+        reported_total=int(total[-1]) if total else None,
+        source="text",
+    )
+
+# Typed verdict of a model output (JSON or free text), None if it has neither
+def parse_verdict(model_output: str | None) -> Verdict | None:
+    if not model_output:
+        return None
+    stripped = model_output.strip()
+    if stripped.startswith("{"):
+        try:
+            verdict = _from_json(json.loads(stripped))  # fast path: the whole output is the JSON object
+        except ValueError:
+            verdict = None
+        if verdict is not None:
+            return verdict
+    if "{" in stripped:
+        verdict = _find_json(stripped)
+        if verdict is not None:
+            return verdict
+    return _from_text(stripped)
+
+# Aggregate over many verdicts (None = unparsed output): average total and pass rate per criterion
+def aggregate(verdicts) -> dict:
+    verdicts = list(verdicts)
+    parsed = [v for v in verdicts if v is not None]
+    pass_rate = {}
+    for key in CRITERIA:
+        judged = [v.criteria[key].passed for v in parsed if v.criteria[key].passed is not None]
+        pass_rate[key] = sum(judged) / len(judged) if judged else None
+    return {
+        "count": len(verdicts),
+        "parsed": len(parsed),
+        "avg_total": sum(v.total for v in parsed) / len(parsed) if parsed else None,
+        "pass_rate": pass_rate,
+    }
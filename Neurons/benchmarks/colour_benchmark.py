@@ -0,0 +1,103 @@
+import argparse
+import asyncio
+import glob
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# Colour criteria: pixel analysis (colour_compliance.py) vs. asking the model
+# - Runs analyze_brand_colours on every sample image (--repeat times, median) and one GPT-4o evaluation per image.
+# - With --live the real OpenAI API is called (needs OPENAI_API_KEY) and the model's "Colour Palette"/"Logo Colour"
+#   verdicts are compared with the pixel analysis. Without it the local stub server answers after --model-delay
+#   seconds, so only the pixel analysis timings are real.
+#
+# Run from the Neurons folder:
+#   python benchmarks/colour_benchmark.py
+#   python benchmarks/colour_benchmark.py --live
+
+ROOT = Path(__file__).resolve().parents[1]
+for path in (ROOT, ROOT / "tests"):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
+
+# "- Colour Palette: ✅ – ..." -> True, "❌" -> False, missing -> None
+def _verdict(model_output: str, criterion: str):
+    for line in model_output.splitlines():
+        if criterion.lower() in line.lower():
+            if "✅" in line:
+                return True
+            if "❌" in line:
+                return False
+    return None
+
+def _time_engine(image_bytes, brand_data, repeat):
+    from app.colour_compliance import analyze_brand_colours
+
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        analysis = analyze_brand_colours(image_bytes, brand_data)
+        timings.append((time.perf_counter() - started) * 1000)
+    return analysis, statistics.median(timings)
+
+async def _time_model(image_bytes, prompt):
+    from app import image_evaluation_gpt as gpt
+    from app.image_preprocessing import preprocess_image
+
+    image = preprocess_image(image_bytes, "gpt")
+    started = time.perf_counter()
+    output = await gpt.GPT_4o_response_async(image.data, prompt, image.mime_type)
+    return output, (time.perf_counter() - started) * 1000
+
+def run(args, base_url=None) -> list:
+    if base_url is not None:
+        os.environ["OPENAI_API_KEY"] = "stub"
+        os.environ["OPENAI_BASE_URL"] = base_url
+    from app.compliance_prompt_gpt import build_compliance_prompt
+    from app.extract_pdf import extract_brand_compliance
+
+    brand_data = extract_brand_compliance(Path(args.pdf).read_bytes())
+    prompt = build_compliance_prompt(brand_data)
+
+    results = []
+    for path in sorted(glob.glob(args.images)):
+        image_bytes = Path(path).read_bytes()
+        analysis, engine_ms = _time_engine(image_bytes, brand_data, args.repeat)
+        output, model_ms = asyncio.run(_time_model(image_bytes, prompt))
+        results.append({
+            "image": Path(path).name,
+            "engine_ms": round(engine_ms, 2),
+            "model_ms": round(model_ms, 1),
+            "model": "gpt-4o" if base_url is None else f"stub ({args.model_delay}s)",
+            "speedup": round(model_ms / engine_ms, 1),
+            "palette_score": analysis["palette_score"],
+            "engine_palette_pass": analysis["palette_pass"],
+            "engine_logo_colour_pass": analysis["logo_colours"]["pass"],
+            "model_palette_pass": _verdict(output, "Colour Palette") if base_url is None else None,
+            "model_logo_colour_pass": _verdict(output, "Logo Colour") if base_url is None else None,
+        })
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Colour criteria: pixel analysis vs. model call")
+    parser.add_argument("--images", default=str(ROOT / "neurons_*.png"))
+    parser.add_argument("--pdf", default=str(ROOT / "Neurons_brand_kit.pdf"))
+    parser.add_argument("--repeat", type=int, default=20, help="pixel analysis runs per image (median is reported)")
+    parser.add_argument("--live", action="store_true", help="call the real OpenAI API (needs OPENAI_API_KEY)")
+    parser.add_argument("--model-delay", type=float, default=3.0, help="seconds the stub model takes per call")
+    args = parser.parse_args()
+
+    if args.live:
+        results = run(args)
+    else:
+        from stub_model_server import stub_model_server
+        with stub_model_server(delay=args.model_delay) as (base_url, _):
+            results = run(args, base_url)
+
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# Load test: concurrent-request throughput of /evaluate_brand_compliance_wAPI, before and after moving the
+# blocking work off the event loop.
+# - The OpenAI API is replaced by the local stub server from the tests (fixed latency per call, --model-delay).
+# - "blocking" mode reproduces the old request path: PyMuPDF and the (sync) OpenAI call run directly inside the
+#   async handler. "non-blocking" is the current path (process pool + async OpenAI client).
+# - Every request uploads a slightly different PDF (unless --reuse-pdf), so each one really parses the brand kit.
+#
+# Run from the Neurons folder:
+#   python benchmarks/load_test.py --requests 40 --concurrency 8 --model-delay 0.2
+
+ROOT = Path(__file__).resolve().parents[1]
+for path in (ROOT, ROOT / "tests"):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
+
+def _multipart(fields: dict, files: dict):
+    boundary = uuid.uuid4().hex
+    body = bytearray()
+    for name, value in fields.items():
+        body += f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+    for name, (filename, data, content_type) in files.items():
+        body += (
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+            f"Content-Type: {content_type}\r\n\r\n"
+        ).encode()
+        body += data + b"\r\n"
+    body += f"--{boundary}--\r\n".encode()
+    return bytes(body), f"multipart/form-data; boundary={boundary}"
+
+def _post(url: str, fields: dict, files: dict) -> float:
+    body, content_type = _multipart(fields, files)
+    request = urllib.request.Request(url, data=body, headers={"Content-Type": content_type}, method="POST")
+    started = time.perf_counter()
+    with urllib.request.urlopen(request, timeout=300) as response:
+        response.read()
+        if response.status != 200:
+            raise RuntimeError(f"HTTP {response.status}")
+    return time.perf_counter() - started
+
+# Starts the app with uvicorn in a background thread, returns (server, thread, base_url)
+def _start_server(app):
+    import socket
+    import uvicorn
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread, f"http://127.0.0.1:{port}"
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+def run_mode(mode: str, args, pdf_bytes: bytes, image_bytes: bytes) -> dict:
+    import app.brand_kit_cache as cache_mod
+    import app.image_evaluation_gpt as gpt
+    import app.main as main
+    from app.brand_kit_cache import BrandKitCache
+    from app.compliance_prompt_gpt import build_compliance_prompt
+    from app.model_backends import BackendRegistry, ModelBackend
+
+    original = (main.model_registry, cache_mod.run_pdf)
+    main.brand_kit_cache = BrandKitCache()
+    if mode == "blocking":
+        async def blocking_model(image, prompt, mime_type):
+            return gpt.GPT_4o_response(image, prompt, mime_type)
+
+        async def inline_pdf(fn, *fn_args):
+            return fn(*fn_args)
+
+        main.model_registry = BackendRegistry()
+        main.model_registry.register(ModelBackend("ChatGPT-4o", "gpt", build_compliance_prompt, lambda: blocking_model))
+        cache_mod.run_pdf = inline_pdf
+
+    server, thread, base_url = _start_server(main.app)
+    try:
+        def one(i):
+            pdf = pdf_bytes if args.reuse_pdf else pdf_bytes + f"\n%bench-{mode}-{i}\n".encode()
+            return _post(
+                f"{base_url}/evaluate_brand_compliance_wAPI",
+                {"model_name": "ChatGPT-4o"},
+                {"brand_kit": ("kit.pdf", pdf, "application/pdf"), "image_file": ("image.png", image_bytes, "image/png")},
+            )
+
+        # One warm-up request (starts the process pool, opens connections)
+        one(-1)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            latencies = list(pool.map(one, range(args.requests)))
+        elapsed = time.perf_counter() - started
+    finally:
+        server.should_exit = True
+        thread.join()
+        main.model_registry, cache_mod.run_pdf = original
+
+    return {
+        "mode": mode,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "elapsed_s": round(elapsed, 3),
+        "requests_per_s": round(args.requests / elapsed, 2),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "p95_ms": round(_percentile(latencies, 95) * 1000, 1),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent-request load test (blocking vs non-blocking request path)")
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--model-delay", type=float, default=0.2, help="seconds the stub model takes per call")
+    parser.add_argument("--pdf", default=str(ROOT / "Neurons_brand_kit.pdf"))
+    parser.add_argument("--image", default=str(ROOT / "neurons_1.png"))
+    parser.add_argument("--reuse-pdf", action="store_true", help="upload the same PDF every time (brand kit cache hits)")
+    parser.add_argument("--modes", default="blocking,non-blocking")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)  # no per-request log lines
+
+    from stub_model_server import stub_model_server
+
+    pdf_bytes = Path(args.pdf).read_bytes()
+    image_bytes = Path(args.image).read_bytes()
+
+    with stub_model_server(delay=args.model_delay) as (base_url, _):
+        os.environ["OPENAI_API_KEY"] = "stub"
+        os.environ["OPENAI_BASE_URL"] = base_url
+        os.environ.setdefault("BRAND_KIT_DB", os.path.join(tempfile.mkdtemp(), "brand_kits.sqlite3"))
+        results = [run_mode(mode, args, pdf_bytes, image_bytes) for mode in args.modes.split(",")]
+
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
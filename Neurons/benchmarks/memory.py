@@ -0,0 +1,73 @@
+import os
+import resource
+import sys
+import threading
+import time
+from pathlib import Path
+
+# Peak memory of a block of code, for the benchmarks
+# - PeakRSS samples the resident set size of this process (or of another one, pid=...) and, with children=True, of its
+#   child processes (e.g. the PDF process pool) in a background thread, and reports the peak above the starting value.
+# - Sampling needs /proc (Linux). Elsewhere only the lifetime peak of this process (ru_maxrss) is available.
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+def _rss_of(pid) -> int:
+    try:
+        return int(Path(f"/proc/{pid}/statm").read_text().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return 0
+
+# All descendants (children, grandchildren, ...) of a process
+def _children(pid) -> list[str]:
+    children = []
+    for task in Path(f"/proc/{pid}/task").glob("*"):
+        try:
+            children.extend((task / "children").read_text().split())
+        except OSError:
+            pass
+    return children + [grandchild for child in children for grandchild in _children(child)]
+
+def rss_bytes(children: bool = False, pid: int | None = None) -> int:
+    if not Path("/proc/self/statm").exists():
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    pid = pid or os.getpid()
+    total = _rss_of(pid)
+    if children:
+        total += sum(_rss_of(child) for child in _children(pid))
+    return total
+
+class PeakRSS:
+    def __init__(self, children: bool = False, interval: float = 0.005, pid: int | None = None):
+        self.pid = pid
+        self.children = children
+        self.interval = interval
+        self.baseline = 0
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, rss_bytes(self.children, self.pid))
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self.baseline = self.peak = rss_bytes(self.children, self.pid)
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, rss_bytes(self.children, self.pid))
+
+    @property
+    def peak_mb(self) -> float:
+        return round(self.peak / 2**20, 1)
+
+    @property
+    def growth_mb(self) -> float:
+        return round((self.peak - self.baseline) / 2**20, 1)
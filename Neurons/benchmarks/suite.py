@@ -0,0 +1,284 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+# Benchmark suite: extraction, prompt building and end-to-end API throughput
+# - Extraction: synthetic brand kits (synthetic_kits.py) of increasing page count and palette size, with an outline or
+#   without any table of contents. Times extract_brand_compliance, the extraction with a cached section index, a plain
+#   full scan, each per-section extractor on its own and the prompt builders, and measures memory (peak RSS growth and
+#   Python allocations) of one extraction.
+# - API: the FastAPI app (uvicorn in a thread) against the local stub model, driven by concurrent clients.
+#   Scenarios: new brand kit every request, same brand kit, brand kit by id, and answers from the result cache.
+#   Reports p50/p95/p99 latency and requests/s per scenario and concurrency level.
+# - Results are written as JSON (--out). --compare <older results.json> prints the change per case and exits with 1
+#   if anything got slower than --threshold (e.g. 0.2 = 20%).
+#
+# Run from the Neurons folder:
+#   python benchmarks/suite.py
+#   python benchmarks/suite.py --quick --compare benchmarks/results/<earlier run>.json
+
+ROOT = Path(__file__).resolve().parents[1]
+for path in (ROOT, ROOT / "tests", ROOT / "benchmarks"):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
+
+from load_test import _multipart, _percentile, _post, _start_server  # noqa: E402
+from memory import PeakRSS  # noqa: E402
+from synthetic_kits import make_brand_kit  # noqa: E402
+
+# Metrics compared by --compare: name -> True if higher is better
+COMPARED = {
+    "extraction": {"extract_ms": False, "indexed_extract_ms": False, "peak_rss_growth_mb": False},
+    "api": {"p95_ms": False, "p99_ms": False, "requests_per_s": True},
+}
+
+def _median_ms(fn, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return round(statistics.median(timings), 3)
+
+# ---------- Extraction ----------
+def extraction_benchmark(args) -> list:
+    from app import extract_pdf
+    from app.compliance_prompt_gpt import build_compliance_prompt
+    from app.compliance_prompt_Qwen import build_compliance_prompt_qwen
+
+    per_section = {
+        "font_styles": extract_pdf.extract_font_styles,
+        "logo_safezone": extract_pdf.extract_logo_safezone_styles,
+        "logo_colour": extract_pdf.extract_logo_colours,
+        "logo_colour_palette": extract_pdf.extract_palette_styles,
+    }
+    rows = []
+    for pages in args.pages:
+        for palette_size in args.palettes:
+            for toc in args.tocs:
+                pdf = make_brand_kit(pages, palette_size, toc)
+                requirements, index = extract_pdf.extract_brand_compliance_indexed(pdf)
+
+                tracemalloc.start()
+                with PeakRSS() as rss:
+                    extract_pdf.extract_brand_compliance(pdf)
+                python_peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+
+                row = {
+                    "pages": index["page_count"],
+                    "palette_size": palette_size,
+                    "toc": toc,
+                    "pdf_kb": round(len(pdf) / 1024, 1),
+                    "pages_read": index["pages_read"],
+                    "extract_ms": _median_ms(lambda: extract_pdf.extract_brand_compliance(pdf), args.repeat),
+                    "indexed_extract_ms": _median_ms(
+                        lambda: extract_pdf.extract_brand_compliance_indexed(pdf, index), args.repeat
+                    ),
+                    "full_scan_ms": _median_ms(
+                        lambda: extract_pdf.extract_sections_from_texts(extract_pdf.read_page_texts(pdf)), args.repeat
+                    ),
+                    "section_ms": {
+                        name: _median_ms(lambda fn=fn: fn(pdf), args.repeat) for name, fn in per_section.items()
+                    },
+                    "stage_ms": index["timings_ms"],
+                    "prompt_ms": {
+                        "gpt": _median_ms(lambda: build_compliance_prompt(requirements), args.repeat),
+                        "qwen": _median_ms(lambda: build_compliance_prompt_qwen(requirements), args.repeat),
+                    },
+                    "peak_rss_growth_mb": rss.growth_mb,
+                    "python_peak_mb": round(python_peak / 2**20, 2),
+                }
+                rows.append(row)
+                print(f"extraction pages={row['pages']} palette={palette_size} toc={toc}: "
+                      f"{row['extract_ms']} ms ({row['pages_read']} pages read)", file=sys.stderr)
+    return rows
+
+# ---------- API ----------
+def _post_json(url: str, fields: dict, files: dict) -> dict:
+    body, content_type = _multipart(fields, files)
+    request = urllib.request.Request(url, data=body, headers={"Content-Type": content_type}, method="POST")
+    with urllib.request.urlopen(request, timeout=300) as response:
+        return json.loads(response.read())
+
+def _scenarios(base_url: str, pdf: bytes, image: bytes, kit_id: str) -> dict:
+    image_file = ("image.png", image, "image/png")
+
+    def cold_kit(i):
+        kit = pdf + f"\n%bench-{i}-{time.perf_counter_ns()}\n".encode()
+        return _post(f"{base_url}/evaluate_brand_compliance_wAPI",
+                     {"model_name": "ChatGPT-4o", "use_cache": "false"},
+                     {"brand_kit": ("kit.pdf", kit, "application/pdf"), "image_file": image_file})
+
+    def warm_kit(i):
+        return _post(f"{base_url}/evaluate_brand_compliance_wAPI",
+                     {"model_name": "ChatGPT-4o", "use_cache": "false"},
+                     {"brand_kit": ("kit.pdf", pdf, "application/pdf"), "image_file": image_file})
+
+    def by_id(i):
+        return _post(f"{base_url}/evaluate_brand_compliance_by_id",
+                     {"model_name": "ChatGPT-4o", "brand_kit_id": kit_id, "use_cache": "false"},
+                     {"image_file": image_file})
+
+    def result_cached(i):
+        return _post(f"{base_url}/evaluate_brand_compliance_wAPI",
+                     {"model_name": "ChatGPT-4o"},
+                     {"brand_kit": ("kit.pdf", pdf, "application/pdf"), "image_file": image_file})
+
+    return {"cold_kit": cold_kit, "warm_kit": warm_kit, "by_id": by_id, "result_cached": result_cached}
+
+def api_benchmark(args) -> list:
+    from stub_model_server import stub_model_server
+
+    pdf = make_brand_kit(args.api_pages, 80, "outline")
+    image = (ROOT / "neurons_1.png").read_bytes()
+    rows = []
+    with stub_model_server(delay=args.model_delay) as (stub_url, _):
+        os.environ["OPENAI_API_KEY"] = "stub"
+        os.environ["OPENAI_BASE_URL"] = stub_url
+        os.environ.setdefault("BRAND_KIT_DB", os.path.join(tempfile.mkdtemp(), "brand_kits.sqlite3"))
+        import app.main as main
+
+        server, thread, base_url = _start_server(main.app)
+        try:
+            kit_id = _post_json(f"{base_url}/brand_kits", {}, {"file": ("kit.pdf", pdf, "application/pdf")})["brand_kit_id"]
+            for name, one in _scenarios(base_url, pdf, image, kit_id).items():
+                one(-1)  # warm-up (process pool, connections, caches)
+                for concurrency in args.concurrency:
+                    latencies, errors = [], 0
+
+                    def timed(i):
+                        try:
+                            return one(i)
+                        except Exception:
+                            return None
+
+                    with PeakRSS(children=True) as rss:
+                        started = time.perf_counter()
+                        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                            for latency in pool.map(timed, range(args.requests)):
+                                if latency is None:
+                                    errors += 1
+                                else:
+                                    latencies.append(latency)
+                        elapsed = time.perf_counter() - started
+
+                    row = {
+                        "scenario": name,
+                        "concurrency": concurrency,
+                        "requests": args.requests,
+                        "errors": errors,
+                        "requests_per_s": round(len(latencies) / elapsed, 2),
+                        "p50_ms": round(statistics.median(latencies) * 1000, 1) if latencies else None,
+                        "p95_ms": round(_percentile(latencies, 95) * 1000, 1) if latencies else None,
+                        "p99_ms": round(_percentile(latencies, 99) * 1000, 1) if latencies else None,
+                        "peak_rss_mb": rss.peak_mb,
+                    }
+                    rows.append(row)
+                    print(f"api {name} concurrency={concurrency}: {row['requests_per_s']} req/s, "
+                          f"p95 {row['p95_ms']} ms", file=sys.stderr)
+        finally:
+            server.should_exit = True
+            thread.join()
+    return rows
+
+# ---------- Results ----------
+def _meta(args) -> dict:
+    import fitz
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=ROOT).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": commit or None,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "pymupdf": fitz.VersionBind,
+        "args": {k: v for k, v in vars(args).items() if k not in ("out", "compare")},
+    }
+
+def _case_key(section: str, row: dict) -> tuple:
+    if section == "extraction":
+        return row["pages"], row["palette_size"], row["toc"]
+    return row["scenario"], row["concurrency"]
+
+# Returns a list of (section, case, metric, old, new, change) that got worse by more than threshold.
+# Timings that moved by less than min_delta_ms are noise, however large the ratio.
+def compare(old: dict, new: dict, threshold: float, min_delta_ms: float = 1.0) -> list:
+    regressions = []
+    for section, metrics in COMPARED.items():
+        previous = {_case_key(section, row): row for row in old.get(section, [])}
+        for row in new.get(section, []):
+            before = previous.get(_case_key(section, row))
+            if before is None:
+                continue
+            for metric, higher_is_better in metrics.items():
+                a, b = before.get(metric), row.get(metric)
+                if not a or b is None:
+                    continue
+                change = (b - a) / a
+                worse = -change if higher_is_better else change
+                print(f"{section} {_case_key(section, row)} {metric}: {a} -> {b} ({change:+.0%})", file=sys.stderr)
+                if metric.endswith("_ms") and abs(b - a) < min_delta_ms:
+                    continue
+                if worse > threshold:
+                    regressions.append((section, _case_key(section, row), metric, a, b, round(change, 3)))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Extraction / prompt / API benchmark suite")
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--palettes", type=int, nargs="+", default=[20, 200, 1000])
+    parser.add_argument("--tocs", nargs="+", default=["outline", "none"], choices=["outline", "contents_page", "none"])
+    parser.add_argument("--repeat", type=int, default=5, help="runs per timing (median is reported)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=64, help="requests per API scenario and concurrency level")
+    parser.add_argument("--api-pages", type=int, default=50, help="pages of the brand kit used in the API runs")
+    parser.add_argument("--model-delay", type=float, default=0.05, help="seconds the stub model takes per call")
+    parser.add_argument("--skip", nargs="*", default=[], choices=["extraction", "api"])
+    parser.add_argument("--quick", action="store_true", help="small grid, for a fast check")
+    parser.add_argument("--out", default=None, help="results file (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--compare", default=None, help="earlier results file to compare with")
+    parser.add_argument("--threshold", type=float, default=0.2, help="relative slowdown that counts as a regression")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="ignore timing changes smaller than this")
+    args = parser.parse_args()
+    if args.quick:
+        args.pages, args.palettes, args.tocs = [10, 50], [20, 200], ["outline"]
+        args.repeat, args.concurrency, args.requests = 3, [1, 8], 16
+    logging.disable(logging.INFO)  # no per-request/per-stage log lines
+
+    results = {"meta": _meta(args)}
+    if "extraction" not in args.skip:
+        results["extraction"] = extraction_benchmark(args)
+    if "api" not in args.skip:
+        results["api"] = api_benchmark(args)
+
+    out = Path(args.out) if args.out else ROOT / "benchmarks" / "results" / f"{time.strftime('%Y%m%d-%H%M%S')}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(results, indent=2), encoding="utf-8")
+    print(f"Results written to {out}", file=sys.stderr)
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        regressions = compare(baseline, results, args.threshold, args.min_delta_ms)
+        for section, case, metric, a, b, change in regressions:
+            print(f"REGRESSION {section} {case} {metric}: {a} -> {b} ({change:+.0%})", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
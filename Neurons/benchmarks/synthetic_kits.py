@@ -0,0 +1,78 @@
+import random
+
+import fitz  # PyMuPDF
+
+# Synthetic brand kits for the benchmarks, laid out like Neurons_brand_kit.pdf
+# - cover, (printed table of contents), filler pages, safe zone, logo colours, palette pages, typography, filler pages
+# - `pages` is the total page count (at least the section pages), `palette_size` the number of hex colours
+# - toc: "outline" (PDF bookmarks), "contents_page" (a printed "Table of contents" page) or "none"
+
+LOGO_COLOURS = ["#85A0FE", "#AA82FF", "#FE839C", "#FFD14C", "#380F57"]
+HEX_PER_PAGE = 40
+FILLER = (
+    "Our brand is more than a logo. It is the way we speak, the images we choose and the colours we use.\n"
+    "Use imagery that feels bright, optimistic and human. Avoid stock photos with staged poses.\n"
+    "Headlines are short and active. Body copy is friendly and direct.\n"
+)
+
+def _palette(palette_size: int, seed: int) -> list[str]:
+    rng = random.Random(seed)
+    colours = list(LOGO_COLOURS)
+    while len(colours) < palette_size:
+        colours.append("#{:06X}".format(rng.randrange(0x1000000)))
+    return colours[:palette_size]
+
+def _write(page, text: str):
+    page.insert_text((56, 64), text, fontsize=10)
+
+def make_brand_kit(pages: int = 10, palette_size: int = 80, toc: str = "outline", seed: int = 0) -> bytes:
+    palette = _palette(palette_size, seed)
+    palette_chunks = [palette[i:i + HEX_PER_PAGE] for i in range(0, len(palette), HEX_PER_PAGE)] or [[]]
+    # title -> text of each page of the section
+    sections = [
+        ("Logo safe zone", ["The Safe Zone\nThe minimum required clear space is defined by measurement X. X is 30px.\n"
+                            "The Safe Zone should not contain any other elements.\n\nYes"]),
+        ("Colours", ["Logo colours\nprimary\n" + "\n".join(LOGO_COLOURS)]),
+        ("Extended colours", ["\n".join(chunk) for chunk in palette_chunks]),
+        ("Typography", ["Typography\nPrimary\nLexend\nSecondary\nInter"]),
+    ]
+    fixed = 1 + (toc == "contents_page") + sum(len(texts) for _, texts in sections)
+    fillers = max(0, pages - fixed)
+    before, after = fillers // 2, fillers - fillers // 2
+
+    doc = fitz.open()
+    _write(doc.new_page(), "Brand Guidelines")
+    if toc == "contents_page":
+        doc.new_page()  # filled in once the section page numbers are known
+    for i in range(before):
+        _write(doc.new_page(), f"Brand story {i + 1}\n" + FILLER)
+
+    entries = []
+    for title, texts in sections:
+        entries.append([1, title, doc.page_count + 1])
+        for text in texts:
+            _write(doc.new_page(), text)
+    for i in range(after):
+        _write(doc.new_page(), f"Applications {i + 1}\n" + FILLER)
+
+    if toc == "outline":
+        doc.set_toc(entries)
+    elif toc == "contents_page":
+        _write(doc[1], "\n".join(f"{page:02d}{title}" for _, title, page in entries) + "\nTable of contents")
+
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+# What extract_brand_compliance should return for a kit made with the same arguments
+def expected_requirements(palette_size: int = 80, seed: int = 0) -> dict:
+    return {
+        "font_styles": {"Primary": "Lexend", "Secondary": "Inter"},
+        "logo_safezone": {
+            "Value": "X is 30px",
+            "Requirements": "The Safe Zone The minimum required clear space is defined by measurement X. . "
+                            "The Safe Zone should not contain any other elements.",
+        },
+        "logo_colour": {"Logo colours": list(LOGO_COLOURS)},
+        "logo_colour_palette": {"Colours": list(LOGO_COLOURS) + _palette(palette_size, seed)},
+    }
@@ -0,0 +1,132 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+# Peak memory of concurrent large brand kit uploads: whole uploads in memory vs. spooled to temp files
+# - The brand kit is a synthetic kit (synthetic_kits.py) padded with an incompressible image to --pdf-mb MB.
+#   Every request sends a slightly different copy, so each one is extracted.
+# - "in-memory" reproduces the old request path: the upload is read() into bytes, and the bytes are hashed and
+#   handed (pickled) to the PDF process pool. "spooled" is the current path (see app/uploads.py).
+# - The server runs in its own process per mode (the clients' copies of the request bodies don't count, and memory
+#   left behind by one mode doesn't count against the other). Peak RSS covers the server process and its PDF
+#   worker processes.
+#
+# Run from the Neurons folder:
+#   python benchmarks/upload_memory.py --pdf-mb 50 --requests 16 --concurrency 8
+
+ROOT = Path(__file__).resolve().parents[1]
+for path in (ROOT, ROOT / "tests", ROOT / "benchmarks"):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
+
+from load_test import _post, _start_server  # noqa: E402
+from memory import PeakRSS  # noqa: E402
+from synthetic_kits import make_brand_kit  # noqa: E402
+
+def large_brand_kit(pdf_mb: float) -> bytes:
+    import fitz
+
+    doc = fitz.open(stream=make_brand_kit(pages=20), filetype="pdf")
+    side = max(1, int((pdf_mb * 1024 * 1024 / 3) ** 0.5))
+    noise = random.Random(0).randbytes(side * side * 3)
+    page = doc[doc.page_count - 1]
+    page.insert_image(fitz.Rect(56, 200, 540, 700), pixmap=fitz.Pixmap(fitz.csRGB, side, side, noise, 0))
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+# The old request path: the whole upload as bytes
+@asynccontextmanager
+async def _in_memory(upload, *args, **kwargs):
+    data = await upload.read()
+    yield types.SimpleNamespace(path=data, sha256=hashlib.sha256(data).hexdigest(), size=len(data), filename=upload.filename)
+
+# Server process: prints its base URL, serves until stdin is closed
+def serve(mode: str, model_delay: float):
+    logging.disable(logging.INFO)  # no per-request log lines
+    from stub_model_server import stub_model_server
+
+    with stub_model_server(delay=model_delay) as (stub_url, _):
+        os.environ["OPENAI_API_KEY"] = "stub"
+        os.environ["OPENAI_BASE_URL"] = stub_url
+        os.environ.setdefault("BRAND_KIT_DB", os.path.join(tempfile.mkdtemp(), "brand_kits.sqlite3"))
+        import app.main as main
+
+        if mode == "in-memory":
+            main.uploads.spooled = _in_memory
+        server, thread, base_url = _start_server(main.app)
+        print(base_url, flush=True)
+        sys.stdin.read()
+        server.should_exit = True
+        thread.join()
+
+def run_mode(mode: str, args, pdf: bytes, image: bytes) -> dict:
+    command = [sys.executable, __file__, "--serve", mode, "--model-delay", str(args.model_delay)]
+    process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    try:
+        base_url = ""
+        while not base_url.startswith("http"):  # PyMuPDF may print warnings first
+            base_url = process.stdout.readline().strip()
+
+        def one(i):
+            kit = pdf + f"\n%bench-{mode}-{i}\n".encode()
+            return _post(
+                f"{base_url}/evaluate_brand_compliance_wAPI",
+                {"model_name": "ChatGPT-4o", "use_cache": "false"},
+                {"brand_kit": ("kit.pdf", kit, "application/pdf"), "image_file": ("image.png", image, "image/png")},
+            )
+
+        one(-1)  # warm-up (starts the process pool)
+        with PeakRSS(children=True, pid=process.pid) as rss:
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+                latencies = list(pool.map(one, range(args.requests)))
+            elapsed = time.perf_counter() - started
+    finally:
+        process.stdin.close()
+        process.wait(timeout=60)
+
+    return {
+        "mode": mode,
+        "pdf_mb": round(len(pdf) / 2**20, 1),
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "requests_per_s": round(args.requests / elapsed, 2),
+        "max_latency_ms": round(max(latencies) * 1000, 1),
+        "baseline_rss_mb": round(rss.baseline / 2**20, 1),
+        "peak_rss_mb": rss.peak_mb,
+        "peak_growth_mb": rss.growth_mb,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Peak RSS of concurrent large uploads (in-memory vs spooled)")
+    parser.add_argument("--pdf-mb", type=float, default=50)
+    parser.add_argument("--requests", type=int, default=16)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--model-delay", type=float, default=0.2, help="seconds the stub model takes per call")
+    parser.add_argument("--modes", default="in-memory,spooled")
+    parser.add_argument("--serve", default=None, help=argparse.SUPPRESS)  # the server process of one mode
+    args = parser.parse_args()
+
+    if args.serve is not None:
+        serve(args.serve, args.model_delay)
+        return
+
+    pdf = large_brand_kit(args.pdf_mb)
+    image = (ROOT / "neurons_1.png").read_bytes()
+    results = [run_mode(mode, args, pdf, image) for mode in args.modes.split(",")]
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Minimal local stand-in for the OpenAI chat completions API (POST /v1/chat/completions)
+# - Every request sleeps for `delay` seconds and answers with a fixed compliance verdict
+# - Requests with "stream": true get the verdict as Server-Sent Events, one line per chunk
+# - Requests with a json_schema response_format (structured verdicts) get STUB_JSON_OUTPUT instead
+# - stats["last_request"] is the body of the most recent request
+# - Used by the tests (and the load test benchmark) so no real API key/network is needed
+
+STUB_OUTPUT = "- Font Style: ✅ – ok\n- Logo Safe Zone: ✅ – ok\n- Logo Colour: ✅ – ok\n- Colour Palette: ✅ – ok\n**Total Score: 4/4**"
+STUB_JSON_OUTPUT = json.dumps({
+    "font_style": {"pass": True, "reason": "ok"},
+    "logo_safe_zone": {"pass": True, "reason": "ok"},
+    "logo_colour": {"pass": False, "reason": "off-brand logo colour"},
+    "colour_palette": {"pass": True, "reason": "ok"},
+    "total": 3,
+})
+
+def _content(request) -> str:
+    if (request.get("response_format") or {}).get("type") == "json_schema":
+        return STUB_JSON_OUTPUT
+    return STUB_OUTPUT
+
+def _make_handler(delay, stats):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            with stats["lock"]:
+                stats["requests"] += 1
+                stats["in_flight"] += 1
+                stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+            try:
+                time.sleep(delay)
+                request = json.loads(body or b"{}")
+                with stats["lock"]:
+                    stats["last_request"] = request
+                if request.get("stream"):
+                    self._stream(request)
+                    return
+                payload = json.dumps({
+                    "id": "chatcmpl-stub",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": json.loads(body or b"{}").get("model", "stub"),
+                    "choices": [{
+                        "index": 0,
+                        "finish_reason": "stop",
+                        "message": {"role": "assistant", "content": _content(request)},
+                    }],
+                    "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+                }).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+            finally:
+                with stats["lock"]:
+                    stats["in_flight"] -= 1
+
+        def _stream(self, request):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            pieces = [(line, None) for line in STUB_OUTPUT.splitlines(keepends=True)] + [("", "stop")]
+            for content, finish_reason in pieces:
+                chunk = {
+                    "id": "chatcmpl-stub",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": request.get("model", "stub"),
+                    "choices": [{"index": 0, "delta": {"content": content}, "finish_reason": finish_reason}],
+                }
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+            self.wfile.write(b"data: [DONE]\n\n")
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+# Starts the stub server on a free port, yields (base_url, stats)
+@contextmanager
+def stub_model_server(delay: float = 0.0):
+    stats = {"requests": 0, "in_flight": 0, "max_in_flight": 0, "last_request": None, "lock": threading.Lock()}
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _make_handler(delay, stats))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}/v1", stats
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,198 @@
+import asyncio
+
+import pytest
+
+from app.backend_router import CLOSED, HALF_OPEN, OPEN, BackendRouter, CircuitBreaker, CircuitOpenError
+from app.model_backends import BackendRegistry, BackendUnavailableError, ModelBackend
+from app.qwen_batching import QueueFullError
+
+# A backend whose calls take `delay` seconds and raise the next item of `errors` (None = answer)
+def _backend(name, delay=0.0, errors=(), calls=None):
+    errors = list(errors)
+    calls = [] if calls is None else calls
+
+    async def model(image_bytes, prompt, mime_type):
+        calls.append(name)
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            calls.append(f"{name} cancelled")
+            raise
+        error = errors.pop(0) if errors else None
+        if error is not None:
+            raise error
+        return f"{name} says hi"
+
+    return ModelBackend(name, "gpt", lambda data: "prompt", lambda: model)
+
+def _router(*backends, **kwargs):
+    registry = BackendRegistry()
+    for backend in backends:
+        registry.register(backend)
+    kwargs.setdefault("retry_base", 0.001)
+    return BackendRouter(registry.get, **kwargs)
+
+def _infer(router, backend):
+    return asyncio.run(router.infer(backend, b"img", "prompt"))
+
+def test_errors_are_retried_and_timeouts_are_unavailable():
+    calls = []
+    flaky = _backend("A", errors=[RuntimeError("boom")], calls=calls)
+    router = _router(flaky, retries=1)
+    assert _infer(router, flaky) == ("A says hi", "A")
+    assert calls == ["A", "A"]
+    assert router.stats()["A"]["retries"] == 1 and router.stats()["A"]["successes"] == 1
+
+    slow = _backend("S", delay=1.0)
+    router = _router(slow, timeout=0.05, retries=1)
+    with pytest.raises(BackendUnavailableError, match="timed out"):
+        _infer(router, slow)
+    assert router.stats()["S"]["timeouts"] == 2
+
+def test_full_queue_is_not_retried():
+    calls = []
+    busy = _backend("A", errors=[QueueFullError("full")], calls=calls)
+    router = _router(busy, retries=3)
+    with pytest.raises(QueueFullError):
+        _infer(router, busy)
+    assert calls == ["A"]
+    assert router.breaker("A").failures == 0
+
+def test_circuit_opens_and_recovers_after_a_trial_call():
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=10, clock=lambda: now[0])
+    breaker.record_failure()
+    assert breaker.allow() and breaker.state == CLOSED
+    breaker.record_failure()
+    assert breaker.state == OPEN and not breaker.allow()
+
+    now[0] = 10
+    assert breaker.allow() and breaker.state == HALF_OPEN
+    assert not breaker.allow()  # one trial call at a time
+    breaker.record_failure()
+    assert breaker.state == OPEN
+
+    now[0] = 20
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED and breaker.allow()
+
+def test_cancelled_trial_call_frees_the_half_open_circuit():
+    calls = []
+    slow = _backend("A", delay=1.0, calls=calls)
+    router = _router(slow, retries=0, failure_threshold=1, reset_seconds=0)
+    router.breaker("A").record_failure()
+
+    async def run():
+        trial = asyncio.ensure_future(router.infer(slow, b"img", "prompt"))
+        await asyncio.sleep(0.01)
+        assert router.breaker("A").state == HALF_OPEN
+        trial.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await trial
+
+    asyncio.run(run())
+    assert calls == ["A", "A cancelled"]
+    assert router.breaker("A").state == HALF_OPEN
+    # The next call is admitted as the trial (same backend name, answering straight away)
+    assert _infer(router, _backend("A", calls=calls)) == ("A says hi", "A")
+    assert router.breaker("A").state == CLOSED
+
+def test_full_queue_during_the_trial_call_frees_the_half_open_circuit():
+    busy = _backend("A", errors=[QueueFullError("full")])
+    router = _router(busy, failure_threshold=1, reset_seconds=0)
+    router.breaker("A").record_failure()
+    with pytest.raises(QueueFullError):
+        _infer(router, busy)
+    assert router.breaker("A").state == HALF_OPEN
+    assert _infer(router, busy) == ("A says hi", "A")
+    assert router.breaker("A").state == CLOSED
+
+def test_open_circuit_short_circuits_to_the_fallback():
+    calls = []
+    broken = _backend("A", errors=[RuntimeError("down")] * 10, calls=calls)
+    backup = _backend("B", calls=calls)
+    router = _router(broken, backup, retries=0, failure_threshold=2, fallbacks={"A": ["B"]})
+
+    for _ in range(3):
+        assert _infer(router, broken) == ("B says hi", "B")
+    assert calls.count("A") == 2  # the third request skipped A
+    stats = router.stats()
+    assert stats["A"]["circuit"] == OPEN and stats["A"]["short_circuited"] == 1
+    assert stats["B"]["fallback_answers"] == 3
+
+    # Without a fallback the open circuit is a 503 straight away
+    router.fallbacks = {}
+    with pytest.raises(CircuitOpenError):
+        _infer(router, broken)
+    assert calls.count("A") == 2
+
+def test_hedged_request_takes_the_faster_answer_and_cancels_the_other():
+    calls = []
+    slow = _backend("A", delay=1.0, calls=calls)
+    fast = _backend("B", delay=0.01, calls=calls)
+    router = _router(slow, fast, hedge=True, hedge_default_delay=0.05, fallbacks={"A": ["B"]})
+
+    async def run():
+        result = await router.infer(slow, b"img", "prompt")
+        await asyncio.sleep(0)  # let the cancellation land
+        return result
+
+    assert asyncio.run(run()) == ("B says hi", "B")
+    assert calls == ["A", "B", "A cancelled"]
+    assert router.stats()["A"]["hedged"] == 1 and router.stats()["B"]["hedge_wins"] == 1
+
+def test_hedge_delay_follows_the_p95_latency():
+    router = _router(hedge=True, hedge_default_delay=5.0, hedge_min_samples=3)
+    assert router.hedge_delay("A") == 5.0
+    for seconds in (0.1, 0.2, 0.3, 0.4):
+        router.stats_for("A").observe(seconds)
+    assert router.hedge_delay("A") == 0.3
+    assert router.stats()["A"]["latency_ms"]["p50"] == 200.0
+
+def test_settings_from_env(monkeypatch):
+    monkeypatch.setenv("BACKEND_TIMEOUTS", "Gwen-3b=180")
+    monkeypatch.setenv("MODEL_FALLBACKS", "ChatGPT-4o=Gwen-3b|Other")
+    monkeypatch.setenv("HEDGE", "true")
+    router = BackendRouter.from_env(lambda name: None)
+    assert router.timeouts == {"Gwen-3b": 180.0}
+    assert router.fallbacks == {"ChatGPT-4o": ["Gwen-3b", "Other"]}
+    assert router.hedge is True
+
+def test_stream_times_out_between_chunks_and_counts_for_the_circuit():
+    async def stalling(image_bytes, prompt, mime_type):
+        yield "first"
+        await asyncio.sleep(1)
+        yield "never"
+
+    backend = ModelBackend("A", "gpt", lambda data: "prompt", lambda: None, stream_fn=stalling)
+    router = _router(backend, timeout=0.05, failure_threshold=1)
+
+    async def run():
+        chunks = []
+        with pytest.raises(BackendUnavailableError, match="timed out"):
+            async for chunk in router.stream(backend, b"img", "prompt"):
+                chunks.append(chunk)
+        assert chunks == ["first"]
+        with pytest.raises(CircuitOpenError):
+            async for _ in router.stream(backend, b"img", "prompt"):
+                pass
+
+    asyncio.run(run())
+    assert router.breaker("A").state == OPEN
+    assert router.stats()["A"]["timeouts"] == 1 and router.stats()["A"]["short_circuited"] == 1
+
+def test_stream_success_closes_the_circuit():
+    async def chunks(image_bytes, prompt, mime_type):
+        yield "a"
+        yield "b"
+
+    backend = ModelBackend("A", "gpt", lambda data: "prompt", lambda: None, stream_fn=chunks)
+    router = _router(backend, failure_threshold=1, reset_seconds=0)
+    router.breaker("A").record_failure()
+
+    async def run():
+        return [chunk async for chunk in router.stream(backend, b"img", "prompt")]
+
+    assert asyncio.run(run()) == ["a", "b"]
+    assert router.breaker("A").state == CLOSED
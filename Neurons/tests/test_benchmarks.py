@@ -0,0 +1,35 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# benchmarks/ isn't a package; its scripts import each other by name
+BENCHMARKS = Path(__file__).resolve().parents[1] / "benchmarks"
+if str(BENCHMARKS) not in sys.path:
+    sys.path.insert(0, str(BENCHMARKS))
+
+from app.extract_pdf import extract_brand_compliance_indexed
+from suite import compare
+from synthetic_kits import expected_requirements, make_brand_kit
+
+# The synthetic kits are only a fair benchmark input if the real extractor reads them correctly
+@pytest.mark.parametrize("toc", ["outline", "contents_page", "none"])
+def test_synthetic_kit_round_trips_through_extraction(toc):
+    out, index = extract_brand_compliance_indexed(make_brand_kit(pages=30, palette_size=100, toc=toc))
+    assert out == expected_requirements(palette_size=100)
+    assert index["page_count"] == 30
+    if toc != "none":
+        assert index["pages_read"] < 30
+
+def test_compare_flags_only_real_regressions():
+    old = {
+        "extraction": [{"pages": 10, "palette_size": 20, "toc": "outline", "extract_ms": 10.0, "indexed_extract_ms": 0.2}],
+        "api": [{"scenario": "by_id", "concurrency": 8, "p95_ms": 100.0, "requests_per_s": 50.0}],
+    }
+    new = {
+        "extraction": [{"pages": 10, "palette_size": 20, "toc": "outline", "extract_ms": 10.5, "indexed_extract_ms": 0.9}],
+        "api": [{"scenario": "by_id", "concurrency": 8, "p95_ms": 90.0, "requests_per_s": 30.0}],
+    }
+    regressions = compare(old, new, threshold=0.2)
+    # 0.2 -> 0.9 ms is below the 1 ms noise floor; fewer requests/s is worse
+    assert [(section, metric) for section, _, metric, *_ in regressions] == [("api", "requests_per_s")]
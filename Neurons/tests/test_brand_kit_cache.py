@@ -0,0 +1,122 @@
+import asyncio
+import threading
+
+import pytest
+
+import app.brand_kit_cache as cache_mod
+from app.brand_kit_cache import BrandKitCache, LRUCache
+
+# ---------- helpers ----------
+# Counts how often the (expensive) extraction actually runs
+@pytest.fixture
+def extract_calls(monkeypatch):
+    calls = []
+    def fake_extract(pdf_bytes, index=None):
+        calls.append(pdf_bytes)
+        return {"font_styles": {"Primary": "Roboto"}, "size": len(pdf_bytes)}, {"sections": {}, "seen": index}
+    monkeypatch.setattr(cache_mod, "extract_brand_compliance_indexed", fake_extract)
+    return calls
+
+# ---------- tests ----------
+
+def test_lru_evicts_least_recently_used():
+    lru = LRUCache(max_entries=2, ttl_seconds=None)
+    lru.put("a", 1)
+    lru.put("b", 2)
+    lru.get("a")          # "b" is now the least recently used
+    lru.put("c", 3)
+    assert lru.get("b") is None
+    assert lru.get("a") == 1 and lru.get("c") == 3
+
+def test_lru_expires_after_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(cache_mod.time, "monotonic", lambda: now[0])
+    lru = LRUCache(max_entries=10, ttl_seconds=5)
+    lru.put("a", 1)
+    now[0] += 6
+    assert lru.get("a") is None
+
+def test_repeated_pdf_is_extracted_once(extract_calls):
+    cache = BrandKitCache()
+    first = cache.get_or_extract(b"pdf-1")
+    second = cache.get_or_extract(b"pdf-1")
+    cache.get_or_extract(b"pdf-2")
+
+    assert first == second
+    assert extract_calls == [b"pdf-1", b"pdf-2"]
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 2
+
+def test_prompt_is_cached_per_builder(extract_calls):
+    cache = BrandKitCache()
+    gpt = cache.get_or_build_prompt(b"pdf", lambda d: "gpt " + d["font_styles"]["Primary"], "gpt")
+    qwen = cache.get_or_build_prompt(b"pdf", lambda d: "qwen", "qwen")
+    again = cache.get_or_build_prompt(b"pdf", lambda d: "never called", "gpt")
+
+    assert (gpt, qwen, again) == ("gpt Roboto", "qwen", "gpt Roboto")
+    assert len(extract_calls) == 1
+
+def test_disk_tier_survives_restart(tmp_path, extract_calls):
+    BrandKitCache(disk_dir=tmp_path).get_or_extract(b"pdf")
+
+    # A fresh cache (e.g. after a restart) should be served from disk
+    restarted = BrandKitCache(disk_dir=tmp_path)
+    out = restarted.get_or_extract(b"pdf")
+    assert out["font_styles"] == {"Primary": "Roboto"}
+    assert len(extract_calls) == 1
+    assert restarted.stats()["disk_hits"] == 1
+
+def test_concurrent_async_misses_share_one_extraction(monkeypatch, extract_calls):
+    # PDF_WORKERS=0: extract in a thread (the fake extractor can't be sent to a worker process)
+    monkeypatch.setenv("PDF_WORKERS", "0")
+    cache = BrandKitCache()
+
+    async def run():
+        return await asyncio.gather(*(cache.aget_or_extract(b"pdf") for _ in range(5)))
+
+    results = asyncio.run(run())
+    assert all(r == results[0] for r in results)
+    assert extract_calls == [b"pdf"]
+
+def test_section_index_is_reused_after_version_bump(monkeypatch, extract_calls):
+    seen = []
+    def fake_extract(pdf_bytes, index=None):
+        seen.append(index)
+        return {"font_styles": {}}, {"sections": {"font_styles": {"pages": [3], "source": "toc"}}}
+    monkeypatch.setattr(cache_mod, "extract_brand_compliance_indexed", fake_extract)
+    cache = BrandKitCache()
+    cache.get_or_extract(b"pdf")
+
+    # New extractors -> new requirements key, but the section index of the PDF is still known
+    monkeypatch.setattr(cache_mod, "CACHE_VERSION", "test-bump")
+    cache.get_or_extract(b"pdf")
+
+    assert seen[0] is None
+    assert seen[1]["sections"]["font_styles"]["pages"] == [3]
+    assert cache.stats()["misses"] == 2
+
+def test_shared_extraction_survives_the_first_caller_going_away(monkeypatch, tmp_path):
+    monkeypatch.setenv("PDF_WORKERS", "0")
+    release = threading.Event()
+    def slow_extract(pdf, index=None):
+        release.wait(5)
+        with open(pdf, "rb") as f:
+            return {"size": len(f.read())}, {"sections": {}}
+    monkeypatch.setattr(cache_mod, "extract_brand_compliance_indexed", slow_extract)
+    cache = BrandKitCache()
+    upload = tmp_path / "upload-1.pdf"
+    upload.write_bytes(b"%PDF-1.7 kit")
+
+    async def run():
+        first = asyncio.ensure_future(cache.aget_or_extract(str(upload)))
+        await asyncio.sleep(0.05)
+        second = asyncio.ensure_future(cache.aget_or_extract(str(upload)))
+        await asyncio.sleep(0.05)
+        # The first client disconnects and its temp file is removed (see uploads.spooled)
+        first.cancel()
+        upload.unlink()
+        release.set()
+        return await second
+
+    assert asyncio.run(run()) == {"size": 12}
+    assert list(tmp_path.iterdir()) == []  # the extraction's own link is gone as well
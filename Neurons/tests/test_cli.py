@@ -0,0 +1,116 @@
+import csv
+import json
+from io import BytesIO
+
+import fitz
+import pytest
+from PIL import Image
+
+from app import cli
+from app.model_backends import BackendRegistry, ModelBackend
+
+def _png(colour, size=(32, 24)):
+    out = BytesIO()
+    Image.new("RGB", size, colour).save(out, format="PNG")
+    return out.getvalue()
+
+def _pdf(texts):
+    doc = fitz.open()
+    for text in texts:
+        doc.new_page(width=200, height=100).insert_text((20, 50), text)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+@pytest.fixture
+def tree(tmp_path, monkeypatch):
+    monkeypatch.setenv("PDF_WORKERS", "0")  # threads instead of worker processes
+    monkeypatch.delenv("RESULT_CACHE_DB", raising=False)
+    monkeypatch.delenv("BRAND_KIT_CACHE_DIR", raising=False)
+    kit = tmp_path / "kit.pdf"
+    kit.write_bytes(_pdf(["Primary\nLexend", "The Safe Zone\nX is 30px.", "#112233"]))
+    root = tmp_path / "creatives"
+    (root / "social").mkdir(parents=True)
+    (root / "a.png").write_bytes(_png((200, 30, 30)))
+    (root / "social" / "b.png").write_bytes(_png((30, 200, 30)))
+    (root / "social" / "copy-of-a.png").write_bytes(_png((200, 30, 30)))
+    (root / "deck.pdf").write_bytes(_pdf(["Slide 1", "Slide 2", "Slide 1"]))
+    (root / "broken.jpg").write_bytes(b"not an image")
+    (root / "notes.txt").write_text("ignored")
+
+    calls = []
+    async def model(image_bytes, prompt, mime_type):
+        calls.append(prompt)
+        return '{"font_style": {"pass": true, "reason": "ok"}, "logo_colour": {"pass": false, "reason": "red"}, "total": 1}'
+    registry = BackendRegistry()
+    registry.register(ModelBackend("ChatGPT-4o", "gpt", lambda data: f"Fonts: {data['font_styles']}", lambda: model))
+    monkeypatch.setattr(cli, "model_registry", registry)
+    return kit, root, tmp_path, calls
+
+def _audit(kit, root, out, *extra):
+    return cli.main(["audit", str(kit), str(root), "--out", str(out), "--concurrency", "2", *extra])
+
+def test_audit_streams_one_record_per_asset(tree, capsys):
+    kit, root, tmp_path, calls = tree
+    out = tmp_path / "audit.jsonl"
+
+    assert _audit(kit, root, out) == 1  # broken.jpg failed
+    records = {r["path"]: r for r in map(json.loads, out.read_text().splitlines())}
+    assert set(records) == {"a.png", "broken.jpg", "deck.pdf", "social/b.png", "social/copy-of-a.png"}
+    assert records["broken.jpg"]["status"] == "error"
+    assert records["a.png"]["verdict"]["criteria"]["logo_colour"]["passed"] is False
+    assert calls[0] == "Fonts: {'Primary': 'Lexend'}"
+
+    deck = records["deck.pdf"]
+    assert [p["page"] for p in deck["pages"]] == [1, 2, 3] and deck["pages"][2]["duplicate_of"] == 1
+    # a.png and its copy share a result, as do the deck's identical slides: 4 model calls for 6 pages
+    assert len(calls) == 4
+
+    summary = json.loads(capsys.readouterr().out)
+    assert (summary["assets"], summary["evaluated"], summary["failed"], summary["model_calls"]) == (5, 4, 1, 4)
+    assert summary["verdicts"]["pass_rate"]["logo_colour"] == 0.0
+
+def test_resume_skips_finished_assets_and_retries_failed_ones(tree):
+    kit, root, tmp_path, calls = tree
+    out = tmp_path / "audit.csv"
+    _audit(kit, root, out)
+    checkpoint = tmp_path / "audit.csv.checkpoint"
+    assert len(checkpoint.read_text().splitlines()) == 1 + 4  # meta line + the finished assets
+
+    # A new asset and a fixed one: only those are evaluated, the rows are appended
+    (root / "new.png").write_bytes(_png((1, 2, 3)))
+    (root / "broken.jpg").write_bytes(_png((9, 9, 9)))
+    calls.clear()
+    assert _audit(kit, root, out, "--resume") == 0
+    assert len(calls) == 2
+
+    rows = list(csv.DictReader(out.open()))
+    assert list(rows[0]) == cli.CSV_COLUMNS  # the header was written once
+    # The error row of the first run is gone: every path is in the output once
+    assert sorted(r["path"] for r in rows) == sorted(cli.find_assets(root))
+    resumed = sorted(rows[-2:], key=lambda r: r["path"])
+    assert [r["path"] for r in resumed] == ["broken.jpg", "new.png"]
+    assert resumed[1]["status"] == "ok" and resumed[1]["logo_colour"] == "False" and resumed[1]["total"] == "1"
+
+def test_resume_with_another_brand_kit_is_refused(tree):
+    kit, root, tmp_path, calls = tree
+    out = tmp_path / "audit.jsonl"
+    _audit(kit, root, out)
+    kit.write_bytes(_pdf(["Primary\nInter"]))
+    assert _audit(kit, root, out, "--resume") == 2
+
+def test_resume_after_a_crash_keeps_one_record_per_path(tree):
+    kit, root, tmp_path, calls = tree
+    out = tmp_path / "audit.jsonl"
+    _audit(kit, root, out)
+    # Crashed after a.png's record was written, but before it was checkpointed
+    checkpoint = tmp_path / "audit.jsonl.checkpoint"
+    lines = checkpoint.read_text().splitlines()
+    checkpoint.write_text("\n".join(l for l in lines if '"a.png"' not in l) + "\n")
+    with out.open("a") as f:
+        f.write('{"path": "social/b.png", "sta')  # cut off
+
+    _audit(kit, root, out, "--resume")
+    paths = [json.loads(line)["path"] for line in out.read_text().splitlines()]
+    assert sorted(paths) == sorted(cli.find_assets(root))
+    assert sorted(paths[-2:]) == ["a.png", "broken.jpg"]  # evaluated again
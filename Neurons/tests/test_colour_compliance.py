@@ -0,0 +1,77 @@
+from io import BytesIO
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from app.colour_compliance import analyze_colours, ciede2000, colour_facts_prompt, parse_hex, rgb_to_lab
+
+# ---------- helpers ----------
+# An image made of horizontal stripes: [(colour, height), ...]
+def _stripes(stripes, width=40, mode="RGB"):
+    image = Image.new(mode, (width, sum(h for _, h in stripes)))
+    y = 0
+    for colour, height in stripes:
+        image.paste(colour, (0, y, width, y + height))
+        y += height
+    out = BytesIO()
+    image.save(out, format="PNG")
+    return out.getvalue()
+
+# ---------- tests ----------
+
+def test_parse_hex():
+    assert parse_hex("#85A0FE") == (133, 160, 254)
+    assert parse_hex("fff") == (255, 255, 255)
+    assert parse_hex("#12345") is None
+    assert parse_hex("Primary") is None
+
+@pytest.mark.parametrize("lab1, lab2, expected", [
+    # Reference pairs from Sharma, Wu & Dalal (2005), the CIEDE2000 test data
+    ((50, 2.6772, -79.7751), (50, 0, -82.7485), 2.0425),
+    ((50, 0, 0), (50, -1, 2), 2.3669),
+    ((50, 2.5, 0), (73, 25, -18), 27.1492),
+    ((60.2574, -34.0099, 36.2677), (60.4626, -34.1751, 39.4387), 1.2644),
+    ((2.0776, 0.0795, -1.1350), (0.9033, -0.0636, -0.5514), 0.9082),
+])
+def test_ciede2000_reference_values(lab1, lab2, expected):
+    assert float(ciede2000(np.array(lab1), np.array(lab2))) == pytest.approx(expected, abs=1e-4)
+
+def test_rgb_to_lab_white():
+    assert rgb_to_lab([255, 255, 255]) == pytest.approx([100, 0, 0], abs=0.01)
+
+def test_on_palette_image_passes_with_coverage():
+    image = _stripes([((133, 160, 254), 30), ((170, 130, 255), 10)])
+    out = analyze_colours(image, ["#85A0FE", "#AA82FF", "#FFD14C"], ["#AA82FF"])
+
+    assert out["palette_score"] == 1.0 and out["palette_pass"] is True
+    assert out["coverage"] == {"#85A0FE": 0.75, "#AA82FF": 0.25}
+    assert out["dominant_colours"][0]["nearest"] == "#85A0FE"
+    assert out["logo_colours"]["pass"] is True
+
+def test_off_palette_colours_fail():
+    image = _stripes([((0, 200, 0), 30), ((133, 160, 254), 10)])
+    out = analyze_colours(image, ["#85A0FE"], ["#FFD14C"])
+
+    assert out["palette_score"] == pytest.approx(0.25)
+    assert out["palette_pass"] is False
+    assert out["off_palette_coverage"] == pytest.approx(0.75)
+    assert out["logo_colours"]["pass"] is False
+
+def test_neutral_background_is_not_scored():
+    # A white background next to an on-palette colour should not drag the score down
+    image = _stripes([((255, 255, 255), 30), ((133, 160, 254), 10)])
+    out = analyze_colours(image, ["#85A0FE"])
+    assert out["palette_score"] == 1.0
+    assert out["neutral_coverage"] == pytest.approx(0.75)
+
+def test_transparent_pixels_are_ignored():
+    image = _stripes([((0, 200, 0, 0), 30), ((133, 160, 254, 255), 10)], mode="RGBA")
+    out = analyze_colours(image, ["#85A0FE"])
+    assert out["palette_score"] == 1.0
+
+def test_facts_prompt_mentions_measurements():
+    out = analyze_colours(_stripes([((133, 160, 254), 10)]), ["#85A0FE"], ["#85A0FE"])
+    facts = colour_facts_prompt(out)
+    assert "100.0% of the non-neutral image area" in facts
+    assert "Approved logo colours present in the image: #85A0FE" in facts
@@ -0,0 +1,86 @@
+import asyncio
+from io import BytesIO
+
+import fitz
+import pytest
+from PIL import Image
+
+from app import creatives
+from app.verdicts import parse_verdict
+
+def _pdf(texts, size=(200, 100)):
+    doc = fitz.open()
+    for text in texts:
+        doc.new_page(width=size[0], height=size[1]).insert_text((20, 50), text)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+def _gif(colours):
+    frames = [Image.new("RGB", (16, 8), colour) for colour in colours]
+    out = BytesIO()
+    frames[0].save(out, format="GIF", save_all=True, append_images=frames[1:], duration=100)
+    return out.getvalue()
+
+def test_pdf_pages_are_rendered_at_the_requested_dpi(tmp_path):
+    data = _pdf(["Summer sale", "Winter sale", "Summer sale"])
+    pages = creatives.render_pdf_pages(data, dpi=144)
+    assert [p.number for p in pages] == [1, 2, 3]
+    assert pages[0].size == (400, 200)  # 200x100 pt at 2x
+    assert Image.open(BytesIO(pages[0].data)).format == "PNG"
+    # Identical pages render identically, so they are deduped
+    assert pages[0].sha256 == pages[2].sha256 != pages[1].sha256
+    assert creatives.duplicate_of(pages) == {1: 1, 2: 2, 3: 1}
+
+    path = tmp_path / "creative.pdf"
+    path.write_bytes(data)
+    assert [p.sha256 for p in creatives.render_pdf_pages(str(path), dpi=144)] == [p.sha256 for p in pages]
+
+def test_large_format_pages_are_capped_in_pixels():
+    data = _pdf(["Billboard"], size=(2000, 1000))
+    (page,) = creatives.render_pdf_pages(data, dpi=300, max_pixels=100_000)
+    width, height = page.size
+    assert width * height <= 100_000 and abs(width / height - 2) < 0.05
+
+def test_pdf_pages_are_rendered_in_chunks(tmp_path, monkeypatch):
+    monkeypatch.setenv("PDF_WORKERS", "0")
+    tasks = []
+    async def counting_run_pdf(fn, *args):
+        tasks.append(fn.__name__)
+        return fn(*args)
+    monkeypatch.setattr(creatives, "run_pdf", counting_run_pdf)
+
+    path = tmp_path / "deck.pdf"
+    path.write_bytes(_pdf(["one", "two", "three", "four", "five"]))
+    pages = asyncio.run(creatives.arender_pdf_pages(str(path), dpi=72, pages_per_task=2))
+    assert [p.number for p in pages] == [1, 2, 3, 4, 5]
+    assert [p.sha256 for p in pages] == [p.sha256 for p in creatives.render_pdf_pages(str(path), dpi=72)]
+    assert tasks == ["count_pdf_pages"] + ["render_pdf_pages"] * 3
+
+def test_page_limit():
+    with pytest.raises(ValueError, match="at most 2"):
+        creatives.render_pdf_pages(_pdf(["a", "b", "c"]), max_pages=2)
+
+def test_frames_of_multi_frame_images():
+    pages = creatives.split_frames(_gif([(255, 0, 0), (0, 0, 255), (255, 0, 0)]))
+    assert [p.number for p in pages] == [1, 2, 3]
+    assert Image.open(BytesIO(pages[1].data)).convert("RGB").getpixel((0, 0)) == (0, 0, 255)
+    assert creatives.duplicate_of(pages) == {1: 1, 2: 2, 3: 1}
+
+    single = BytesIO()
+    Image.new("RGB", (4, 4)).save(single, format="PNG")
+    assert creatives.split_frames(single.getvalue()) is None
+
+def test_document_verdict_fails_a_criterion_failing_on_any_page():
+    ok = '{"font_style": {"pass": true, "reason": "ok"}, "logo_colour": {"pass": true, "reason": "ok"}}'
+    bad = '{"font_style": {"pass": true, "reason": "ok"}, "logo_colour": {"pass": false, "reason": "wrong blue"}}'
+    document = creatives.document_verdict({1: parse_verdict(ok), 2: parse_verdict(bad), 3: None})
+
+    verdict = document["verdict"]
+    assert verdict["criteria"]["font_style"]["passed"] is True
+    assert verdict["criteria"]["logo_colour"] == {"passed": False, "reason": "Page 2: wrong blue"}
+    assert verdict["criteria"]["colour_palette"]["passed"] is None
+    assert verdict["total"] == 1
+    assert document["failed_pages"]["logo_colour"] == [2]
+    assert document["aggregate"]["count"] == 3 and document["aggregate"]["parsed"] == 2
+    assert document["aggregate"]["pass_rate"]["logo_colour"] == 0.5
@@ -8,6 +8,7 @@ from app.extract_pdf import (
     extract_logo_colours,
     extract_palette_styles,
     extract_brand_compliance,
+    extract_brand_compliance_indexed,
 )
 
 # ---------- helpers: fake PyMuPDF doc/page ----------
@@ -28,6 +29,25 @@ class _FakeDoc:
     def close(self):
         pass
 
+# A document with random page access and an outline (like a real fitz.Document), counting the pages read
+class _FakeIndexedDoc(_FakeDoc):
+    def __init__(self, pages_texts, toc=()):
+        super().__init__(pages_texts)
+        self._toc = [list(entry) for entry in toc]
+        self.loaded = []
+    def __len__(self):
+        return len(self._pages)
+    def load_page(self, i):
+        self.loaded.append(i)
+        return self._pages[i]
+    def get_toc(self, simple=True):
+        return self._toc
+
+def _patch_fitz_doc(monkeypatch, doc):
+    import app.extract_pdf as mod
+    monkeypatch.setattr(mod, "fitz", types.SimpleNamespace(open=lambda *args, **kwargs: doc))
+    return doc
+
 # Utility to patch fitz.open to return our fake doc
 # Monkey patch is essentially just setting a fake attribute
 # In this case we set the "fitz", i.e. "pymupdf", inside of the "extract_pdf.py" to use the fake pdf reader
@@ -154,3 +174,116 @@ def test_extract_brand_compliance_composes_all(monkeypatch):
     assert out["font_styles"].get("Primary") == "Roboto"
     assert "#112233" in out["logo_colour"]["Logo colours"]
     assert "#445566" in out["logo_colour_palette"]["Colours"]
+
+def test_extract_brand_compliance_opens_pdf_once(monkeypatch):
+    # The single-pass engine should open the document (and read each page) only once
+    import app.extract_pdf as mod
+    opened = []
+    def fake_open(*args, **kwargs):
+        opened.append(1)
+        return _FakeDoc(["Primary\nRoboto", "#112233"])
+    monkeypatch.setattr(mod, "fitz", types.SimpleNamespace(open=fake_open))
+
+    out = extract_brand_compliance(b"...")
+    assert len(opened) == 1
+    assert out["font_styles"] == {"Primary": "Roboto"}
+    assert out["logo_colour_palette"] == {"Colours": ["#112233"]}
+
+def test_registered_section_is_included(monkeypatch):
+    # New sections can be plugged in without touching extract_brand_compliance
+    import app.extract_pdf as mod
+    monkeypatch.setattr(mod, "SECTION_EXTRACTORS", dict(mod.SECTION_EXTRACTORS))
+    mod.register_section_extractor(
+        "taglines",
+        lambda text: [l for l in text.splitlines() if l.startswith("Tagline:")] or None,
+        lambda partials: {"Taglines": [t for p in partials for t in p]},
+    )
+    _patch_fitz_open(monkeypatch, ["Tagline: Think bold", "nothing", "Tagline: Move fast"])
+
+    out = extract_brand_compliance(b"...")
+    assert out["taglines"] == {"Taglines": ["Tagline: Think bold", "Tagline: Move fast"]}
+
+# A 10 page kit: cover, logo pages, a safe zone page, colours on 6-7, typography on 8
+def _kit_pages():
+    pages = ["Cover", "Intro", "Logo", "Logo misuse", "Imagery", "The Safe Zone\nX is 30px.", "Logo, primary\n#112233",
+             "#445566", "Primary\nLexend", "Thank you"]
+    toc = [[1, "Logo", 3], [1, "Logo safe zone", 6], [1, "Colours", 7], [1, "Typography", 9], [1, "Thank you", 10]]
+    return pages, toc
+
+def test_outline_limits_extraction_to_section_pages(monkeypatch):
+    pages, toc = _kit_pages()
+    doc = _patch_fitz_doc(monkeypatch, _FakeIndexedDoc(pages, toc))
+
+    out, index = extract_brand_compliance_indexed(b"...")
+    # Same result as reading every page
+    _patch_fitz_open(monkeypatch, pages)
+    assert out == extract_brand_compliance(b"...")
+    assert sorted(set(doc.loaded)) == [5, 6, 7, 8]
+    assert index["sections"]["logo_colour_palette"] == {"pages": [6, 7], "source": "toc"}
+
+def test_section_without_toc_pages_falls_back_to_full_scan(monkeypatch):
+    pages, toc = _kit_pages()
+    toc = [entry for entry in toc if entry[1] != "Typography"]
+    doc = _patch_fitz_doc(monkeypatch, _FakeIndexedDoc(pages, toc))
+
+    out, index = extract_brand_compliance_indexed(b"...")
+    assert out["font_styles"] == {"Primary": "Lexend"}
+    assert index["sections"]["font_styles"]["source"] == "full_scan"
+    assert len(set(doc.loaded)) == len(pages)
+
+def test_cached_index_only_reads_indexed_pages(monkeypatch):
+    pages, toc = _kit_pages()
+    _patch_fitz_doc(monkeypatch, _FakeIndexedDoc(pages, toc))
+    first, index = extract_brand_compliance_indexed(b"...")
+
+    doc = _patch_fitz_doc(monkeypatch, _FakeIndexedDoc(pages, toc))
+    again, _ = extract_brand_compliance_indexed(b"...", index)
+    assert again == first
+    assert sorted(set(doc.loaded)) == [5, 6, 7, 8]
+
+def test_printed_table_of_contents_is_used(monkeypatch):
+    pages = ["Cover", "03colors\n04Typography\nTable of contents", "#112233", "Primary\nLexend"]
+    doc = _patch_fitz_doc(monkeypatch, _FakeIndexedDoc(pages))
+
+    out, index = extract_brand_compliance_indexed(b"...")
+    assert index["toc_source"] == "contents_page"
+    assert index["sections"]["font_styles"] == {"pages": [3], "source": "toc"}
+    assert out["logo_colour_palette"] == {"Colours": ["#112233"]}
+
+# ---------- brand kit versions (real PDFs: pages are hashed by their content streams) ----------
+def _real_kit(palette, imagery="Imagery"):
+    import fitz
+
+    doc = fitz.open()
+    texts = ["Cover", "The Safe Zone\nX is 30px.\nKeep clear.", "Logo, primary\n#112233", palette,
+             "Primary\nLexend\nSecondary\nInter", imagery]
+    for text in texts:
+        doc.new_page().insert_text((56, 64), text)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+def test_new_version_only_reads_changed_pages():
+    _, v1_index = extract_brand_compliance_indexed(_real_kit("#445566\n#778899"), record_pages=True)
+    v2 = _real_kit("#445566\n#AABBCC")
+
+    out, index = extract_brand_compliance_indexed(v2, previous=v1_index)
+    # Same result as extracting from scratch, but only the palette page was read again
+    assert out == extract_brand_compliance_indexed(v2)[0]
+    assert out["logo_colour_palette"] == {"Colours": ["#112233", "#445566", "#AABBCC"]}
+    assert index["pages_read"] == 1
+    assert index["pages_reused"] == [0, 1, 2, 4, 5]
+
+    # An index of another INDEX_VERSION is not reused
+    _, fresh = extract_brand_compliance_indexed(v2, previous={**v1_index, "version": "old"})
+    assert fresh["pages_reused"] == []
+
+def test_plain_extraction_does_not_hash_pages(monkeypatch):
+    import app.extract_pdf as extract_mod
+
+    def no_hashing(*args):
+        raise AssertionError("page hashed")
+    monkeypatch.setattr(extract_mod, "page_hash", no_hashing)
+    out, index = extract_brand_compliance_indexed(_real_kit("#445566"))
+    assert out["logo_colour_palette"] == {"Colours": ["#112233", "#445566"]}
+    assert "page_results" not in index and "toc_page_hashes" not in index
@@ -0,0 +1,95 @@
+import os
+from io import BytesIO
+
+from PIL import Image, PngImagePlugin
+
+from app.image_preprocessing import DuplicateIndex, PreparedImage, _strip_png_metadata, hamming_distance, preprocess_image
+
+# ---------- helpers ----------
+def _encode(image, fmt="PNG", **kwargs):
+    out = BytesIO()
+    image.save(out, format=fmt, **kwargs)
+    return out.getvalue()
+
+# Random pixels: "photo-like" (many colours)
+def _noise(size):
+    return Image.frombytes("RGB", size, os.urandom(size[0] * size[1] * 3))
+
+# ---------- tests ----------
+
+def test_gpt_profile_caps_resolution_like_the_api():
+    out = preprocess_image(_encode(_noise((4000, 3000))), "gpt")
+    # Fit in 2048x2048, then shortest side 768
+    assert out.stats["processed_size"] == [1024, 768]
+    assert out.stats["processed_bytes"] < out.stats["original_bytes"]
+
+def test_qwen_profile_caps_pixel_count():
+    out = preprocess_image(_encode(_noise((3000, 3000))), "qwen")
+    width, height = out.stats["processed_size"]
+    assert width * height <= 1280 * 28 * 28
+
+def test_photo_like_images_become_jpeg_and_flat_graphics_png():
+    photo = preprocess_image(_encode(_noise((1600, 1200))), "gpt")
+    assert photo.mime_type == "image/jpeg"
+    assert Image.open(BytesIO(photo.data)).format == "JPEG"
+
+    flat = preprocess_image(_encode(Image.new("RGB", (1600, 1200), (10, 120, 200))), "gpt")
+    assert flat.mime_type == "image/png"
+
+def test_transparency_is_kept_as_png():
+    logo = Image.new("RGBA", (3000, 1000), (0, 0, 0, 0))
+    logo.paste((255, 0, 0, 255), (100, 100, 400, 400))
+    out = preprocess_image(_encode(logo), "gpt")
+    assert out.mime_type == "image/png"
+    assert Image.open(BytesIO(out.data)).mode == "RGBA"
+
+def test_metadata_is_stripped():
+    image = _noise((2500, 1000))
+    exif = Image.Exif()
+    exif[0x010E] = "secret description"  # ImageDescription
+    original = _encode(image, "JPEG", exif=exif.tobytes())
+    out = preprocess_image(original, "gpt")
+    assert not Image.open(BytesIO(out.data)).getexif()
+
+def test_metadata_is_stripped_when_the_upload_is_kept():
+    exif = Image.Exif()
+    exif[0x0110] = "Secret Camera 3000"  # Model
+    jpeg = _encode(_noise((700, 600)), "JPEG", quality=60, exif=exif.tobytes())
+    out = preprocess_image(jpeg, "gpt")
+    assert out.stats["processed_size"] == [700, 600] and out.mime_type == "image/jpeg"
+    assert b"Secret Camera" not in out.data
+    kept = Image.open(BytesIO(out.data))
+    assert not kept.getexif()
+    assert kept.tobytes() == Image.open(BytesIO(jpeg)).tobytes()  # same pixels, not re-encoded
+
+    info = PngImagePlugin.PngInfo()
+    info.add_text("Comment", "Secret Camera 3000")
+    png = _encode(_noise((300, 200)), "PNG", pnginfo=info)
+    stripped = _strip_png_metadata(png)
+    assert b"Secret Camera" not in stripped
+    assert Image.open(BytesIO(stripped)).tobytes() == Image.open(BytesIO(png)).tobytes()
+
+def test_perceptual_hash_matches_for_resized_copies():
+    image = Image.linear_gradient("L").rotate(90).convert("RGB")
+    big = preprocess_image(_encode(image.resize((800, 800))), "gpt")
+    small = preprocess_image(_encode(image.resize((200, 200))), "gpt")
+    assert big.sha256 != small.sha256
+    assert hamming_distance(big.phash, small.phash) <= 4
+
+def test_duplicate_index_finds_the_first_exact_or_near_match():
+    def image(sha, phash):
+        return PreparedImage(b"", "image/png", sha, phash, {})
+
+    near = DuplicateIndex(max_distance=6)
+    near.add(image("a", "ffff0000ffff0000"), 0)
+    near.add(image("b", "ffff0000ffff0003"), 1)
+    near.add(image("c", "0000ffff0000ffff"), 2)
+    assert near.find(image("a", "0123456789abcdef")) == 0           # same bytes
+    assert near.find(image("x", "ffff0000ffff0007")) == 0           # 3 bits from the first, 1 from the second
+    assert near.find(image("y", "0000ffff0000fff0")) == 2
+    assert near.find(image("z", "f0f0f0f0f0f0f0f0")) is None
+
+    exact = DuplicateIndex()
+    exact.add(image("a", "ffff0000ffff0000"), 0)
+    assert exact.find(image("x", "ffff0000ffff0000")) is None
+    assert exact.find(image("a", "0000000000000000")) == 0
@@ -0,0 +1,637 @@
+import asyncio
+import json
+import os
+import tempfile
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+# The API module opens the brand kit store at import time, so point it at a temp file first
+os.environ.setdefault("BRAND_KIT_DB", os.path.join(tempfile.mkdtemp(), "brand_kits.sqlite3"))
+# Parse PDFs in threads: the fake extractor below is monkeypatched in, so it can't be sent to a worker process
+os.environ["PDF_WORKERS"] = "0"
+
+from io import BytesIO
+
+from PIL import Image
+
+import app.brand_kit_cache as cache_mod
+import app.main as main
+from app import creatives
+from app.backend_router import BackendRouter
+from app.brand_kit_cache import BrandKitCache
+from app.brand_kit_store import BrandKitStore
+from app.compliance_prompt_gpt import build_compliance_prompt
+from app.model_backends import BackendRegistry, ModelBackend
+from app.result_cache import EvaluationResultCache
+
+BRAND_DATA = {
+    "font_styles": {"Primary": "Roboto", "Secondary": "Inter"},
+    "logo_safezone": {"Value": "X is the cap height", "Requirements": "Keep clear."},
+    "logo_colour": {"Logo colours": ["#112233"]},
+    "logo_colour_palette": {"Colours": ["#112233", "#445566"]},
+}
+
+# ---------- helpers ----------
+# Replaces the model backends with a single "ChatGPT-4o" backend running model_fn
+def _use_model(monkeypatch, model_fn, stream_fn=None):
+    registry = BackendRegistry()
+    registry.register(ModelBackend("ChatGPT-4o", "gpt", build_compliance_prompt, lambda: model_fn, stream_fn=stream_fn))
+    monkeypatch.setattr(main, "model_registry", registry)
+    return registry
+
+# Fresh cache/store per test, a fake extractor and a fake model (no PyMuPDF parsing or OpenAI calls)
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    extracted = []
+    def fake_extract(pdf_bytes, index=None, sections=None, previous=None, record_pages=False):
+        extracted.append(pdf_bytes)
+        return BRAND_DATA, {}
+    monkeypatch.setattr(cache_mod, "extract_brand_compliance_indexed", fake_extract)
+    monkeypatch.setattr(main, "brand_kit_cache", BrandKitCache())
+    monkeypatch.setattr(main, "brand_kit_store", BrandKitStore(tmp_path / "kits.sqlite3"))
+    monkeypatch.setattr(main, "result_cache", EvaluationResultCache())
+    monkeypatch.setattr(main, "backend_router", BackendRouter(lambda name: main.model_registry.get(name), retry_base=0.01))
+    async def fake_model(image_bytes, prompt, mime_type):
+        return f"Total Score: 4/4 ({mime_type})"
+    _use_model(monkeypatch, fake_model)
+
+    test_client = TestClient(main.app)
+    test_client.extracted = extracted
+    return test_client
+
+# A small solid-colour PNG
+def _png(colour=(200, 30, 30), size=(64, 48)):
+    out = BytesIO()
+    Image.new("RGB", size, colour).save(out, format="PNG")
+    return out.getvalue()
+
+def _evaluate(client, pdf=b"%PDF-kit", image=None, model_name="ChatGPT-4o"):
+    image = _png() if image is None else image
+    return client.post(
+        "/evaluate_brand_compliance_wAPI",
+        files={"brand_kit": ("kit.pdf", pdf, "application/pdf"), "image_file": ("a.png", image, "image/png")},
+        data={"model_name": model_name},
+    )
+
+# ---------- tests ----------
+
+def test_evaluate_uses_cached_brand_kit(client):
+    first = _evaluate(client)
+    second = _evaluate(client)
+
+    assert first.status_code == 200 and second.status_code == 200
+    assert "Roboto" in first.json()["prompt_used"]
+    assert first.json()["model_output"] == "Total Score: 4/4 (image/png)"
+    assert len(client.extracted) == 1
+    assert client.get("/brand_kit_cache/stats").json()["hits"] >= 1
+
+def test_evaluate_unknown_model_is_400(client):
+    assert _evaluate(client, model_name="Nope").status_code == 400
+
+def test_register_brand_kit_and_evaluate_by_id(client):
+    registered = client.post("/brand_kits", files={"file": ("kit.pdf", b"%PDF-kit", "application/pdf")})
+    assert registered.status_code == 200
+    brand_kit_id = registered.json()["brand_kit_id"]
+
+    # Same PDF -> same id
+    again = client.post("/brand_kits", files={"file": ("kit.pdf", b"%PDF-kit", "application/pdf")})
+    assert again.json()["brand_kit_id"] == brand_kit_id
+
+    kit = client.get(f"/brand_kits/{brand_kit_id}").json()
+    assert set(kit["prompts"]) == {"gpt", "qwen"}
+
+    out = client.post(
+        "/evaluate_brand_compliance_by_id",
+        files={"image_file": ("a.png", _png(), "image/png")},
+        data={"brand_kit_id": brand_kit_id, "model_name": "ChatGPT-4o"},
+    )
+    assert out.status_code == 200
+    assert out.json()["prompt_used"] == kit["prompts"]["gpt"]
+
+def test_stored_prompt_of_another_template_version_is_rebuilt(client, monkeypatch):
+    registered = client.post("/brand_kits", files={"file": ("kit.pdf", b"%PDF-kit", "application/pdf")}).json()
+    kit = client.get(f"/brand_kits/{registered['brand_kit_id']}").json()
+    assert kit["prompt_versions"] == {"gpt": "1", "qwen": "3"}
+
+    registry = BackendRegistry()
+    registry.register(ModelBackend("ChatGPT-4o", "gpt", lambda data, structured=False: "template v2",
+                                   lambda: main.model_registry.get("ChatGPT-4o").load(), prompt_version="2"))
+    monkeypatch.setattr(main, "model_registry", registry)
+    out = client.post(
+        "/evaluate_brand_compliance_by_id",
+        files={"image_file": ("a.png", _png(), "image/png")},
+        data={"brand_kit_id": registered["brand_kit_id"], "model_name": "ChatGPT-4o"},
+    )
+    assert out.status_code == 200
+    assert out.json()["prompt_used"] == "template v2"
+
+def test_evaluate_by_unknown_id_is_404(client):
+    out = client.post(
+        "/evaluate_brand_compliance_by_id",
+        files={"image_file": ("a.png", _png(), "image/png")},
+        data={"brand_kit_id": "missing", "model_name": "ChatGPT-4o"},
+    )
+    assert out.status_code == 404
+
+def _batch(client, images, **data):
+    files = [("brand_kit", ("kit.pdf", b"%PDF-kit", "application/pdf"))]
+    files += [("image_files", (f"img{i}.png", image, "image/png")) for i, image in enumerate(images)]
+    out = client.post("/evaluate_brand_compliance_batch", files=files, data={"model_name": "ChatGPT-4o", **data})
+    return out, [json.loads(line) for line in out.text.splitlines()]
+
+def test_batch_streams_one_line_per_image_and_limits_concurrency(client, monkeypatch):
+    state = {"in_flight": 0, "max": 0}
+    async def slow_model(image_bytes, prompt, mime_type):
+        state["in_flight"] += 1
+        state["max"] = max(state["max"], state["in_flight"])
+        await asyncio.sleep(0.05)
+        state["in_flight"] -= 1
+        if Image.open(BytesIO(image_bytes)).getpixel((0, 0)) == (0, 0, 0):
+            raise RuntimeError("model failed")
+        return "ok"
+    _use_model(monkeypatch, slow_model)
+
+    images = [_png((i * 40 + 10, 0, 0)) for i in range(5)]
+    images[1] = _png((0, 0, 0))  # the model fails on this one
+    images[3] = b"not an image"
+    out, lines = _batch(client, images, max_concurrency="2")
+    assert out.status_code == 200
+    assert out.headers["content-type"].startswith("application/x-ndjson")
+
+    results, summary = lines[:-1], lines[-1]
+    assert sorted(r["index"] for r in results) == [0, 1, 2, 3, 4]
+    assert [r["error"] for r in results if r["status"] == "error"] in (["model failed", "Invalid image"], ["Invalid image", "model failed"])
+    assert summary["done"] is True and summary["count"] == 5 and summary["failed"] == 2
+    assert state["max"] <= 2
+
+def test_batch_against_stub_model_server(client, monkeypatch):
+    # Runs the real GPT_4o_response_async against a local stub of the OpenAI API
+    import app.image_evaluation_gpt as gpt
+    from openai import AsyncOpenAI
+    from stub_model_server import stub_model_server, STUB_OUTPUT
+
+    with stub_model_server(delay=0.05) as (base_url, stats):
+        monkeypatch.setattr(gpt, "async_client", AsyncOpenAI(api_key="test-key", base_url=base_url))
+        _use_model(monkeypatch, gpt.GPT_4o_response_async)
+
+        out, lines = _batch(client, [_png((i * 50, 0, 0)) for i in range(4)], max_concurrency="4")
+
+    assert out.status_code == 200
+    assert all(r["model_output"] == STUB_OUTPUT for r in lines[:-1])
+    assert stats["requests"] == 4
+    assert stats["max_in_flight"] > 1
+
+def test_batch_requires_a_brand_kit(client):
+    out = client.post(
+        "/evaluate_brand_compliance_batch",
+        files=[("image_files", ("a.png", _png(), "image/png"))],
+        data={"model_name": "ChatGPT-4o"},
+    )
+    assert out.status_code == 400
+
+def test_backends_load_lazily_and_report_readiness(client, monkeypatch):
+    loads = []
+    async def model(image_bytes, prompt, mime_type):
+        return "ok"
+    def loader():
+        loads.append(1)
+        return model
+    registry = BackendRegistry()
+    registry.register(ModelBackend("ChatGPT-4o", "gpt", build_compliance_prompt, loader))
+    monkeypatch.setattr(main, "model_registry", registry)
+
+    # Nothing is loaded until the first request
+    assert client.get("/ready").json()["backends"]["ChatGPT-4o"]["state"] == "not_loaded"
+    assert _evaluate(client).status_code == 200
+    assert _evaluate(client).status_code == 200
+    assert loads == [1]
+    assert client.get("/ready").json()["backends"]["ChatGPT-4o"]["state"] == "ready"
+
+def test_ready_is_503_until_warm_backends_are_loaded(client, monkeypatch):
+    monkeypatch.setenv("WARM_BACKENDS", "ChatGPT-4o")
+    registry = BackendRegistry()
+    registry.register(ModelBackend("ChatGPT-4o", "gpt", build_compliance_prompt, lambda: None))
+    monkeypatch.setattr(main, "model_registry", registry)
+
+    assert client.get("/ready").status_code == 503
+    registry.get("ChatGPT-4o").load()
+    assert client.get("/ready").status_code == 200
+
+def test_missing_api_key_is_503_not_import_error(client, monkeypatch):
+    # The real GPT backend: importing works without a key, using it gives a clear 503
+    import app.image_evaluation_gpt as gpt
+    from app.model_backends import registry as real_registry
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    monkeypatch.setattr(gpt, "async_client", None)
+    monkeypatch.setattr(main, "model_registry", real_registry)
+    monkeypatch.setattr(real_registry.get("ChatGPT-4o"), "_model_fn", None)
+
+    out = _evaluate(client)
+    assert out.status_code == 503
+    assert "OPENAI_API_KEY" in out.json()["detail"]
+    assert real_registry.status()["ChatGPT-4o"]["state"] == "failed"
+
+def test_openai_client_leaves_retries_to_the_router(monkeypatch):
+    import app.image_evaluation_gpt as gpt
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    monkeypatch.setattr(gpt, "async_client", None)
+    assert gpt.get_async_client().max_retries == 0
+
+def test_invalid_image_is_400(client):
+    assert _evaluate(client, image=b"not an image").status_code == 400
+
+def test_batch_dedupes_identical_and_near_identical_images(client, monkeypatch):
+    calls = []
+    async def model(image_bytes, prompt, mime_type):
+        calls.append(1)
+        return "ok"
+    _use_model(monkeypatch, model)
+
+    # Gradients (a solid colour has no structure for the perceptual hash)
+    def gradient(rotate):
+        image = Image.linear_gradient("L").rotate(rotate).resize((64, 48)).convert("RGB")
+        buffer = BytesIO()
+        image.save(buffer, format="PNG")
+        return buffer.getvalue()
+
+    red, red_copy, blue = gradient(90), gradient(90), gradient(270)
+    # Same picture with one pixel changed: different bytes, same perceptual hash
+    near = Image.open(BytesIO(red)).copy()
+    near.putpixel((0, 0), (255, 0, 0))
+    buffer = BytesIO()
+    near.save(buffer, format="PNG")
+
+    _, lines = _batch(client, [red, red_copy, blue, buffer.getvalue()])
+    results = {r["index"]: r for r in lines[:-1]}
+    assert results[1]["duplicate_of"] == 0
+    assert "duplicate_of" not in results[3]
+    assert lines[-1]["model_calls"] == 3
+
+    calls.clear()
+    _, lines = _batch(client, [red, red_copy, blue, buffer.getvalue()], dedupe="near", use_cache="false")
+    assert {r["index"]: r.get("duplicate_of") for r in lines[:-1]} == {0: None, 1: 0, 2: None, 3: 0}
+    assert len(calls) == 2
+
+# The first result goes out while a later image is still being preprocessed, and the upload bytes are dropped
+def test_batch_streams_results_before_every_image_is_prepared(client, monkeypatch):
+    release = threading.Event()
+    real_preprocess = main.preprocess_image
+    def preprocess(image_bytes, profile):
+        if image_bytes == b"slow":
+            release.wait(5)
+            raise ValueError("not an image")
+        return real_preprocess(image_bytes, profile)
+    monkeypatch.setattr(main, "preprocess_image", preprocess)
+
+    async def run():
+        images = [("a.png", _png()), ("slow.png", b"slow")]
+        backend = main.model_registry.get("ChatGPT-4o")
+        lines = main._batch_results(images, "prompt", backend, "digest", 2, "exact", False, "req")
+        try:
+            first = json.loads(await asyncio.wait_for(lines.__anext__(), 1))
+            assert first["index"] == 0 and first["status"] == "ok"
+            assert images[0] == ("a.png", None)
+        finally:
+            release.set()
+        rest = [json.loads(line) async for line in lines]
+        assert rest[0]["error"] == "Invalid image" and rest[-1]["failed"] == 1
+
+    asyncio.run(run())
+
+def test_repeated_evaluation_is_served_from_result_cache(client, monkeypatch):
+    calls = []
+    async def model(image_bytes, prompt, mime_type):
+        calls.append(1)
+        return f"output {len(calls)}"
+    _use_model(monkeypatch, model)
+
+    first = _evaluate(client).json()
+    second = _evaluate(client).json()
+    assert (first["cached"], second["cached"]) == (False, True)
+    assert second["model_output"] == first["model_output"] == "output 1"
+
+    # Another image, or bypassing the cache, calls the model again
+    assert _evaluate(client, image=_png((1, 2, 3))).json()["cached"] is False
+    bypassed = client.post(
+        "/evaluate_brand_compliance_wAPI",
+        files={"brand_kit": ("kit.pdf", b"%PDF-kit", "application/pdf"), "image_file": ("a.png", _png(), "image/png")},
+        data={"model_name": "ChatGPT-4o", "use_cache": "false"},
+    ).json()
+    assert bypassed["cached"] is False and bypassed["model_output"] == "output 3"
+    # ... and the fresh result replaced the cached one
+    assert _evaluate(client).json()["model_output"] == "output 3"
+    assert len(calls) == 3
+    assert client.get("/result_cache/stats").json()["bypassed"] == 1
+
+def test_result_cache_key_includes_prompt_version(client, monkeypatch):
+    async def model(image_bytes, prompt, mime_type):
+        return "ok"
+    registry = _use_model(monkeypatch, model)
+
+    assert _evaluate(client).json()["cached"] is False
+    registry.get("ChatGPT-4o").prompt_version = "2"
+    assert _evaluate(client).json()["cached"] is False
+    assert _evaluate(client).json()["cached"] is True
+
+# Parses a Server-Sent Events body into [(event, data)]
+def _events(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+def _stream(client, image=None):
+    out = client.post(
+        "/evaluate_brand_compliance_stream",
+        files={"brand_kit": ("kit.pdf", b"%PDF-kit", "application/pdf"),
+               "image_file": ("a.png", _png() if image is None else image, "image/png")},
+        data={"model_name": "ChatGPT-4o"},
+    )
+    return out, _events(out.text) if out.status_code == 200 else []
+
+def test_stream_sends_tokens_and_is_cached(client, monkeypatch):
+    async def fake_stream(image_bytes, prompt, mime_type):
+        for chunk in ["Font: ok\n", "Total Score: ", "4/4"]:
+            yield chunk
+    _use_model(monkeypatch, None, fake_stream)
+
+    out, events = _stream(client)
+    assert out.headers["content-type"].startswith("text/event-stream")
+    assert [name for name, _ in events] == ["start", "token", "token", "token", "done"]
+    done = events[-1][1]
+    assert done["model_output"] == "Font: ok\nTotal Score: 4/4"
+    assert done["cached"] is False and done["ttfb_ms"] is not None
+
+    # The full output was cached: the second request streams it as one chunk
+    _, events = _stream(client)
+    assert events[1] == ("token", {"text": "Font: ok\nTotal Score: 4/4"})
+    assert events[-1][1]["cached"] is True
+    assert client.get("/streaming/metrics").json()["streams"] >= 2
+
+def test_stream_reports_model_errors_as_event(client, monkeypatch):
+    async def failing_stream(image_bytes, prompt, mime_type):
+        yield "partial"
+        raise RuntimeError("boom")
+    _use_model(monkeypatch, None, failing_stream)
+
+    out, events = _stream(client)
+    assert out.status_code == 200
+    assert events[-1] == ("error", {"detail": "Internal server error"})
+
+def test_stream_rejects_invalid_image_before_streaming(client):
+    out, _ = _stream(client, image=b"not an image")
+    assert out.status_code == 400
+
+def test_stream_against_stub_model_server(client, monkeypatch):
+    # Runs the real GPT_4o_response_stream (OpenAI streaming API) against the local stub
+    import app.image_evaluation_gpt as gpt
+    from openai import AsyncOpenAI
+    from stub_model_server import stub_model_server, STUB_OUTPUT
+
+    with stub_model_server() as (base_url, stats):
+        monkeypatch.setattr(gpt, "async_client", AsyncOpenAI(api_key="test-key", base_url=base_url))
+        _use_model(monkeypatch, gpt.GPT_4o_response_async, gpt.GPT_4o_response_stream)
+        out, events = _stream(client)
+
+    tokens = [data["text"] for name, data in events if name == "token"]
+    assert len(tokens) == len(STUB_OUTPUT.splitlines())
+    assert events[-1][1]["model_output"] == STUB_OUTPUT
+
+def test_colour_compliance_endpoint(client):
+    out = client.post(
+        "/colour_compliance",
+        files={"brand_kit": ("kit.pdf", b"%PDF-kit", "application/pdf"),
+               "image_file": ("a.png", _png((0x11, 0x22, 0x33)), "image/png")},
+    )
+    assert out.status_code == 200
+    assert out.json()["palette_score"] == 1.0
+    assert out.json()["coverage"] == {"#112233": 1.0}
+
+def test_colour_facts_are_added_to_prompt(client, monkeypatch):
+    prompts = []
+    async def fake_model(image_bytes, prompt, mime_type):
+        prompts.append(prompt)
+        return "Total Score: 4/4"
+    _use_model(monkeypatch, fake_model)
+
+    plain = _evaluate(client).json()
+    with_facts = client.post(
+        "/evaluate_brand_compliance_wAPI",
+        files={"brand_kit": ("kit.pdf", b"%PDF-kit", "application/pdf"), "image_file": ("a.png", _png(), "image/png")},
+        data={"model_name": "ChatGPT-4o", "colour_facts": "true"},
+    ).json()
+
+    # Different prompt -> not served from the cached plain result
+    assert with_facts["cached"] is False and len(prompts) == 2
+    assert "Measured colours" in prompts[1] and "Measured colours" not in prompts[0]
+    assert with_facts["colour_analysis"]["palette_score"] is not None
+    assert plain["colour_analysis"] is None
+
+def test_metrics_endpoint_reports_stages_and_requests(client):
+    out = _evaluate(client)
+    assert out.status_code == 200
+
+    text = client.get("/metrics").text
+    for stage in ("upload", "prompt_build", "preprocess", "model_call"):
+        assert f'neurons_stage_duration_seconds_count{{stage="{stage}"}}' in text
+    assert 'neurons_request_duration_seconds_count{method="POST",endpoint="/evaluate_brand_compliance_wAPI",status="200"}' in text
+    assert 'neurons_requests_in_flight{endpoint="/evaluate_brand_compliance_wAPI"} 0' in text
+    assert 'neurons_cache_hit_ratio{cache="result"}' in text
+
+def test_request_id_header_is_used_for_the_request(client):
+    out = client.post(
+        "/evaluate_brand_compliance_wAPI",
+        files={"brand_kit": ("kit.pdf", b"%PDF-kit", "application/pdf"), "image_file": ("a.png", _png(), "image/png")},
+        data={"model_name": "ChatGPT-4o"},
+        headers={"X-Request-ID": "my-request"},
+    )
+    assert out.headers["X-Request-ID"] == "my-request"
+    assert out.json()["request_id"] == "my-request"
+
+def test_oversized_uploads_are_413_and_leave_no_temp_files(client, monkeypatch, tmp_path):
+    spool_dir = tmp_path / "uploads"
+    spool_dir.mkdir()
+    monkeypatch.setenv("UPLOAD_TMP_DIR", str(spool_dir))
+    monkeypatch.setattr(main.uploads, "MAX_PDF_UPLOAD_BYTES", 16)
+    response = _evaluate(client, pdf=b"%PDF-" + b"x" * 100)
+    assert response.status_code == 413
+    assert client.extracted == []
+
+    monkeypatch.setattr(main.uploads, "MAX_PDF_UPLOAD_BYTES", 1024)
+    monkeypatch.setattr(main.uploads, "MAX_IMAGE_UPLOAD_BYTES", 16)
+    assert _evaluate(client).status_code == 413
+
+    monkeypatch.setattr(main.uploads, "MAX_IMAGE_UPLOAD_BYTES", 1024 * 1024)
+    assert _evaluate(client).status_code == 200
+    assert list(spool_dir.iterdir()) == []  # the spooled PDFs are removed after each request
+
+def test_structured_verdicts_against_stub_model_server(client, monkeypatch):
+    import app.image_evaluation_gpt as gpt
+    from openai import AsyncOpenAI
+    from stub_model_server import stub_model_server, STUB_JSON_OUTPUT
+    from app.verdicts import VERDICT_MAX_TOKENS
+
+    with stub_model_server() as (base_url, stats):
+        monkeypatch.setattr(gpt, "async_client", AsyncOpenAI(api_key="test-key", base_url=base_url))
+        _use_model(monkeypatch, gpt.GPT_4o_response_async)
+
+        out = client.post(
+            "/evaluate_brand_compliance_wAPI",
+            files={"brand_kit": ("kit.pdf", b"%PDF-kit", "application/pdf"), "image_file": ("a.png", _png(), "image/png")},
+            data={"model_name": "ChatGPT-4o", "structured": "true"},
+        )
+        sent = stats["last_request"]
+        # The free-text evaluation of the same image is a different cache entry
+        text = _evaluate(client)
+
+    assert out.status_code == 200
+    body = out.json()
+    assert body["model_output"] == STUB_JSON_OUTPUT
+    assert "single JSON object" in body["prompt_used"]
+    assert body["verdict"]["source"] == "json"
+    assert body["verdict"]["total"] == 3
+    assert body["verdict"]["criteria"]["logo_colour"] == {"passed": False, "reason": "off-brand logo colour"}
+    assert sent["response_format"]["json_schema"]["strict"] is True
+    assert sent["max_tokens"] == VERDICT_MAX_TOKENS
+
+    assert text.json()["cached"] is False
+    assert text.json()["verdict"]["source"] == "text" and text.json()["verdict"]["total"] == 4
+
+def test_batch_summary_aggregates_verdicts(client, monkeypatch):
+    async def model(image_bytes, prompt, mime_type, structured=False):
+        assert structured
+        return json.dumps({
+            "font_style": {"pass": True, "reason": ""}, "logo_safe_zone": {"pass": True, "reason": ""},
+            "logo_colour": {"pass": True, "reason": ""}, "colour_palette": {"pass": False, "reason": ""}, "total": 0,
+        })
+    _use_model(monkeypatch, model)
+
+    out, lines = _batch(client, [_png((i * 60, 10, 10)) for i in range(3)], structured="true")
+    summary = lines[-1]
+    assert out.status_code == 200
+    assert all(line["verdict"]["source"] == "json" for line in lines[:-1])
+    assert summary["verdicts"]["parsed"] == 3
+    assert summary["verdicts"]["avg_total"] == 3  # counted from the criteria, not the model's "total"
+    assert summary["verdicts"]["pass_rate"]["font_style"] == 1.0
+    assert summary["verdicts"]["pass_rate"]["colour_palette"] == 0.0
+
+def test_fallback_answer_is_reported_and_not_cached_under_the_primary(client, monkeypatch):
+    async def broken(image_bytes, prompt, mime_type):
+        raise RuntimeError("upstream 500")
+    async def fallback(image_bytes, prompt, mime_type):
+        return "Total Score: 2/4"
+    registry = BackendRegistry()
+    registry.register(ModelBackend("ChatGPT-4o", "gpt", build_compliance_prompt, lambda: broken))
+    registry.register(ModelBackend("Gwen-3b", "gpt", build_compliance_prompt, lambda: fallback))
+    monkeypatch.setattr(main, "model_registry", registry)
+    monkeypatch.setattr(main, "backend_router", BackendRouter(
+        registry.get, retries=0, fallbacks={"ChatGPT-4o": ["Gwen-3b"]},
+    ))
+
+    first = _evaluate(client).json()
+    assert first["model_used"] == "Gwen-3b" and first["model_output"] == "Total Score: 2/4"
+    assert _evaluate(client).json()["cached"] is False  # the fallback answer wasn't cached as ChatGPT-4o's
+
+    stats = client.get("/backends/stats").json()
+    assert stats["ChatGPT-4o"]["failures"] == 2 and stats["ChatGPT-4o"]["circuit"] == "closed"
+    assert stats["Gwen-3b"]["fallback_answers"] == 2
+
+def test_pdf_creative_is_evaluated_per_page_and_deduped(client, monkeypatch):
+    import fitz
+
+    doc = fitz.open()
+    for text in ("Page A", "Page B", "Page A"):
+        doc.new_page(width=200, height=100).insert_text((20, 50), text)
+    creative = doc.tobytes()
+    doc.close()
+    page_b = Image.open(BytesIO(creatives.render_pdf_pages(creative, dpi=72)[1].data)).convert("RGB").tobytes()
+
+    # Pages are evaluated concurrently: the logo colour fails on page B, whenever it comes
+    calls = []
+    async def model(image_bytes, prompt, mime_type):
+        calls.append(image_bytes)
+        passed = Image.open(BytesIO(image_bytes)).convert("RGB").tobytes() != page_b
+        return '{"font_style": {"pass": true, "reason": "ok"}, "logo_colour": {"pass": %s, "reason": "x"}, "total": 1}' % (
+            "true" if passed else "false")
+    _use_model(monkeypatch, model)
+
+    out = client.post(
+        "/evaluate_brand_compliance_wAPI",
+        files={"brand_kit": ("kit.pdf", b"%PDF-kit", "application/pdf"),
+               "image_file": ("creative.pdf", creative, "application/pdf")},
+        data={"model_name": "ChatGPT-4o", "dpi": "72"},
+    ).json()
+
+    assert len(calls) == 2  # the third page is the first one again
+    assert [p["page"] for p in out["pages"]] == [1, 2, 3]
+    assert out["pages"][2]["duplicate_of"] == 1 and out["pages"][0]["size"] == [200, 100]
+    assert out["document"]["failed_pages"]["logo_colour"] == [2]
+    assert out["verdict"]["criteria"]["logo_colour"]["passed"] is False
+    assert out["model_output"].startswith("Page 1:\n")
+
+    # Pages share the result cache (a plain upload of the same page would hit it too)
+    again = client.post(
+        "/evaluate_brand_compliance_wAPI",
+        files={"brand_kit": ("kit.pdf", b"%PDF-kit", "application/pdf"),
+               "image_file": ("creative.pdf", creative, "application/pdf")},
+        data={"model_name": "ChatGPT-4o", "dpi": "72"},
+    ).json()
+    assert again["cached"] is True and len(calls) == 2
+
+def test_broken_pdf_creative_is_400(client):
+    out = _evaluate(client, image=b"%PDF-1.7 not really")
+    assert out.status_code == 400
+    assert out.json()["detail"].startswith("Invalid creative")
+
+def test_brand_kit_versions_reextract_changed_pages_and_keep_unaffected_results(client, monkeypatch):
+    import fitz
+    from app.extract_pdf import extract_brand_compliance_indexed
+
+    monkeypatch.setattr(cache_mod, "extract_brand_compliance_indexed", extract_brand_compliance_indexed)
+    calls = []
+    async def model(image_bytes, prompt, mime_type):
+        calls.append(1)
+        return "Total Score: 4/4"
+    _use_model(monkeypatch, model)
+
+    def kit(palette, imagery):
+        doc = fitz.open()
+        for text in ["Cover", "Primary\nLexend", "The Safe Zone\nX is 30px.", palette, imagery]:
+            doc.new_page().insert_text((56, 64), text)
+        data = doc.tobytes()
+        doc.close()
+        return data
+
+    def evaluate(brand_kit_id):
+        return client.post(
+            "/evaluate_brand_compliance_by_id",
+            files={"image_file": ("a.png", _png(), "image/png")},
+            data={"brand_kit_id": brand_kit_id, "model_name": "ChatGPT-4o"},
+        ).json()
+
+    v1 = client.post("/brand_kits", files={"file": ("v1.pdf", kit("#112233", "Photo"), "application/pdf")}).json()
+    assert evaluate(v1["brand_kit_id"])["cached"] is False
+
+    # New imagery only: nothing in the prompt changed, the cached evaluation still holds
+    v2 = client.post(f"/brand_kits/{v1['brand_kit_id']}/versions",
+                     files={"file": ("v2.pdf", kit("#112233", "New photo"), "application/pdf")}).json()
+    assert v2["version"] == 2 and v2["parent_id"] == v1["brand_kit_id"]
+    assert v2["changes"]["sections"] == []
+    assert evaluate(v2["brand_kit_id"])["cached"] is True
+
+    # A new palette: only that page is read again, and evaluations against the new palette are fresh
+    v3 = client.post(f"/brand_kits/{v2['brand_kit_id']}/versions",
+                     files={"file": ("v3.pdf", kit("#445566", "New photo"), "application/pdf")}).json()
+    assert v3["version"] == 3
+    assert v3["changes"]["sections"] == ["logo_colour_palette"]
+    assert v3["changes"]["pages_read"] == 1
+    assert evaluate(v3["brand_kit_id"])["cached"] is False
+    assert len(calls) == 2
+
+    listed = {k["brand_kit_id"]: k["version"] for k in client.get("/brand_kits").json()["brand_kits"]}
+    assert listed[v3["brand_kit_id"]] == 3
+    assert client.post("/brand_kits/missing/versions",
+                       files={"file": ("v.pdf", kit("#000000", ""), "application/pdf")}).status_code == 404
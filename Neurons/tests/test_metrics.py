@@ -0,0 +1,62 @@
+import json
+import logging
+
+from app import metrics
+from app.metrics import Counter, Gauge, Histogram, JsonFormatter, MetricsRegistry
+
+# ---------- tests ----------
+
+def test_histogram_renders_cumulative_buckets():
+    registry = MetricsRegistry()
+    hist = registry.register(Histogram("test_seconds", "Test.", ("stage",), buckets=(0.1, 1.0)))
+    hist.observe(0.05, stage="a")
+    hist.observe(0.5, stage="a")
+    hist.observe(5.0, stage="a")
+
+    text = registry.render()
+    assert '# TYPE test_seconds histogram' in text
+    assert 'test_seconds_bucket{stage="a",le="0.1"} 1' in text
+    assert 'test_seconds_bucket{stage="a",le="1.0"} 2' in text
+    assert 'test_seconds_bucket{stage="a",le="+Inf"} 3' in text
+    assert 'test_seconds_count{stage="a"} 3' in text
+    assert 'test_seconds_sum{stage="a"} 5.55' in text
+
+def test_counters_and_gauges():
+    registry = MetricsRegistry()
+    counter = registry.register(Counter("test_total", "Test.", ("outcome",)))
+    counter.inc(outcome="hit")
+    counter.inc(2, outcome="hit")
+    gauge = registry.register(Gauge("test_ratio", "Test.", ("cache",), fn=lambda: {("brand_kit",): 0.5}))
+
+    text = registry.render()
+    assert 'test_total{outcome="hit"} 3' in text
+    assert 'test_ratio{cache="brand_kit"} 0.5' in text
+    assert gauge.fn() == {("brand_kit",): 0.5}
+
+def test_label_values_are_escaped():
+    registry = MetricsRegistry()
+    registry.register(Counter("test_total", "Test.", ("name",))).inc(name='a "b"\nc')
+    assert 'test_total{name="a \\"b\\"\\nc"} 1' in registry.render()
+
+def test_span_logs_request_id(caplog):
+    token = metrics.request_id_var.set("req-123")
+    try:
+        with caplog.at_level(logging.INFO, logger="neurons.timing"):
+            with metrics.span("unit_test_stage", model="m"):
+                pass
+    finally:
+        metrics.request_id_var.reset(token)
+
+    record = next(r for r in caplog.records if getattr(r, "stage", None) == "unit_test_stage")
+    assert record.request_id == "req-123" and record.model == "m"
+    # The text log format only prints the message
+    assert record.getMessage().startswith("stage unit_test_stage ") and "request_id=req-123 model=m" in record.getMessage()
+    assert 'stage="unit_test_stage"' in metrics.registry.render()
+
+def test_json_formatter_includes_extra_fields():
+    record = logging.LogRecord("neurons.timing", logging.INFO, __file__, 1, "stage", None, None)
+    record.request_id, record.stage, record.duration_ms = "req-1", "model_call", 12.5
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["request_id"] == "req-1"
+    assert entry["stage"] == "model_call" and entry["duration_ms"] == 12.5
+    assert entry["message"] == "stage" and entry["level"] == "INFO"
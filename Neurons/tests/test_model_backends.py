@@ -0,0 +1,82 @@
+import asyncio
+import threading
+import types
+
+import pytest
+
+from app import image_evaluation_Qwen as qwen
+from app.model_backends import _stream_qwen
+
+def test_cancelled_qwen_stream_stops_the_generation(monkeypatch):
+    stopped = threading.Event()
+
+    # Like the real one: blocks on the streamer until the generation ends, which only happens once stop is set
+    def fake_stream(image_bytes, prompt, max_new_tokens=512, stop=None):
+        yield "first"
+        while not stop.wait(0.01):
+            pass
+        stopped.set()
+
+    monkeypatch.setattr(qwen, "Qwen_response_stream", fake_stream)
+
+    async def run():
+        chunks = _stream_qwen(b"img", "prompt")
+        assert await chunks.__anext__() == "first"
+        waiting = asyncio.ensure_future(chunks.__anext__())  # a worker thread is now inside next()
+        await asyncio.sleep(0.05)
+        waiting.cancel()  # the client went away
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+
+    asyncio.run(run())
+    assert stopped.wait(1)
+
+# Renders the chat template like Qwen2.5-VL's (image placeholder, then the text) and records what the processor gets
+class _FakeProcessor:
+    def __init__(self):
+        self.tokenizer = types.SimpleNamespace(padding_side="right")
+        self.calls = []
+
+    def apply_chat_template(self, messages, tokenize, add_generation_prompt):
+        parts = ["<|im_start|>user\n"]
+        for item in messages[0]["content"]:
+            parts.append("<|vision_start|><|image_pad|><|vision_end|>" if item["type"] == "image" else item["text"])
+        return "".join(parts) + "<|im_end|>\n" + ("<|im_start|>assistant\n" if add_generation_prompt else "")
+
+    def __call__(self, text, images, **kwargs):
+        self.calls.append({"text": text, "images": images, **kwargs})
+        return types.SimpleNamespace(to=lambda device: "inputs")
+
+def test_qwen_batch_inputs_bind_an_image_to_every_prompt(monkeypatch):
+    processor = _FakeProcessor()
+    monkeypatch.setattr(qwen, "processor", processor)
+    monkeypatch.setattr(qwen, "model", types.SimpleNamespace(device="cpu"))
+
+    assert qwen._inputs(["img0", "img1"], ["first prompt", "second prompt"]) == "inputs"
+    (call,) = processor.calls
+    assert call["images"] == ["img0", "img1"] and call["padding"] is True
+    assert processor.tokenizer.padding_side == "left"
+    for text, prompt in zip(call["text"], ["first prompt", "second prompt"]):
+        assert text.count("<|image_pad|>") == 1
+        assert text.index("<|image_pad|>") < text.index(prompt)
+        assert text.endswith("<|im_start|>assistant\n")
+
+# The real processor, if it is installed and downloaded: every row gets the patch tokens of its own image
+def test_qwen_processor_expands_the_image_tokens_per_batch_item(monkeypatch):
+    pytest.importorskip("transformers")
+    from transformers import AutoProcessor
+    from PIL import Image
+
+    try:
+        processor = AutoProcessor.from_pretrained(qwen.MODEL_ID, local_files_only=True)
+    except OSError:
+        pytest.skip("Qwen2.5-VL processor is not downloaded")
+    monkeypatch.setattr(qwen, "processor", processor)
+    monkeypatch.setattr(qwen, "model", types.SimpleNamespace(device="cpu"))
+
+    images = [Image.new("RGB", (224, 224), "red"), Image.new("RGB", (448, 224), "blue")]
+    inputs = qwen._inputs(images, ["short prompt", "a somewhat longer prompt for the second image"])
+    image_token = processor.tokenizer.convert_tokens_to_ids("<|image_pad|>")
+    merge = processor.image_processor.merge_size ** 2
+    for row, grid in zip(inputs["input_ids"], inputs["image_grid_thw"]):
+        assert int((row == image_token).sum()) == int(grid.prod()) // merge
@@ -0,0 +1,101 @@
+import threading
+import time
+
+import pytest
+
+from app.qwen_batching import BatchScheduler, QueueFullError
+
+# ---------- helpers ----------
+# A fake model: records the batches it was called with, and "generates" prompt + image for each request
+class _FakeModel:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.batches = []
+    def __call__(self, image_bytes_list, prompts, max_new_tokens, structured):
+        self.batches.append(list(prompts))
+        self.structured = list(structured)
+        time.sleep(self.delay)
+        return [f"{p}:{i.decode()}" for i, p in zip(image_bytes_list, prompts)]
+
+# ---------- tests ----------
+
+def test_concurrent_requests_are_batched():
+    model = _FakeModel()
+    scheduler = BatchScheduler(model, max_batch_size=4, max_wait_ms=200)
+    try:
+        futures = [scheduler.submit(f"img{i}".encode(), f"p{i}", structured=i == 2) for i in range(4)]
+        outputs = [f.result(timeout=5) for f in futures]
+    finally:
+        scheduler.close()
+
+    # Every request gets its own output back, from a single generate call
+    assert outputs == [f"p{i}:img{i}" for i in range(4)]
+    assert model.batches == [["p0", "p1", "p2", "p3"]]
+    assert model.structured == [False, False, True, False]  # only the structured request stops at its JSON
+    metrics = scheduler.metrics()
+    assert metrics["batch_size_counts"] == {4: 1}
+    assert metrics["completed"] == 4
+
+def test_batch_size_is_capped():
+    model = _FakeModel()
+    scheduler = BatchScheduler(model, max_batch_size=2, max_wait_ms=200)
+    try:
+        futures = [scheduler.submit(b"x", f"p{i}") for i in range(5)]
+        [f.result(timeout=5) for f in futures]
+    finally:
+        scheduler.close()
+    assert all(len(b) <= 2 for b in model.batches)
+    assert sum(len(b) for b in model.batches) == 5
+
+def test_failed_batch_fails_every_request():
+    def broken(image_bytes_list, prompts, max_new_tokens, structured):
+        raise RuntimeError("CUDA out of memory")
+    scheduler = BatchScheduler(broken, max_batch_size=2, max_wait_ms=50)
+    try:
+        futures = [scheduler.submit(b"x", "p"), scheduler.submit(b"y", "p")]
+        for f in futures:
+            with pytest.raises(RuntimeError, match="out of memory"):
+                f.result(timeout=5)
+    finally:
+        scheduler.close()
+    assert scheduler.metrics()["failed"] == 2
+
+def test_full_queue_rejects_requests():
+    release = threading.Event()
+    def blocked(image_bytes_list, prompts, max_new_tokens, structured):
+        release.wait(5)
+        return ["ok"] * len(prompts)
+    scheduler = BatchScheduler(blocked, max_batch_size=1, max_wait_ms=0, max_queue_depth=1)
+    try:
+        first = scheduler.submit(b"x", "p")
+        time.sleep(0.1)                      # the worker picks up the first request and blocks on it
+        scheduler.submit(b"x", "p")          # waits in the queue
+        with pytest.raises(QueueFullError):
+            scheduler.submit(b"x", "p")
+        release.set()
+        assert first.result(timeout=5) == "ok"
+    finally:
+        release.set()
+        scheduler.close()
+    assert scheduler.metrics()["rejected"] == 1
+
+def test_close_with_a_full_queue_does_not_block():
+    release = threading.Event()
+    def blocked(image_bytes_list, prompts, max_new_tokens, structured):
+        release.wait(5)
+        return ["ok"] * len(prompts)
+    scheduler = BatchScheduler(blocked, max_batch_size=1, max_wait_ms=0, max_queue_depth=1)
+    running = scheduler.submit(b"x", "p")
+    time.sleep(0.1)                      # the worker is busy with the first request
+    waiting = scheduler.submit(b"x", "p")  # the queue is full now
+
+    started = time.perf_counter()
+    scheduler.close(timeout=0.2)
+    assert time.perf_counter() - started < 1
+    with pytest.raises(RuntimeError, match="closed"):
+        waiting.result(timeout=1)
+
+    release.set()
+    assert running.result(timeout=5) == "ok"  # the running batch still finishes
+    scheduler._thread.join(timeout=1)
+    assert not scheduler._thread.is_alive()
@@ -0,0 +1,40 @@
+from app.result_cache import EvaluationResultCache, result_key
+
+# ---------- tests ----------
+
+def test_key_changes_with_every_component():
+    base = result_key("img", "kit", "ChatGPT-4o", "1")
+    assert base == result_key("img", "kit", "ChatGPT-4o", "1")
+    assert len({
+        base,
+        result_key("img2", "kit", "ChatGPT-4o", "1"),
+        result_key("img", "kit2", "ChatGPT-4o", "1"),
+        result_key("img", "kit", "Gwen-3b", "1"),
+        result_key("img", "kit", "ChatGPT-4o", "2"),
+    }) == 5
+
+def test_memory_tier_is_bounded():
+    cache = EvaluationResultCache(max_entries=2)
+    for i in range(3):
+        cache.put(f"k{i}", {"model_output": i})
+    assert cache.get("k0") is None
+    assert cache.get("k2") == {"model_output": 2}
+    assert cache.stats()["memory_entries"] == 2
+
+def test_sqlite_tier_survives_restart(tmp_path):
+    db = tmp_path / "results.sqlite3"
+    EvaluationResultCache(db_path=db).put("k", {"model_output": "Total Score: 3/4"}, "kit")
+
+    restarted = EvaluationResultCache(db_path=db)
+    assert restarted.get("k") == {"model_output": "Total Score: 3/4"}
+    assert restarted.stats()["db_hits"] == 1
+
+def test_sqlite_tier_respects_ttl(tmp_path, monkeypatch):
+    import app.result_cache as mod
+    db = tmp_path / "results.sqlite3"
+    now = [1000.0]
+    monkeypatch.setattr(mod.time, "time", lambda: now[0])
+    EvaluationResultCache(ttl_seconds=60, db_path=db).put("k", {"model_output": "x"})
+
+    now[0] += 61
+    assert EvaluationResultCache(ttl_seconds=60, db_path=db).get("k") is None
@@ -0,0 +1,86 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+
+import fitz
+import pytest
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.testclient import TestClient
+from starlette.datastructures import UploadFile
+
+from app import uploads
+from app.brand_kit_cache import pdf_hash
+from app.extract_pdf import extract_brand_compliance
+
+def _upload(data: bytes, filename="kit.pdf"):
+    spool = tempfile.SpooledTemporaryFile()
+    spool.write(data)
+    spool.seek(0)
+    return UploadFile(spool, filename=filename)
+
+def test_spooled_upload_is_hashed_and_removed_afterwards(monkeypatch):
+    monkeypatch.setattr(uploads, "UPLOAD_CHUNK_SIZE", 7)  # many small chunks
+    data = b"%PDF-" + bytes(range(256)) * 10
+
+    async def run():
+        async with uploads.spooled(_upload(data)) as pdf:
+            assert pdf.size == len(data)
+            assert pdf.sha256 == hashlib.sha256(data).hexdigest() == pdf_hash(pdf.path)
+            assert pdf.read_bytes() == data
+            assert pdf.filename == "kit.pdf"
+            return pdf.path
+
+    path = asyncio.run(run())
+    assert not os.path.exists(path)
+
+def test_uploads_over_the_limit_are_rejected(monkeypatch, tmp_path):
+    monkeypatch.setenv("UPLOAD_TMP_DIR", str(tmp_path))
+
+    async def run():
+        async with uploads.spooled(_upload(b"x" * 100), max_bytes=99):
+            pass
+
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(run())
+    assert e.value.status_code == 413
+    assert list(tmp_path.iterdir()) == []  # the partial temp file is gone too
+
+    with pytest.raises(HTTPException):
+        asyncio.run(uploads.read_limited(_upload(b"x" * 100), max_bytes=99))
+    data, digest = asyncio.run(uploads.read_limited(_upload(b"x" * 100), max_bytes=100))
+    assert data == b"x" * 100 and digest == hashlib.sha256(data).hexdigest()
+
+def test_pdf_from_path_extracts_like_bytes(tmp_path):
+    doc = fitz.open()
+    doc.new_page().insert_text((56, 64), "Typography\nPrimary\nLexend\nSecondary\nInter\n#112233")
+    data = doc.tobytes()
+    doc.close()
+    path = tmp_path / "kit.pdf"
+    path.write_bytes(data)
+
+    assert extract_brand_compliance(str(path)) == extract_brand_compliance(data)
+    assert extract_brand_compliance(path)["font_styles"] == {"Primary": "Lexend", "Secondary": "Inter"}
+
+# ---------- request size limit ----------
+def _limited_app(max_bytes):
+    app = FastAPI()
+    app.add_middleware(uploads.UploadSizeLimitMiddleware, max_bytes=max_bytes)
+
+    @app.post("/echo")
+    async def echo(request: Request):
+        return {"size": len(await request.body())}
+
+    return app
+
+def test_request_body_limit_by_content_length():
+    client = TestClient(_limited_app(10))
+    assert client.post("/echo", content=b"x" * 10).json() == {"size": 10}
+    response = client.post("/echo", content=b"x" * 11)
+    assert response.status_code == 413
+
+def test_request_body_limit_for_chunked_bodies():
+    client = TestClient(_limited_app(10))
+    # A generator body is sent without Content-Length, so the limit is enforced while reading
+    response = client.post("/echo", content=(b"x" * 4 for _ in range(3)))
+    assert response.status_code == 413
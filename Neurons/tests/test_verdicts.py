@@ -0,0 +1,78 @@
+import json
+
+from app.compliance_prompt_Qwen import build_compliance_prompt_qwen
+from app.compliance_prompt_gpt import build_compliance_prompt
+from app.verdicts import CRITERIA, VERDICT_SCHEMA, aggregate, json_complete, parse_verdict
+
+BRAND_DATA = {"font_styles": {"Primary": "Roboto"}}
+
+def _json_verdict(**passed):
+    return json.dumps({
+        **{key: {"pass": passed.get(key, True), "reason": f"{key} reason"} for key in CRITERIA},
+        "total": sum(passed.get(key, True) for key in CRITERIA),
+    })
+
+def test_schema_is_strict():
+    # OpenAI strict mode: every property required, no extra properties (also for the nested objects)
+    assert set(VERDICT_SCHEMA["required"]) == set(VERDICT_SCHEMA["properties"])
+    assert VERDICT_SCHEMA["additionalProperties"] is False
+    for key in CRITERIA:
+        criterion = VERDICT_SCHEMA["properties"][key]
+        assert set(criterion["required"]) == set(criterion["properties"]) and criterion["additionalProperties"] is False
+
+def test_parse_json_verdict():
+    verdict = parse_verdict(_json_verdict(logo_colour=False))
+    assert verdict.source == "json"
+    assert verdict.total == 3 and verdict.reported_total == 3
+    assert verdict.criteria["logo_colour"].passed is False
+    assert verdict.criteria["font_style"].reason == "font_style reason"
+
+def test_parse_json_in_code_fence_and_prose():
+    verdict = parse_verdict("Here is the verdict:\n```json\n" + _json_verdict(font_style=False) + "\n```")
+    assert verdict.source == "json"
+    assert verdict.criteria["font_style"].passed is False and verdict.total == 3
+
+def test_json_response_format_example_is_a_valid_verdict():
+    example = build_compliance_prompt_qwen(BRAND_DATA, structured=True).split("\n")[-1]
+    assert set(json.loads(example)) == set(VERDICT_SCHEMA["required"])
+    assert example in build_compliance_prompt(BRAND_DATA, structured=True)
+
+def test_parse_free_text_verdict():
+    output = (
+        "- Font Style: ✅ – Roboto is used\n- Logo Safe Zone: ❌ – text touches the logo\n"
+        "- Logo Colour: ✅ – ok\n- Colour Palette: ✅ – ok\n**Total Score: 3/4**"
+    )
+    verdict = parse_verdict(output)
+    assert verdict.source == "text"
+    assert verdict.total == 3 and verdict.reported_total == 3
+    assert verdict.criteria["logo_safe_zone"].passed is False
+    assert verdict.criteria["logo_safe_zone"].reason == "text touches the logo"
+    assert parse_verdict("I can't see an image.") is None
+
+def test_free_text_criterion_is_taken_from_the_label_only():
+    output = (
+        "- **Font Style**: ✅ – matches the colour palette guide\n"
+        "- Logo Safe Zone: ✅ – fine\n"
+        "- Colour Palette: ❌ – does not match the logo colour or palette\n"
+        "- Logo Color: ✅ – correct\n"
+    )
+    verdict = parse_verdict(output)
+    assert verdict.criteria["colour_palette"].passed is False
+    assert verdict.criteria["colour_palette"].reason == "does not match the logo colour or palette"
+    assert verdict.criteria["logo_colour"].passed is True
+    assert verdict.criteria["font_style"].passed is True and verdict.total == 3
+
+def test_json_complete_is_the_stop_condition():
+    output = _json_verdict()
+    assert not any(json_complete(output[:i]) for i in range(len(output)))
+    assert json_complete(output)
+    assert json_complete('```json\n{"a": "}"}')
+    assert not json_complete('{"a": "}"')  # brace inside a string
+    assert not json_complete("- Font Style: ✅ {x}")  # free text never stops early
+
+def test_aggregate():
+    verdicts = [parse_verdict(_json_verdict()), parse_verdict(_json_verdict(colour_palette=False)), None]
+    summary = aggregate(verdicts)
+    assert summary["count"] == 3 and summary["parsed"] == 2
+    assert summary["avg_total"] == 3.5
+    assert summary["pass_rate"]["colour_palette"] == 0.5